@@ -1,80 +1,69 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 from ..database import get_db
-from ..schemas.appointment import AppointmentCreate, AppointmentUpdate, AppointmentResponse
+from ..schemas.appointment import (
+    AppointmentCreate, AppointmentUpdate, AppointmentResponse,
+    FollowupPlanBulkCreate, FollowupPlanBulkResponse
+)
 from ..models.appointment import Appointment
-from ..dependencies import get_current_user, get_current_admin_user
+from ..dependencies import get_current_user, get_current_admin_user, get_patient_id
 from ..models.user import User
 from ..models.patient import Patient
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwt, JWTError
-from ..config import settings
+from ..services.reminder_service import reminder_engine
+from ..services.followup_service import create_followup_plans
+from ..utils.pagination import keyset_page
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[AppointmentResponse], summary="获取复诊计划列表（医护后台）")
 async def get_appointments_list(
+    response: Response,
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=100, description="每页数量"),
     status: Optional[str] = Query(None, description="状态筛选"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页响应头 X-Next-Cursor）"),
+    patient_id: Optional[int] = Query(None, description="患者 ID 筛选"),
+    appointment_type: Optional[str] = Query(None, description="复诊类型筛选"),
+    start_date: Optional[datetime] = Query(None, description="复诊时间起（含）"),
+    end_date: Optional[datetime] = Query(None, description="复诊时间止（不含）"),
+    order: str = Query("desc", pattern="^(desc|asc)$", description="按复诊日期排序：desc/asc"),
+    include_total: bool = Query(False, description="是否在响应头 X-Total-Count 返回筛选后的总数"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    获取复诊计划列表（供医护后台使用）
-    
+    获取复诊计划列表（供医护后台使用，按复诊日期排序，支持筛选和分页）
+
+    提供 cursor 时忽略 page；还有下一页时响应头 X-Next-Cursor 返回新的游标
+
     **权限**：需要医护或管理员权限
     """
     query = db.query(Appointment)
     
     if status:
         query = query.filter(Appointment.status == status)
+    if patient_id:
+        query = query.filter(Appointment.patient_id == patient_id)
+    if appointment_type:
+        query = query.filter(Appointment.appointment_type == appointment_type)
+    if start_date:
+        query = query.filter(Appointment.appointment_date >= start_date)
+    if end_date:
+        query = query.filter(Appointment.appointment_date < end_date)
     
-    # 分页
-    offset = (page - 1) * page_size
-    appointments = query.order_by(Appointment.appointment_date.desc()).offset(offset).limit(page_size).all()
-    
-    return appointments
-
-
-def get_patient_id_from_token(credentials: HTTPAuthorizationCredentials) -> Optional[int]:
-    """
-    从 JWT Token 中提取 patient_id
-    返回 None 表示 Token 无效或未提供
-    """
-    if not credentials:
-        return None
-    
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(
-            token,
-            settings.SECRET_KEY,
-            algorithms=[settings.ALGORITHM]
-        )
-        
-        # 从 Token 中提取 patient_id 或 openid
-        sub = payload.get("sub")  # 格式："patient:123"
-        if sub and sub.startswith("patient:"):
-            return int(sub.split(":")[1])
-        
-        # 或者直接有 patient_id 字段
-        patient_id = payload.get("patient_id")
-        if patient_id:
-            return int(patient_id)
-            
-    except (JWTError, ValueError, KeyError):
-        pass
-    
-    return None
+    return keyset_page(
+        query, Appointment.appointment_date, Appointment.id,
+        limit=page_size, cursor=cursor, offset=(page - 1) * page_size, response=response,
+        descending=order == "desc", include_total=include_total
+    )
 
 
 @router.get("/patient/my", response_model=List[AppointmentResponse], summary="获取我的复诊计划")
 async def get_my_appointments(
-    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
+    patient_id: Optional[int] = Depends(get_patient_id),
     db: Session = Depends(get_db)
 ):
     """
@@ -85,8 +74,6 @@ async def get_my_appointments(
     2. 只返回该 patient_id 对应的复诊计划
     3. 无法访问其他患者的数据
     """
-    patient_id = get_patient_id_from_token(credentials)
-    
     if not patient_id:
         # 未登录，返回空列表
         return []
@@ -102,7 +89,7 @@ async def get_my_appointments(
 @router.get("/{appointment_id}", response_model=AppointmentResponse, summary="获取复诊计划详情")
 async def get_appointment(
     appointment_id: int,
-    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
+    patient_id: Optional[int] = Depends(get_patient_id),
     db: Session = Depends(get_db)
 ):
     """
@@ -110,8 +97,6 @@ async def get_appointment(
     
     **安全机制**：验证 Token 中的 patient_id 与复诊计划的 patient_id 是否匹配
     """
-    patient_id = get_patient_id_from_token(credentials)
-    
     appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
     if not appointment:
         raise HTTPException(
@@ -160,6 +145,7 @@ async def update_appointment_status(
     appointment.status = new_status
     db.commit()
     db.refresh(appointment)
+    reminder_engine.track(appointment)
     return appointment
 
 
@@ -167,7 +153,7 @@ async def update_appointment_status(
 async def update_patient_appointment_status(
     appointment_id: int,
     status_update: dict,  # 接收 JSON body: {"status": "confirmed"}
-    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
+    patient_id: Optional[int] = Depends(get_patient_id),
     db: Session = Depends(get_db)
 ):
     """
@@ -175,8 +161,6 @@ async def update_patient_appointment_status(
 
     **安全机制**：验证 Token 中的 patient_id 与复诊计划的 patient_id 是否匹配
     """
-    patient_id = get_patient_id_from_token(credentials)
-
     # 从 JSON 中提取 status
     new_status = status_update.get("status")
     if not new_status:
@@ -209,6 +193,7 @@ async def update_patient_appointment_status(
     appointment.status = new_status
     db.commit()
     db.refresh(appointment)
+    reminder_engine.track(appointment)
     return appointment
 
 
@@ -232,9 +217,50 @@ async def create_appointment(
     db.add(appointment)
     db.commit()
     db.refresh(appointment)
+    reminder_engine.track(appointment)
     return appointment
 
 
+@router.post("/bulk-followup", response_model=FollowupPlanBulkResponse, status_code=status.HTTP_201_CREATED, summary="按治疗类型批量生成复诊计划")
+async def create_followup_plans_bulk(
+    plan_data: FollowupPlanBulkCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)  # 需要管理员权限
+):
+    """
+    按治疗类型模板为多名患者批量生成完整的复诊序列（需要管理员权限）
+
+    - 种植义齿修复：术后 7 天拆线、3 个月二期手术
+    - 固定义齿修复：戴牙后 1 周、1 个月、3 个月复查
+    - 活动义齿修复：初戴后 1 周、1 个月复查
+
+    任一患者不存在时整批不写入
+    """
+    items = [item.model_dump() for item in plan_data.items]
+    try:
+        rows = create_followup_plans(db, items)
+    except LookupError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"患者不存在：{', '.join(str(i) for i in e.args[0])}"
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    # 批量插入不经过 ORM，horizon 内到期的提醒直接加入内存堆
+    for row in rows:
+        reminder_engine.track(row)
+
+    return {
+        "created": len(rows),
+        "patients": len({item["patient_id"] for item in items}),
+        "appointments": rows
+    }
+
+
 @router.put("/{appointment_id}", response_model=AppointmentResponse, summary="更新复诊计划")
 async def update_appointment(
     appointment_id: int,
@@ -244,6 +270,8 @@ async def update_appointment(
 ):
     """
     更新复诊计划（需要管理员权限）
+
+    修改复诊时间时重置提醒状态，按新的复诊时间重新提醒
     """
     appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
     if not appointment:
@@ -253,11 +281,17 @@ async def update_appointment(
         )
     
     update_data = appointment_data.model_dump(exclude_unset=True)
+    new_date = update_data.get("appointment_date")
+    if new_date is not None and new_date != appointment.appointment_date:
+        # 改期后按新的复诊时间重新提醒
+        appointment.reminder_sent = 0
+        appointment.reminder_time = None
     for key, value in update_data.items():
         setattr(appointment, key, value)
     
     db.commit()
     db.refresh(appointment)
+    reminder_engine.track(appointment)
     return appointment
 
 
@@ -279,4 +313,5 @@ async def delete_appointment(
     
     db.delete(appointment)
     db.commit()
+    reminder_engine.forget(appointment_id)
     return None
@@ -4,6 +4,8 @@ from sqlalchemy.orm import Session
 from ..database import get_db
 from ..schemas.user import UserCreate, UserResponse, Token
 from ..services.auth_service import login_for_access_token, create_user
+from ..services.auth_cache import user_cache
+from ..utils.security import averify_password, ahash_password
 from ..dependencies import get_current_user, get_current_admin_user
 from ..models.user import User
 from ..models.patient import Patient
@@ -61,7 +63,7 @@ async def login(
     返回 JWT Token，用于后续接口认证。
     """
     try:
-        access_token = login_for_access_token(
+        access_token = await login_for_access_token(
             db=db,
             username=form_data.username,
             password=form_data.password
@@ -108,7 +110,6 @@ async def register(
     """
     try:
         # 验证管理员身份
-        from ..utils.security import verify_password
         admin = db.query(User).filter(User.username == request.admin_username).first()
         
         if not admin or admin.role != "admin":
@@ -117,7 +118,7 @@ async def register(
                 detail="管理员身份验证失败"
             )
         
-        if not verify_password(request.admin_password, admin.password_hash):
+        if not await averify_password(request.admin_password, admin.password_hash):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="管理员密码错误"
@@ -131,7 +132,7 @@ async def register(
                 detail="用户名已存在"
             )
         
-        user = create_user(
+        user = await create_user(
             db=db,
             username=request.username,
             password=request.password,
@@ -139,6 +140,7 @@ async def register(
             role=request.role if request.role else "doctor",
             phone=request.phone
         )
+        user_cache.invalidate(user.id)
         return user
     except ValueError as e:
         raise HTTPException(
@@ -158,13 +160,11 @@ async def reset_password(
     """
     重置用户密码（需要管理员确认）
     """
-    from ..utils.security import verify_password, hash_password
-    
     # 验证管理员
     admin = db.query(User).filter(User.username == admin_username).first()
     if not admin or admin.role != "admin":
         raise HTTPException(403, "管理员验证失败")
-    if not verify_password(admin_password, admin.password_hash):
+    if not await averify_password(admin_password, admin.password_hash):
         raise HTTPException(401, "管理员密码错误")
     
     # 查找用户
@@ -173,8 +173,9 @@ async def reset_password(
         raise HTTPException(404, "用户不存在")
     
     # 更新密码
-    user.password_hash = hash_password(new_password)
+    user.password_hash = await ahash_password(new_password)
     db.commit()
+    user_cache.invalidate(user.id)
     
     return {"message": "密码重置成功", "username": target_username}
 
@@ -1,50 +1,76 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from datetime import timedelta
-from ..database import get_db
+from datetime import datetime, timedelta
+import json
+from ..config import settings
+from ..database import get_db, SessionLocal
 from ..schemas.dialogue import DialogueCreate, DialogueResponse
 from ..models.dialogue import Dialogue
-from ..dependencies import get_current_user
+from ..dependencies import get_current_user, get_patient_id
 from ..models.user import User
 from ..services.ai_service import get_ai_service
-from ..utils.redis_cache import cache
-from ..config import settings
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwt, JWTError
+from ..services.dialogue_writer import dialogue_writer, reserve_dialogue_ids
+from ..services.session_store import session_store
+from ..services.stats_service import subtract_dialogues, reset_dialogues
+from ..utils.pagination import keyset_page
 
 router = APIRouter()
 
 
-def get_patient_id_from_token(credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False))) -> Optional[int]:
-    """从 JWT Token 中提取 patient_id"""
-    if not credentials:
-        return None
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        sub = payload.get("sub")  # 格式："patient:123"
-        if sub and sub.startswith("patient:"):
-            return int(sub.split(":")[1])
-        patient_id = payload.get("patient_id")
-        if patient_id:
-            return int(patient_id)
-    except (JWTError, ValueError, KeyError):
-        pass
-    return None
+async def save_dialogue(
+    db: Session,
+    patient_id: int,
+    session_id: str,
+    user_message: str,
+    ai_response: str,
+    message_type: str
+):
+    """
+    保存一轮对话
+
+    先写入会话上下文存储（下一轮对话立即可见），再持久化：
+    开启 DIALOGUE_WRITE_BEHIND 时交给后台写入器批量写库，立即返回带预分配 ID 的记录；
+    否则同步写库。开启写后模式时同步写入（写入器未运行时的兜底）也从 id_sequences 预留 ID，
+    避免与其他 worker 已预留的 ID 段冲突；未开启时沿用表的自增 ID，不增加数据库往返
+    """
+    session_store.append(session_id, user_message, ai_response)
+
+    if dialogue_writer.running:
+        row = await dialogue_writer.submit(
+            patient_id=patient_id,
+            session_id=session_id,
+            user_message=user_message,
+            ai_response=ai_response,
+            message_type=message_type
+        )
+        return DialogueResponse.model_validate(row)
+
+    dialogue = Dialogue(
+        id=reserve_dialogue_ids(db, 1) if settings.DIALOGUE_WRITE_BEHIND else None,
+        patient_id=patient_id,
+        session_id=session_id,
+        user_message=user_message,
+        ai_response=ai_response,
+        message_type=message_type
+    )
+    db.add(dialogue)
+    db.commit()
+    db.refresh(dialogue)
+    return dialogue
 
 
 @router.post("/chat", response_model=DialogueResponse, summary="患者对话接口")
 async def patient_chat(
     dialogue_data: DialogueCreate,
-    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
+    patient_id: Optional[int] = Depends(get_patient_id),
     db: Session = Depends(get_db)
 ):
     """
     患者专用对话接口（从 Token 中自动获取 patient_id）
     """
-    patient_id = get_patient_id_from_token(credentials)
-    
     if not patient_id:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -53,7 +79,7 @@ async def patient_chat(
     
     # 生成 AI 回复
     ai_service = get_ai_service()
-    ai_response = ai_service.generate_response(
+    ai_response = await ai_service.agenerate_response(
         user_message=dialogue_data.user_message,
         patient_id=patient_id,
         session_id=dialogue_data.session_id,
@@ -61,38 +87,121 @@ async def patient_chat(
     )
     
     # 保存到数据库
-    dialogue = Dialogue(
+    return await save_dialogue(
+        db,
         patient_id=patient_id,
         session_id=dialogue_data.session_id,
         user_message=dialogue_data.user_message,
         ai_response=ai_response,
         message_type=dialogue_data.message_type or "consultation"
     )
-    db.add(dialogue)
-    db.commit()
-    db.refresh(dialogue)
-    
-    return dialogue
+
+
+@router.post("/chat/stream", summary="患者对话接口（流式）")
+async def patient_chat_stream(
+    dialogue_data: DialogueCreate,
+    patient_id: Optional[int] = Depends(get_patient_id)
+):
+    """
+    患者专用流式对话接口（Server-Sent Events）
+
+    - 每生成一段文本推送一次 `data: {"delta": "..."}`
+    - 生成结束后保存对话记录，并推送 `event: done`，数据为保存后的对话记录
+    """
+    if not patient_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="请先登录"
+        )
+
+    ai_service = get_ai_service()
+
+    async def event_stream():
+        # 流式响应在路由函数返回后才开始迭代，因此单独管理数据库会话
+        db = SessionLocal()
+        try:
+            ai_response = ""
+            async for event in ai_service.astream_response(
+                user_message=dialogue_data.user_message,
+                patient_id=patient_id,
+                session_id=dialogue_data.session_id,
+                db=db
+            ):
+                if "delta" in event:
+                    yield f"data: {json.dumps({'delta': event['delta']}, ensure_ascii=False)}\n\n"
+                else:
+                    ai_response = event["text"]
+
+            # 流结束后保存到数据库
+            dialogue = await save_dialogue(
+                db,
+                patient_id=patient_id,
+                session_id=dialogue_data.session_id,
+                user_message=dialogue_data.user_message,
+                ai_response=ai_response,
+                message_type=dialogue_data.message_type or "consultation"
+            )
+
+            done = DialogueResponse.model_validate(dialogue).model_dump_json()
+            yield f"event: done\ndata: {done}\n\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.get("/", response_model=List[DialogueResponse], summary="获取对话记录列表")
 async def get_dialogues(
+    response: Response,
     skip: int = Query(0, ge=0, description="跳过记录数"),
     limit: int = Query(10, ge=1, le=1000, description="返回记录数"),
     patient_id: Optional[int] = Query(None, description="患者 ID 筛选"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页响应头 X-Next-Cursor）"),
+    session_id: Optional[str] = Query(None, description="会话 ID 筛选"),
+    message_type: Optional[str] = Query(None, description="消息类型筛选"),
+    is_handover: Optional[bool] = Query(None, description="是否人工接管"),
+    q: Optional[str] = Query(None, description="关键字：用户消息或 AI 回复包含"),
+    start_time: Optional[datetime] = Query(None, description="起始时间（含）"),
+    end_time: Optional[datetime] = Query(None, description="结束时间（不含）"),
+    order: str = Query("desc", pattern="^(desc|asc)$", description="按时间排序：desc/asc"),
+    include_total: bool = Query(False, description="是否在响应头 X-Total-Count 返回筛选后的总数"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    获取对话记录列表（支持分页和患者筛选）
+    获取对话记录列表（按时间排序，支持筛选、搜索和分页）
+
+    提供 cursor 时忽略 skip；还有下一页时响应头 X-Next-Cursor 返回新的游标
     """
     query = db.query(Dialogue)
 
     if patient_id:
         query = query.filter(Dialogue.patient_id == patient_id)
-
-    dialogues = query.order_by(Dialogue.created_at.desc()).offset(skip).limit(limit).all()
-    return dialogues
+    if session_id:
+        query = query.filter(Dialogue.session_id == session_id)
+    if message_type:
+        query = query.filter(Dialogue.message_type == message_type)
+    if is_handover is not None:
+        query = query.filter(Dialogue.is_handover == int(is_handover))
+    if q:
+        query = query.filter(or_(
+            Dialogue.user_message.contains(q, autoescape=True),
+            Dialogue.ai_response.contains(q, autoescape=True)
+        ))
+    if start_time:
+        query = query.filter(Dialogue.created_at >= start_time)
+    if end_time:
+        query = query.filter(Dialogue.created_at < end_time)
+
+    return keyset_page(
+        query, Dialogue.created_at, Dialogue.id,
+        limit=limit, cursor=cursor, offset=skip, response=response,
+        descending=order == "desc", include_total=include_total
+    )
 
 
 @router.get("/{dialogue_id}", response_model=DialogueResponse, summary="获取对话记录详情")
@@ -129,7 +238,7 @@ async def create_dialogue(
     """
     # 生成 AI 回复（使用新的简化接口）
     ai_service = get_ai_service()
-    ai_response = ai_service.generate_response(
+    ai_response = await ai_service.agenerate_response(
         user_message=dialogue_data.user_message,
         patient_id=dialogue_data.patient_id,
         session_id=dialogue_data.session_id,
@@ -137,7 +246,8 @@ async def create_dialogue(
     )
 
     # 创建对话记录
-    dialogue = Dialogue(
+    dialogue = await save_dialogue(
+        db,
         patient_id=dialogue_data.patient_id,
         session_id=dialogue_data.session_id,
         user_message=dialogue_data.user_message,
@@ -145,19 +255,6 @@ async def create_dialogue(
         message_type=dialogue_data.message_type
     )
 
-    db.add(dialogue)
-    db.commit()
-    db.refresh(dialogue)
-
-    # 更新会话历史到 Redis
-    cache_key = f"dialogue_session:{dialogue_data.session_id}"
-    cache.lpush(cache_key, {
-        "user_message": dialogue_data.user_message,
-        "ai_response": ai_response
-    })
-    cache.ltrim(cache_key, 0, 19)  # 保留最近 20 条
-    cache.expire(cache_key, settings.REDIS_SESSION_EXPIRE)
-
     return dialogue
 
 
@@ -166,7 +263,7 @@ async def get_dialogues_by_session(
     session_id: str,
     skip: int = Query(0, ge=0, description="跳过记录数"),
     limit: int = Query(20, ge=1, le=100, description="返回记录数"),
-    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
+    patient_id: Optional[int] = Depends(get_patient_id),
     db: Session = Depends(get_db)
 ):
     """
@@ -174,8 +271,6 @@ async def get_dialogues_by_session(
     
     **安全机制**：从 Token 中提取 patient_id，只返回该患者的会话
     """
-    patient_id = get_patient_id_from_token(credentials)
-    
     if not patient_id:
         # 未登录，返回空列表
         return []
@@ -255,6 +350,7 @@ async def delete_dialogue(
     
     db.delete(dialogue)
     db.commit()
+    session_store.invalidate(dialogue.session_id)
     return None
 
 
@@ -267,8 +363,10 @@ async def delete_session_dialogues(
     """
     删除指定会话的所有对话记录
     """
+    subtract_dialogues(db, Dialogue.session_id == session_id)
     db.query(Dialogue).filter(Dialogue.session_id == session_id).delete()
     db.commit()
+    session_store.invalidate(session_id)
     return None
 
 
@@ -281,8 +379,14 @@ async def delete_patient_dialogues(
     """
     删除指定患者的所有对话记录
     """
+    session_ids = [row.session_id for row in db.query(Dialogue.session_id).filter(
+        Dialogue.patient_id == patient_id
+    ).distinct()]
+    subtract_dialogues(db, Dialogue.patient_id == patient_id)
     db.query(Dialogue).filter(Dialogue.patient_id == patient_id).delete()
     db.commit()
+    for session_id in session_ids:
+        session_store.invalidate(session_id)
     return None
 
 
@@ -295,5 +399,7 @@ async def delete_all_dialogues(
     清空所有对话记录（谨慎使用）
     """
     db.query(Dialogue).delete()
+    reset_dialogues(db)
     db.commit()
+    session_store.clear()
     return None
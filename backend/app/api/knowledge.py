@@ -6,10 +6,22 @@ from ..schemas.knowledge_base import KnowledgeBaseCreate, KnowledgeBaseUpdate, K
 from ..models.knowledge_base import KnowledgeBase
 from ..dependencies import get_current_user, get_current_admin_user
 from ..models.user import User
+from ..services.knowledge_index import knowledge_index
+from ..services.knowledge_import import full_import_running
+from ..services.ai_service import get_ai_service
 
 router = APIRouter()
 
 
+def _ensure_writable(db: Session) -> None:
+    """full 模式导入期间拒绝写入：导入结束替换原表时这些修改会丢失"""
+    if full_import_running(db):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="知识库正在全量导入，请稍后再试"
+        )
+
+
 @router.get("/", response_model=List[KnowledgeBaseResponse], summary="获取知识库列表")
 async def get_knowledge_list(
     skip: int = Query(0, ge=0, description="跳过记录数"),
@@ -67,10 +79,12 @@ async def create_knowledge(
     """
     创建新的知识条目（需要管理员权限）
     """
+    _ensure_writable(db)
     knowledge = KnowledgeBase(**knowledge_data.model_dump())
     db.add(knowledge)
     db.commit()
     db.refresh(knowledge)
+    knowledge_index.upsert(knowledge)
     return knowledge
 
 
@@ -84,6 +98,7 @@ async def update_knowledge(
     """
     更新知识条目（需要管理员权限）
     """
+    _ensure_writable(db)
     knowledge = db.query(KnowledgeBase).filter(KnowledgeBase.id == knowledge_id).first()
     if not knowledge:
         raise HTTPException(
@@ -97,6 +112,7 @@ async def update_knowledge(
 
     db.commit()
     db.refresh(knowledge)
+    knowledge_index.upsert(knowledge)
     return knowledge
 
 
@@ -109,6 +125,7 @@ async def delete_knowledge(
     """
     删除知识条目（需要管理员权限）
     """
+    _ensure_writable(db)
     knowledge = db.query(KnowledgeBase).filter(KnowledgeBase.id == knowledge_id).first()
     if not knowledge:
         raise HTTPException(
@@ -118,6 +135,7 @@ async def delete_knowledge(
 
     db.delete(knowledge)
     db.commit()
+    knowledge_index.remove(knowledge_id)
     return None
 
 
@@ -133,6 +151,16 @@ async def search_knowledge(
     
     **注意**：此接口不使用 Depends(get_current_user)，避免误判为未授权
     """
+    if knowledge_index.loaded:
+        # 使用内存倒排索引定位条目，只按主键回表取当前页
+        knowledge_index.ensure_fresh(db)
+        page_ids = knowledge_index.search_ids(query)[skip:skip + limit]
+        if not page_ids:
+            return []
+        rows = db.query(KnowledgeBase).filter(KnowledgeBase.id.in_(page_ids)).all()
+        rows_by_id = {row.id: row for row in rows}
+        return [rows_by_id[i] for i in page_ids if i in rows_by_id]
+
     results = db.query(KnowledgeBase).filter(
         KnowledgeBase.is_active == 1,
         (KnowledgeBase.content.like(f"%{query}%")) |
@@ -141,3 +169,15 @@ async def search_knowledge(
     ).offset(skip).limit(limit).all()
     
     return results
+
+
+@router.get("/search/ranked", summary="按相关度检索知识库")
+async def search_knowledge_ranked(
+    query: str = Query(..., description="查询文本（支持整句中文，无需空格分词）"),
+    limit: int = Query(5, ge=1, le=20, description="返回记录数"),
+    db: Session = Depends(get_db)
+):
+    """
+    使用 BM25 按相关度检索知识库，返回条目及得分 - 公开访问
+    """
+    return get_ai_service().search_knowledge_scored(db, query, limit=limit)
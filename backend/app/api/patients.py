@@ -1,66 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Query, UploadFile, File
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from ..database import get_db
 from ..schemas.patient import PatientCreate, PatientUpdate, PatientResponse
 from ..models.patient import Patient
-from ..dependencies import get_current_user, get_current_admin_user
+from ..dependencies import get_current_user, get_current_admin_user, get_patient_id
 from ..models.user import User
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwt, JWTError
-from ..config import settings
+from ..services.patient_import import import_patients
+from ..utils.pagination import keyset_page
 
 router = APIRouter()
 
 
-def get_patient_id_from_token(credentials: HTTPAuthorizationCredentials) -> Optional[int]:
-    """从 JWT Token 中提取 patient_id"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    try:
-        if not credentials:
-            logger.warning("No credentials provided")
-            return None
-            
-        token = credentials.credentials
-        logger.info(f"Token received: {token[:20]}...")
-        
-        payload = jwt.decode(
-            token,
-            settings.SECRET_KEY,
-            algorithms=[settings.ALGORITHM]
-        )
-        logger.info(f"Token payload: {payload}")
-        
-        sub = payload.get("sub")
-        logger.info(f"Token sub: {sub}")
-        
-        if sub and sub.startswith("patient:"):
-            patient_id = int(sub.split(":")[1])
-            logger.info(f"Extracted patient_id from sub: {patient_id}")
-            return patient_id
-            
-        patient_id = payload.get("patient_id")
-        if patient_id:
-            logger.info(f"Extracted patient_id from payload: {patient_id}")
-            return int(patient_id)
-            
-        logger.warning("patient_id not found in token")
-    except (JWTError, ValueError, KeyError) as e:
-        logger.error(f"Token decode error: {e}")
-    except Exception as e:
-        logger.error(f"Unexpected error: {e}")
-    
-    return None
-
-
 # 注意：带固定前缀的路由必须放在动态参数路由之前
 # 否则 /openid/xxx 会被 /{patient_id} 匹配
 
 @router.get("/check-complete", summary="检查患者信息是否完善")
 async def check_patient_complete(
-    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
+    patient_id: Optional[int] = Depends(get_patient_id),
     db: Session = Depends(get_db)
 ):
     """
@@ -68,8 +27,6 @@ async def check_patient_complete(
 
     判断标准：phone 字段不为空即认为信息完善
     """
-    patient_id = get_patient_id_from_token(credentials)
-
     if not patient_id:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -97,7 +54,7 @@ async def check_patient_complete(
 @router.post("/complete", response_model=PatientResponse, summary="患者完善个人信息（小程序专用）")
 async def complete_patient_info(
     patient_data: PatientUpdate,
-    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
+    patient_id: Optional[int] = Depends(get_patient_id),
     db: Session = Depends(get_db)
 ):
     """
@@ -111,8 +68,6 @@ async def complete_patient_info(
     - medical_history: 既往病史（可选）
     - allergy_history: 过敏史（可选）
     """
-    patient_id = get_patient_id_from_token(credentials)
-
     if not patient_id:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -157,19 +112,49 @@ async def get_patient_by_openid(
 
 @router.get("/", response_model=List[PatientResponse], summary="获取患者列表")
 async def get_patients(
+    response: Response,
     skip: int = Query(0, ge=0, description="跳过记录数"),
     limit: int = Query(100, ge=1, le=1000, description="返回记录数（最大 1000）"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页响应头 X-Next-Cursor）"),
+    q: Optional[str] = Query(None, description="关键字：姓名包含或手机号前缀"),
+    name: Optional[str] = Query(None, description="姓名包含"),
+    phone: Optional[str] = Query(None, description="手机号前缀"),
+    gender: Optional[str] = Query(None, description="性别"),
+    ids: Optional[List[int]] = Query(None, alias="id", description="按 ID 批量获取（可重复）"),
+    order: str = Query("desc", pattern="^(desc|asc)$", description="按注册时间排序：desc/asc"),
+    include_total: bool = Query(False, description="是否在响应头 X-Total-Count 返回筛选后的总数"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    获取患者列表（支持分页）
+    获取患者列表（按注册时间排序，支持筛选、搜索和分页）
 
     - **skip**: 跳过记录数
     - **limit**: 返回记录数（最大 1000）
+    - **cursor**: 分页游标，提供时忽略 skip；还有下一页时响应头 X-Next-Cursor 返回新的游标
+    - **q / name / phone / gender / id**: 服务端筛选，手机号按前缀匹配（走 idx_phone 索引）
     """
-    patients = db.query(Patient).offset(skip).limit(limit).all()
-    return patients
+    query = db.query(Patient)
+
+    if q:
+        query = query.filter(or_(
+            Patient.name.contains(q, autoescape=True),
+            Patient.phone.startswith(q, autoescape=True)
+        ))
+    if name:
+        query = query.filter(Patient.name.contains(name, autoescape=True))
+    if phone:
+        query = query.filter(Patient.phone.startswith(phone, autoescape=True))
+    if gender:
+        query = query.filter(Patient.gender == gender)
+    if ids:
+        query = query.filter(Patient.id.in_(ids))
+
+    return keyset_page(
+        query, Patient.created_at, Patient.id,
+        limit=limit, cursor=cursor, offset=skip, response=response,
+        descending=order == "desc", include_total=include_total
+    )
 
 
 @router.get("/{patient_id}", response_model=PatientResponse, summary="获取患者详情")
@@ -222,6 +207,37 @@ async def create_patient(
     return patient
 
 
+@router.post("/import", summary="批量导入患者（CSV / XLSX）")
+async def import_patients_file(
+    file: UploadFile = File(..., description="CSV 或 XLSX 文件，首行为表头"),
+    chunk_size: int = Query(500, ge=1, le=2000, description="每批写入行数"),
+    dry_run: bool = Query(False, description="只校验，不写入"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)  # 需要管理员权限
+):
+    """
+    批量导入患者（需要管理员权限）
+
+    表头支持字段名或中文列名：openid/微信标识、name/姓名、gender/性别、age/年龄、
+    phone/手机号、medical_history/既往病史、allergy_history/过敏史
+
+    - openid 已存在的患者更新资料；未填写 openid 时按手机号匹配已有患者
+    - 每批一个事务，某一行校验失败不影响其他行
+
+    返回 {"total", "created", "updated", "failed", "errors": [{"row", "openid", "errors"}]}
+    """
+    try:
+        # 解析与写库在线程池中执行，大文件导入不阻塞事件循环
+        return await asyncio.to_thread(
+            import_patients, db, file.file, file.filename or "", chunk_size, dry_run
+        )
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
 @router.put("/{patient_id}", response_model=PatientResponse, summary="更新患者信息")
 async def update_patient(
     patient_id: int,
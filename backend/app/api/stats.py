@@ -1,13 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import hashlib
+import json
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
-from datetime import datetime, timedelta
+from sqlalchemy import func
 from ..database import get_db
 from ..dependencies import get_current_user
 from ..models.user import User
-from ..models.patient import Patient
 from ..models.appointment import Appointment
 from ..models.dialogue import Dialogue
+from ..services.response_cache import response_cache
+from ..services.dialogue_writer import dialogue_writer
+from ..services.reminder_service import reminder_engine
+from ..utils.security import password_executor
+from ..config import settings
+from ..services.stats_service import (
+    get_overview, get_dashboard, compute_dashboard, data_version,
+    gender_distribution, status_distribution
+)
+from ..services.time_buckets import GRANULARITIES, MAX_BUCKETS, dense_series, local_today
 
 router = APIRouter()
 
@@ -19,151 +32,90 @@ async def get_overview_stats(
 ):
     """
     获取系统概览统计数据
+
+    数据来自 daily_stats 汇总表的一次条件聚合查询，缓存 STATS_CACHE_TTL_SECONDS 秒
     """
-    # 患者总数
-    total_patients = db.query(func.count(Patient.id)).scalar()
-    
-    # 今日新增患者
-    today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    new_patients_today = db.query(func.count(Patient.id)).filter(
-        Patient.created_at >= today_start
-    ).scalar()
+    return get_overview(db)
 
-    # 复诊计划总数
-    total_appointments = db.query(func.count(Appointment.id)).scalar()
 
-    # 今日复诊数量
-    today_appointments = db.query(func.count(Appointment.id)).filter(
-        func.date(Appointment.appointment_date) == datetime.now().date()
-    ).scalar()
+@router.get("/dashboard", summary="获取仪表盘全部数据")
+async def get_dashboard_stats(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    一次返回仪表盘的全部面板：概览、近 7 日复诊趋势、近 7 日对话量、性别分布、复诊状态分布
 
-    # 昨日复诊数量（用于对比）
-    yesterday = datetime.now().date() - timedelta(days=1)
-    yesterday_appointments = db.query(func.count(Appointment.id)).filter(
-        func.date(Appointment.appointment_date) == yesterday
-    ).scalar()
+    响应带强 ETag（数据版本纪元与版本号 + 日期）；请求头 If-None-Match 与之相同时返回 304，不查询数据库。
+    Redis 不可用时 ETag 按响应内容计算。
+    """
+    today = local_today()
+    version = data_version.current()
+    if version is not None:
+        etag = f'"v{version}-{today.isoformat()}"'
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return _not_modified(etag)
+        payload = jsonable_encoder(get_dashboard(db, version, today))
+    else:
+        payload = jsonable_encoder(compute_dashboard(db, today=today))
+        digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        etag = f'"c{digest}"'
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return _not_modified(etag)
 
-    # 待复诊数量
-    pending_appointments = db.query(func.count(Appointment.id)).filter(
-        Appointment.status == "pending"
-    ).scalar()
+    return JSONResponse(payload, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
-    # 今日完成复诊
-    completed_appointments_today = db.query(func.count(Appointment.id)).filter(
-        func.date(Appointment.appointment_date) == datetime.now().date(),
-        Appointment.status == "completed"
-    ).scalar()
 
-    # 对话总数
-    total_dialogues = db.query(func.count(Dialogue.id)).scalar()
-    
-    # 今日对话数量
-    today_dialogues = db.query(func.count(Dialogue.id)).filter(
-        func.date(Dialogue.created_at) == datetime.now().date()
-    ).scalar()
-    
-    # 昨日对话数量（用于计算增长率）
-    yesterday = datetime.now().date() - timedelta(days=1)
-    yesterday_dialogues = db.query(func.count(Dialogue.id)).filter(
-        func.date(Dialogue.created_at) == yesterday
-    ).scalar()
-    
-    # 对话增长率
-    dialogue_growth_rate = 0
-    if yesterday_dialogues > 0:
-        dialogue_growth_rate = round(((today_dialogues - yesterday_dialogues) / yesterday_dialogues) * 100, 1)
-    elif today_dialogues > 0:
-        dialogue_growth_rate = 100
-
-    # 人工接管数量
-    handover_count = db.query(func.count(Dialogue.id)).filter(
-        Dialogue.is_handover == 1
-    ).scalar()
-    
-    # 知识库总数
-    from ..models.knowledge_base import KnowledgeBase
-    total_knowledge = db.query(func.count(KnowledgeBase.id)).filter(
-        KnowledgeBase.is_active == 1
-    ).scalar()
-    
-    # 本周新增知识
-    week_start = today_start - timedelta(days=today_start.weekday())
-    new_knowledge_this_week = db.query(func.count(KnowledgeBase.id)).filter(
-        KnowledgeBase.created_at >= week_start,
-        KnowledgeBase.is_active == 1
-    ).scalar()
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match 使用弱比较：忽略 W/ 前缀
+    return "*" in candidates or etag in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
 
-    return {
-        "total_patients": total_patients,
-        "new_patients_today": new_patients_today,
-        "total_appointments": total_appointments,
-        "today_appointments": today_appointments,
-        "yesterday_appointments": yesterday_appointments,  # 昨日复诊数（用于对比）
-        "pending_appointments": pending_appointments,
-        "completed_appointments_today": completed_appointments_today,
-        "total_dialogues": total_dialogues,
-        "today_dialogues": today_dialogues,
-        "dialogue_growth_rate": dialogue_growth_rate,
-        "handover_count": handover_count,
-        "total_knowledge": total_knowledge,
-        "new_knowledge_this_week": new_knowledge_this_week
-    }
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 
 @router.get("/appointments/trend", summary="获取复诊趋势统计")
 async def get_appointments_trend(
-    days: int = 30,
+    days: int = Query(30, ge=1, le=MAX_BUCKETS, description="桶数量"),
+    granularity: str = Query("day", description="时间粒度：day/week/month"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    获取最近 N 天的复诊趋势
-    """
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=days)
+    获取最近 N 个时间桶（含今天所在的桶）的复诊数量
 
-    # 按日期统计复诊数量
-    results = db.query(
-        func.date(Appointment.appointment_date).label("date"),
-        func.count(Appointment.id).label("count")
-    ).filter(
-        Appointment.appointment_date >= start_date,
-        Appointment.appointment_date <= end_date
-    ).group_by(
-        func.date(Appointment.appointment_date)
-    ).all()
-
-    return [
-        {"date": str(r.date), "count": r.count}
-        for r in results
-    ]
+    返回按时间升序、缺失补 0 的连续序列 [{"date", "count"}]，date 为桶的第一天
+    """
+    return _series(db, Appointment.appointment_date, granularity, days)
 
 
 @router.get("/dialogues/daily", summary="获取每日对话统计")
 async def get_daily_dialogues(
-    days: int = 7,
+    days: int = Query(7, ge=1, le=MAX_BUCKETS, description="桶数量"),
+    granularity: str = Query("day", description="时间粒度：day/week/month"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    获取最近 N 天的对话统计
+    获取最近 N 个时间桶（含今天所在的桶）的对话数量
+
+    返回按时间升序、缺失补 0 的连续序列 [{"date", "count"}]，date 为桶的第一天
     """
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=days)
+    return _series(db, Dialogue.created_at, granularity, days)
 
-    results = db.query(
-        func.date(Dialogue.created_at).label("date"),
-        func.count(Dialogue.id).label("count")
-    ).filter(
-        Dialogue.created_at >= start_date
-    ).group_by(
-        func.date(Dialogue.created_at)
-    ).all()
 
-    return [
-        {"date": str(r.date), "count": r.count}
-        for r in results
-    ]
+def _series(db: Session, column, granularity: str, count: int):
+    if granularity not in GRANULARITIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支持的时间粒度：{granularity}"
+        )
+    return dense_series(db, column, granularity, count)
 
 
 @router.get("/patients/gender", summary="获取患者性别分布")
@@ -174,15 +126,7 @@ async def get_patient_gender_distribution(
     """
     获取患者性别分布统计
     """
-    results = db.query(
-        Patient.gender,
-        func.count(Patient.id).label("count")
-    ).group_by(Patient.gender).all()
-
-    return [
-        {"gender": r.gender or "未知", "count": r.count}
-        for r in results
-    ]
+    return gender_distribution(db)
 
 
 @router.get("/appointments/status", summary="获取复诊状态分布")
@@ -193,15 +137,24 @@ async def get_appointment_status_distribution(
     """
     获取复诊状态分布统计
     """
-    results = db.query(
-        Appointment.status,
-        func.count(Appointment.id).label("count")
-    ).group_by(Appointment.status).all()
+    return status_distribution(db)
 
-    return [
-        {"status": r.status, "count": r.count}
-        for r in results
-    ]
+
+@router.get("/reminders", summary="获取复诊提醒发送统计")
+async def get_reminder_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取复诊提醒引擎的运行状态、吞吐量（sent_per_minute）与发送延迟（lag_seconds）
+
+    SCHEDULER_API_ENABLED 关闭时不提供
+    """
+    if not settings.SCHEDULER_API_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务调度接口未启用"
+        )
+    return reminder_engine.stats()
 
 
 @router.get("/dialogues/types", summary="获取对话类型统计")
@@ -243,3 +196,33 @@ async def get_appointment_compliance(
         "completed": completed,
         "compliance_rate": round(compliance_rate, 2)
     }
+
+
+@router.get("/ai/response-cache", summary="获取 AI 回复缓存命中统计")
+async def get_response_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取 AI 回复缓存的命中、未命中、跳过和淘汰次数
+    """
+    return response_cache.stats()
+
+
+@router.get("/dialogues/write-behind", summary="获取对话写后持久化统计")
+async def get_dialogue_writer_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取对话写入队列深度、批量写入次数、重试和落盘条数
+    """
+    return dialogue_writer.stats()
+
+
+@router.get("/auth/password-pool", summary="获取密码哈希线程池统计")
+async def get_password_pool_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取密码哈希线程池的排队数、运行数和排队耗时
+    """
+    return password_executor.stats()
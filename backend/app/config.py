@@ -22,6 +22,10 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "your-secret-key-change-in-production"  # 生产环境请修改为随机字符串
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24  # 24 小时
+    AUTH_TOKEN_CACHE_MAX: int = 10000  # 已验证 Token 缓存条目数（条目在 Token 过期时失效）
+    AUTH_USER_CACHE_TTL_SECONDS: int = 30  # 医护用户记录缓存时间（秒），0 表示不缓存
+    AUTH_USER_CACHE_MAX: int = 1000  # 医护用户记录缓存条目数
+    PASSWORD_HASH_WORKERS: int = 2  # 密码哈希（bcrypt）线程数，即同时进行的哈希计算上限
 
     # AI 服务配置
     AI_SERVICE_URL: Optional[str] = None  # AI 服务地址
@@ -29,12 +33,41 @@ class Settings(BaseSettings):
     AI_MAX_TOKENS: int = 150
     AI_TEMPERATURE: float = 0.7
     AI_TIMEOUT_SECONDS: int = 60  # AI 请求超时时间（秒）
+    AI_HTTP2: bool = True  # AI 服务长连接是否启用 HTTP/2
+    AI_HTTP_MAX_CONNECTIONS: int = 100  # AI 服务连接池最大连接数
+    AI_HTTP_MAX_KEEPALIVE: int = 20  # AI 服务连接池保持的空闲连接数
+    AI_HTTP_KEEPALIVE_EXPIRY: float = 60.0  # 空闲连接保持时间（秒）
+
+    # 知识库检索配置
+    KNOWLEDGE_INDEX_REFRESH_SECONDS: int = 60  # 检查其他进程是否修改了知识库的间隔（秒）
+    KNOWLEDGE_MIN_SCORE_RATIO: float = 0.1  # BM25 得分低于查询得分上限的该比例时不作为参考知识
+    KNOWLEDGE_VECTOR_PATH: Optional[str] = None  # 向量索引路径前缀（如 data/knowledge_vectors），为空则只用关键词检索
+    KNOWLEDGE_VECTOR_MIN_SCORE: float = 0.3  # 向量检索最低余弦相似度
+    KNOWLEDGE_RRF_K: int = 60  # 混合检索倒数排名融合常数
+
+    # AI 回复缓存配置
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 2000  # 本地 LRU 最大条目数
+    RESPONSE_CACHE_TTL_SECONDS: int = 86400  # 缓存有效期（秒）
+
+    # 对话写后持久化配置
+    DIALOGUE_WRITE_BEHIND: bool = False  # 开启后对话记录先入队列立即返回，由后台任务批量写库
+    DIALOGUE_FLUSH_BATCH_SIZE: int = 100  # 每批最多写入条数
+    DIALOGUE_FLUSH_INTERVAL_MS: int = 200  # 攒批最长等待时间（毫秒）
+    DIALOGUE_QUEUE_MAX: int = 5000  # 队列上限，满时请求等待（背压）
+    DIALOGUE_ID_BLOCK_SIZE: int = 100  # 每次从 id_sequences 预留的 ID 数
+    DIALOGUE_SPILL_PATH: Optional[str] = "data/dialogues_pending.jsonl"  # 关闭时无法写库的记录落盘路径
+
+    # 统计配置
+    STATS_CACHE_TTL_SECONDS: int = 10  # 概览统计缓存时间（秒）
 
     # Redis 配置
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
     REDIS_SESSION_EXPIRE: int = 1800  # 30 分钟
+    SESSION_CONTEXT_MAX_TURNS: int = 20  # 每个会话缓存的最近对话轮数
+    SESSION_CONTEXT_LOCAL_MAX: int = 10000  # Redis 不可用时进程内 LRU 保留的会话数
 
     # 跨域配置
     CORS_ORIGINS: List[str] = [
@@ -46,6 +79,12 @@ class Settings(BaseSettings):
     # 任务调度配置
     SCHEDULER_API_ENABLED: bool = True
     SCHEDULER_TIMEZONE: str = "Asia/Shanghai"
+    REMINDER_ENABLED: bool = False  # 是否在应用启动时运行复诊提醒引擎
+    REMINDER_ADVANCE_HOURS: int = 24  # 提前多少小时发送复诊提醒
+    REMINDER_POLL_SECONDS: float = 60.0  # 内存堆为空时后台任务的最长等待时间（秒）
+    REMINDER_QUEUE_HORIZON_HOURS: float = 6  # 内存堆保存未来多少小时内到期的提醒
+    REMINDER_RECONCILE_SECONDS: float = 600.0  # 内存堆与数据库对账的间隔（秒），需小于 horizon
+    REMINDER_BATCH_SIZE: int = 200  # 每批认领的提醒条数
 
     @property
     def DATABASE_URL(self) -> str:
@@ -1,15 +1,32 @@
-from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordBearer, HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from jose import jwt
+from typing import Optional
 from .config import settings
 from .database import get_db
 from .models.user import User
 from .utils.jwt import verify_token
+from .services.auth_cache import token_cache, user_cache
+import logging
+
+logger = logging.getLogger(__name__)
 
 # OAuth2 方案
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# 小程序患者端的 Bearer 方案（未携带 Token 时不报错，由接口自行处理）
+patient_bearer = HTTPBearer(auto_error=False)
+
+
+def _decode_cached(token: str) -> Optional[dict]:
+    """解码 Token，已验证且未过期的 Token 直接命中缓存"""
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = verify_token(token)
+        if payload is not None:
+            token_cache.put(token, payload)
+    return payload
+
 
 def get_current_user(
     token: str = Depends(oauth2_scheme),
@@ -34,36 +51,69 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    # 验证 Token
-    payload = verify_token(token)
+    # 验证 Token（已验证过且未过期的 Token 直接命中缓存）
+    payload = _decode_cached(token)
     if payload is None:
-        print(f"Token 验证失败：{token}")
         raise credentials_exception
 
     user_id: int = payload.get("sub")
     if user_id is None:
-        print(f"Token 中没有 user_id: {payload}")
+        logger.warning("Token 中没有 user_id")
         raise credentials_exception
 
-    print(f"Token 解析成功 - user_id: {user_id}")
-
     # 将 user_id 从字符串转换为整数
     try:
         user_id = int(user_id)
     except (ValueError, TypeError):
-        print(f"user_id 转换失败：{user_id}")
+        logger.debug(f"user_id 转换失败：{user_id}")
         raise credentials_exception
 
-    # 查询用户
-    user = db.query(User).filter(User.id == user_id).first()
+    # 查询用户（短期缓存，命中时不访问数据库）
+    user = user_cache.get(user_id)
     if user is None:
-        print(f"数据库中未找到用户 ID: {user_id}")
-        raise credentials_exception
+        user = db.query(User).filter(User.id == user_id).first()
+        if user is None:
+            logger.warning(f"数据库中未找到用户 ID: {user_id}")
+            raise credentials_exception
+        user_cache.put(user)
 
-    print(f"用户验证成功：{user.username}")
+    logger.debug(f"用户验证成功：{user.username}")
     return user
 
 
+def get_patient_id(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(patient_bearer)
+) -> Optional[int]:
+    """
+    从小程序 Token 中获取当前患者 ID
+
+    Token 的 sub 格式为 "patient:123"（兼容直接携带 patient_id 字段的旧 Token）；
+    解码结果经 token_cache 复用，本次请求的结果保存在 request.state.patient_id
+
+    Returns:
+        患者 ID，未提供或 Token 无效时返回 None
+    """
+    if hasattr(request.state, "patient_id"):
+        return request.state.patient_id
+
+    patient_id = None
+    payload = _decode_cached(credentials.credentials) if credentials else None
+    if payload is not None:
+        try:
+            sub = payload.get("sub")
+            if isinstance(sub, str) and sub.startswith("patient:"):
+                patient_id = int(sub.split(":", 1)[1])
+            elif payload.get("patient_id"):
+                patient_id = int(payload["patient_id"])
+        except (ValueError, TypeError):
+            logger.debug("Token 中的 patient_id 格式无效")
+            patient_id = None
+
+    request.state.patient_id = patient_id
+    return patient_id
+
+
 def get_current_admin_user(
     current_user: User = Depends(get_current_user)
 ) -> User:
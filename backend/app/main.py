@@ -1,7 +1,57 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .config import settings
 from .api import auth, patients, appointments, dialogues, knowledge, stats
+from .database import SessionLocal
+from .services.ai_service import get_ai_service
+from .services.knowledge_index import knowledge_index
+from .services.vector_index import load_vector_index
+from .services.dialogue_writer import dialogue_writer
+from .services.reminder_service import reminder_engine
+from .utils.security import password_executor
+from .utils.pagination import NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时创建长连接资源，关闭时释放"""
+    ai_service = get_ai_service()
+    await ai_service.startup()
+
+    # 加载知识库内存索引（数据库不可用时退回 SQL 检索）
+    db = SessionLocal()
+    try:
+        knowledge_index.load(db)
+    except Exception as e:
+        logger.warning(f"Knowledge index not loaded, falling back to SQL search: {e}")
+    finally:
+        db.close()
+
+    # 加载离线构建的向量索引（用于混合检索）
+    try:
+        load_vector_index(settings.KNOWLEDGE_VECTOR_PATH)
+    except Exception as e:
+        logger.warning(f"Vector index not loaded, using lexical search only: {e}")
+
+    # 对话写后持久化（可选）
+    if settings.DIALOGUE_WRITE_BEHIND:
+        await dialogue_writer.start()
+
+    # 复诊提醒引擎（可选）
+    if settings.REMINDER_ENABLED:
+        await reminder_engine.start()
+
+    yield
+    await reminder_engine.stop()
+    # 先排空对话写入队列，再释放其他资源
+    await dialogue_writer.stop()
+    await ai_service.shutdown()
+    password_executor.shutdown()
+
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -10,7 +60,8 @@ app = FastAPI(
     description=settings.APP_DESCRIPTION,
     docs_url="/docs",      # Swagger UI 地址
     redoc_url="/redoc",    # ReDoc 地址
-    openapi_url="/openapi.json"
+    openapi_url="/openapi.json",
+    lifespan=lifespan
 )
 
 # 配置 CORS（跨域）
@@ -20,6 +71,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER],
 )
 
 
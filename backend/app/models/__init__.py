@@ -3,6 +3,7 @@ from .patient import Patient
 from .appointment import Appointment
 from .dialogue import Dialogue
 from .knowledge_base import KnowledgeBase
+from .daily_stats import DailyStats
 
 __all__ = [
     "User",
@@ -10,4 +11,5 @@ __all__ = [
     "Appointment",
     "Dialogue",
     "KnowledgeBase",
+    "DailyStats",
 ]
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, Date, DateTime
+from datetime import datetime
+from ..database import Base
+
+
+class DailyStats(Base):
+    """每日统计汇总模型（由患者、复诊、对话的增删改增量维护）"""
+
+    __tablename__ = "daily_stats"
+
+    stat_date = Column(Date, primary_key=True, comment="统计日期")
+    new_patients = Column(Integer, nullable=False, default=0, comment="当日新增患者数")
+    appointments = Column(Integer, nullable=False, default=0, comment="复诊日期在当日的复诊数")
+    appointments_pending = Column(Integer, nullable=False, default=0, comment="其中待复诊数")
+    appointments_completed = Column(Integer, nullable=False, default=0, comment="其中已完成数")
+    dialogues = Column(Integer, nullable=False, default=0, comment="当日对话数")
+    dialogues_handover = Column(Integer, nullable=False, default=0, comment="其中人工接管数")
+    updated_at = Column(
+        DateTime,
+        nullable=False,
+        default=datetime.now,
+        onupdate=datetime.now,
+        comment="更新时间"
+    )
+
+    def __repr__(self):
+        return f"<DailyStats(stat_date={self.stat_date})>"
@@ -1,6 +1,9 @@
 from .user import UserCreate, UserUpdate, UserResponse, UserInDB, Token, TokenData
 from .patient import PatientCreate, PatientUpdate, PatientResponse
-from .appointment import AppointmentCreate, AppointmentUpdate, AppointmentResponse
+from .appointment import (
+    AppointmentCreate, AppointmentUpdate, AppointmentResponse,
+    FollowupPlanItem, FollowupPlanBulkCreate, FollowupPlanBulkResponse
+)
 from .dialogue import DialogueCreate, DialogueResponse
 from .knowledge_base import KnowledgeBaseCreate, KnowledgeBaseUpdate, KnowledgeBaseResponse
 
@@ -8,6 +11,7 @@ __all__ = [
     "UserCreate", "UserUpdate", "UserResponse", "UserInDB", "Token", "TokenData",
     "PatientCreate", "PatientUpdate", "PatientResponse",
     "AppointmentCreate", "AppointmentUpdate", "AppointmentResponse",
+    "FollowupPlanItem", "FollowupPlanBulkCreate", "FollowupPlanBulkResponse",
     "DialogueCreate", "DialogueResponse",
     "KnowledgeBaseCreate", "KnowledgeBaseUpdate", "KnowledgeBaseResponse",
 ]
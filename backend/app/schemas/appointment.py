@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, ConfigDict
 from datetime import datetime
-from typing import Optional, Literal
+from typing import Optional, Literal, List
 
 
 class AppointmentBase(BaseModel):
@@ -34,3 +34,23 @@ class AppointmentResponse(AppointmentBase):
     reminder_time: Optional[datetime] = None
     created_at: datetime
     updated_at: datetime
+
+
+class FollowupPlanItem(BaseModel):
+    """一名患者的一次治疗"""
+    patient_id: int = Field(..., gt=0, description="患者 ID")
+    treatment_type: Literal["种植义齿修复", "固定义齿修复", "活动义齿修复"] = Field(..., description="治疗类型")
+    treatment_date: datetime = Field(..., description="治疗（手术/戴牙）日期时间")
+    notes: Optional[str] = Field(None, description="追加到每条复诊计划的备注")
+
+
+class FollowupPlanBulkCreate(BaseModel):
+    """批量生成复诊计划请求"""
+    items: List[FollowupPlanItem] = Field(..., min_length=1, max_length=1000, description="治疗列表")
+
+
+class FollowupPlanBulkResponse(BaseModel):
+    """批量生成复诊计划响应"""
+    created: int = Field(..., description="生成的复诊计划条数")
+    patients: int = Field(..., description="涉及的患者数")
+    appointments: List[AppointmentResponse] = Field(default_factory=list, description="生成的复诊计划（含 ID）")
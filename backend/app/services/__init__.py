@@ -1,5 +1,11 @@
 from .auth_service import authenticate_user, login_for_access_token, create_user
 from .ai_service import AIService, get_ai_service
+from .knowledge_index import KnowledgeIndex, knowledge_index
+from .vector_index import VectorIndex, get_vector_index
+from .response_cache import ResponseCache, response_cache
+from .dialogue_writer import DialogueWriter, dialogue_writer
+from .session_store import SessionStore, session_store
+from .reminder_service import ReminderEngine, reminder_engine
 
 __all__ = [
     "authenticate_user",
@@ -7,4 +13,16 @@ __all__ = [
     "create_user",
     "AIService",
     "get_ai_service",
+    "KnowledgeIndex",
+    "knowledge_index",
+    "VectorIndex",
+    "get_vector_index",
+    "ResponseCache",
+    "response_cache",
+    "DialogueWriter",
+    "dialogue_writer",
+    "SessionStore",
+    "session_store",
+    "ReminderEngine",
+    "reminder_engine",
 ]
@@ -1,13 +1,64 @@
 import httpx
-from typing import Optional, List, Dict, Any
+import json
+from typing import Optional, List, Dict, Any, AsyncIterator
 from sqlalchemy.orm import Session
 from ..models.knowledge_base import KnowledgeBase
 from ..config import settings
 from ..utils.redis_cache import cache
+from .knowledge_index import knowledge_index
+from .vector_index import get_vector_index
+from .response_cache import response_cache
+from .session_store import session_store
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 提示词模板版本：修改 _build_system_prompt 或请求约束后递增，使旧的缓存回复失效
+PROMPT_TEMPLATE_VERSION = "v1"
+
+# 固定的人设提示词（所有请求相同，推理服务据此缓存前缀 KV）
+BASE_SYSTEM_PROMPT = """你叫小齿，是一名专业的牙科修复 AI 智能客服助手，服务于牙科修复复诊提醒与管理系统。
+
+【你的身份】
+- 名字：小齿
+- 定位：牙科修复术后护理专家
+- 服务对象：接受牙科修复治疗（种植牙、固定义齿、活动义齿等）的患者
+- 服务时间：7×24 小时在线
+
+【回答风格】
+1. 亲切友好：像温暖的牙科护士一样，语气温和、有同理心
+2. 专业可靠：基于权威医学知识，不提供未经证实的建议
+3. 简洁明了：用患者能听懂的话，避免过多专业术语
+4. 回复长度：根据问题复杂度灵活调整，确保信息完整
+
+【回答格式要求 - 必须遵守】
+1. 字数：简单问题 100-150 字，复杂问题 200-300 字，确保信息完整不遗漏
+2. 格式：使用简单段落，不要用标题、分点、序号
+3. 风格：像医生面对面说话一样自然
+4. 结尾：不要追问"请问您..."，直接给出建议即可
+5. 自称：可以使用"我"或"小齿"，不要用"本系统"
+6. 完整性：重要信息不要省略，必要时可以详细说明
+
+【对话场景识别】
+- 术后咨询：提供护理建议、注意事项
+- 复诊提醒：告知复诊时间、复诊前准备
+- 症状咨询：判断是否正常、何时需要就医
+- 日常护理：刷牙、饮食、清洁建议
+- 告别场景：用户说"谢谢/好的/知道了"等，回复"不客气，祝您早日康复！"
+
+【重要原则 - 关于预约复诊】
+1. 你只能查看已有的复诊计划，不能创建新的复诊预约
+2. 当用户要求"帮我预约复诊"时，直接回复："请您打电话或微信联系您的主治医生进行预约，我们会根据您的时间安排合适的复诊时间。"
+3. 不要说"已经帮您预约了"或"已经记录您的需求"等会误导用户的话
+4. 可以建议用户查看小程序中的"复诊"页面，查看已有的复诊计划
+
+【安全原则 - 必须遵守】
+1. 紧急情况（剧烈疼痛、大量出血、肿胀严重）→ 建议立即就医或联系主治医生
+2. 不提供诊断，只给一般性护理建议
+3. 个体差异问题建议咨询主治医生
+4. 不推荐具体药物品牌，只说药物类别
+5. 不替代医生的面诊和治疗建议"""
+
 
 class AIService:
     """
@@ -25,6 +76,93 @@ class AIService:
         self.max_tokens = settings.AI_MAX_TOKENS
         self.temperature = settings.AI_TEMPERATURE
         self.timeout = settings.AI_TIMEOUT_SECONDS
+        # 长连接异步客户端（由应用 lifespan 负责创建和关闭）
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    async def startup(self) -> None:
+        """
+        创建长连接 HTTP 客户端（应用启动时调用）
+
+        复用 TCP/TLS 连接并启用 HTTP/2，避免每轮对话重新握手
+        """
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.AI_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.AI_HTTP_KEEPALIVE_EXPIRY
+                ),
+                http2=settings.AI_HTTP2,
+                verify=False  # AutoDL 使用自签名证书
+            )
+
+    async def shutdown(self) -> None:
+        """关闭长连接 HTTP 客户端（应用关闭时调用）"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    async def _get_async_client(self) -> httpx.AsyncClient:
+        """获取异步客户端，未经 lifespan 初始化时按需创建"""
+        if self._async_client is None:
+            await self.startup()
+        return self._async_client
+
+    def _prepare_prompt(
+        self,
+        user_message: str,
+        patient_id: Optional[int],
+        session_id: Optional[str],
+        db: Optional[Session]
+    ) -> tuple:
+        """
+        准备模型调用所需的上下文、知识和 System Prompt
+
+        Returns:
+            (context, knowledge, system_prompt, cache_bucket)，
+            cache_bucket 为 None 表示本轮回复不使用缓存
+        """
+        # 1. 获取对话历史（从数据库）
+        context = self._get_session_context(session_id, db, max_turns=3)
+
+        # 2. 获取患者信息（如果有）
+        patient_info = self._get_patient_info(patient_id, db)
+
+        # 3. 检索相关知识（从数据库）
+        knowledge = []
+        if db:
+            knowledge = self.search_knowledge(db, user_message, limit=3)
+
+        # 4. 构建 System Prompt
+        system_prompt = self._build_system_prompt(knowledge, patient_info)
+
+        # 5. 确定回复缓存分桶
+        cache_bucket = self._cache_bucket(context, knowledge, patient_info)
+
+        return context, knowledge, system_prompt, cache_bucket
+
+    def _cache_bucket(self, context: str, knowledge: List[str], patient_info: Optional[Dict]) -> Optional[str]:
+        """
+        计算回复缓存分桶
+
+        有对话历史或过敏史时回复依赖患者个人情况，没有检索到参考知识时回复没有依据，都不使用缓存
+        """
+        if not settings.RESPONSE_CACHE_ENABLED or not self.api_url:
+            return None
+        allergy = (patient_info or {}).get("allergy_history")
+        if context or (allergy and allergy != "无") or not knowledge:
+            response_cache.record_bypass()
+            return None
+        # 只有第一条知识的前 200 字会注入提示词
+        return response_cache.bucket_key(PROMPT_TEMPLATE_VERSION, [knowledge[0][:200]])
+
+    @staticmethod
+    def _remember(cache_bucket: Optional[str], user_message: str, text: str) -> str:
+        """模型成功生成回复后写入缓存"""
+        if cache_bucket:
+            response_cache.put(cache_bucket, user_message, text)
+        return text
 
     def generate_response(
         self,
@@ -45,50 +183,243 @@ class AIService:
         Returns:
             AI 回复内容
         """
-        # 1. 获取对话历史（从数据库）
-        context = self._get_session_context(session_id, db, max_turns=3)
-        
-        # 2. 获取患者信息（如果有）
-        patient_info = self._get_patient_info(patient_id, db)
-        
-        # 3. 检索相关知识（从数据库）
-        knowledge = []
-        if db:
-            knowledge = self.search_knowledge(db, user_message, limit=3)
-        
-        # 4. 构建 System Prompt
-        system_prompt = self._build_system_prompt(knowledge, patient_info)
-        
-        # 5. 调用 AI 服务
+        context, knowledge, system_prompt, cache_bucket = self._prepare_prompt(
+            user_message, patient_id, session_id, db
+        )
+        if cache_bucket:
+            cached = response_cache.get(cache_bucket, user_message)
+            if cached is not None:
+                return cached
+
+        # 调用 AI 服务
         if self.api_url and self.service_type == "autodl":
-            return self._call_autodl_api(user_message, system_prompt, context)
+            return self._call_autodl_api(user_message, system_prompt, context, cache_bucket)
         elif self.api_url:
-            return self._call_llm_api(system_prompt, user_message)
+            return self._call_llm_api(system_prompt, user_message, cache_bucket)
         else:
             return self._get_fallback_response(user_message, knowledge)
 
-    def _call_autodl_api(self, user_message: str, system_prompt: str, context: str) -> str:
+    async def agenerate_response(
+        self,
+        user_message: str,
+        patient_id: Optional[int] = None,
+        session_id: Optional[str] = None,
+        db: Optional[Session] = None
+    ) -> str:
         """
-        调用 AutoDL 部署的 Qwen2.5 推理服务
+        生成 AI 回复（异步版本，不阻塞事件循环）
+
+        参数与 generate_response 相同，模型调用通过长连接异步客户端完成
         """
-        try:
-            # 构建完整的用户输入（包含对话历史）
-            if context:
-                full_prompt = f"{context}\n\n用户：{user_message}"
+        context, knowledge, system_prompt, cache_bucket = self._prepare_prompt(
+            user_message, patient_id, session_id, db
+        )
+        if cache_bucket:
+            cached = response_cache.get(cache_bucket, user_message)
+            if cached is not None:
+                return cached
+
+        if self.api_url and self.service_type == "autodl":
+            return await self._acall_autodl_api(user_message, system_prompt, context, cache_bucket)
+        elif self.api_url:
+            return await self._acall_llm_api(system_prompt, user_message, cache_bucket)
+        else:
+            return self._get_fallback_response(user_message, knowledge)
+
+    async def astream_response(
+        self,
+        user_message: str,
+        patient_id: Optional[int] = None,
+        session_id: Optional[str] = None,
+        db: Optional[Session] = None
+    ) -> AsyncIterator[Dict[str, str]]:
+        """
+        流式生成 AI 回复
+
+        依次产出 {"delta": 文本片段} 事件，最后产出一次 {"text": 完整回复}，
+        完整回复已经过后处理，用于保存对话记录
+
+        Args:
+            user_message: 用户消息
+            patient_id: 患者 ID
+            session_id: 会话 ID
+            db: 数据库会话
+        """
+        context, knowledge, system_prompt, cache_bucket = self._prepare_prompt(
+            user_message, patient_id, session_id, db
+        )
+        if cache_bucket:
+            cached = response_cache.get(cache_bucket, user_message)
+            if cached is not None:
+                yield {"delta": cached}
+                yield {"text": cached}
+                return
+
+        if not (self.api_url and self.service_type == "autodl"):
+            # 非流式后端：一次性返回完整回复
+            if self.api_url:
+                text = await self._acall_llm_api(system_prompt, user_message, cache_bucket)
             else:
-                full_prompt = user_message
+                text = self._get_fallback_response(user_message, knowledge)
+            yield {"delta": text}
+            yield {"text": text}
+            return
+
+        chunks: List[str] = []
+        interrupted = False
+        try:
+            api_url = self._autodl_url() + "/stream"
+            payload = self._build_autodl_payload(user_message, system_prompt, context)
+            logger.info(f"Streaming from AutoDL API: {api_url}")
+
+            client = await self._get_async_client()
+            async with client.stream(
+                "POST",
+                api_url,
+                json=payload,
+                headers={"Accept": "text/event-stream"}
+            ) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    event = json.loads(data)
+                    if event.get("error"):
+                        raise Exception(event["error"])
+                    delta = event.get("text", "")
+                    if delta:
+                        chunks.append(delta)
+                        yield {"delta": delta}
+        except Exception as e:
+            if not chunks:
+                text = self._autodl_error_message(e)
+                yield {"delta": text}
+                yield {"text": text}
+                return
+            logger.error(f"AutoDL stream interrupted: {e}")
+            interrupted = True
+
+        if not chunks:
+            text = self._get_fallback_response(user_message)
+        elif interrupted:
+            # 中断的回复不完整，不写入缓存
+            text = self._post_process_response("".join(chunks))
+        else:
+            text = self._remember(cache_bucket, user_message, self._post_process_response("".join(chunks)))
+        yield {"text": text}
+
+    def _autodl_url(self) -> str:
+        """确保 API URL 以 /generate 结尾"""
+        api_url = self.api_url
+        if not api_url.endswith("/generate"):
+            api_url = api_url.rstrip("/") + "/generate"
+        return api_url
+
+    def _build_autodl_payload(self, user_message: str, system_prompt: str, context: str) -> Dict[str, Any]:
+        """
+        构建 AutoDL 推理服务请求体
+        """
+        # 构建完整的用户输入（包含对话历史）
+        if context:
+            full_prompt = f"{context}\n\n用户：{user_message}"
+        else:
+            full_prompt = user_message
 
-            # 添加强制约束指令
-            constraint = """
+        # 添加强制约束指令
+        constraint = """
 （注意：回答必须简短，80 字以内，不要追问问题，不要使用标题和分点格式）"""
 
-            # 确保 API URL 以 /generate 结尾
-            api_url = self.api_url
-            if not api_url.endswith("/generate"):
-                api_url = api_url.rstrip("/") + "/generate"
+        return {
+            "prompt": full_prompt + constraint,
+            "system_prompt": system_prompt,
+            "max_tokens": 500,  # 增加 max_tokens 允许更长回复
+            "temperature": 0.5,
+            # 人设部分固定不变，推理服务复用其前缀 KV 缓存，只预填充后面的可变部分
+            "system_prefix_chars": len(BASE_SYSTEM_PROMPT) if (system_prompt or "").startswith(BASE_SYSTEM_PROMPT) else None
+        }
+
+    def _parse_autodl_response(self, response: httpx.Response, user_message: str,
+                               cache_bucket: Optional[str] = None) -> str:
+        """
+        解析 AutoDL 推理服务响应
+        """
+        logger.info(f"Response status: {response.status_code}")
+        logger.info(f"Response content: {response.text[:200] if response.text else 'empty'}")
+
+        if response.status_code == 404:
+            logger.error(f"404 Error - URL may be incorrect. Current URL: {response.request.url}")
+            raise Exception(f"AI 服务地址错误：{response.request.url}")
+
+        response.raise_for_status()
+        result = response.json()
+        logger.info(f"Response data keys: {list(result.keys()) if isinstance(result, dict) else 'Not dict'}")
+
+        text = result.get("text", "")
+        if not text:
+            text = result.get("response", "")
+        if text:
+            # 后处理：截断过长回复
+            return self._remember(cache_bucket, user_message, self._post_process_response(text))
+        return self._get_fallback_response(user_message)
+
+    def _autodl_error_message(self, e: Exception) -> str:
+        """
+        将 AutoDL 调用异常转换为面向患者的提示语
+        """
+        if isinstance(e, httpx.HTTPStatusError):
+            logger.error(f"HTTP Status Error: {e}")
+            logger.error(f"Response: {e.response.text if hasattr(e.response, 'text') else 'N/A'}")
+            return f"抱歉，AI 服务响应异常（{e.response.status_code}），请稍后再试。"
+        if isinstance(e, httpx.ConnectError):
+            logger.error(f"Connect Error: {e}")
+            return "抱歉，无法连接到 AI 服务，请检查网络或服务状态。"
+        if isinstance(e, httpx.TimeoutException):
+            logger.error(f"Timeout Error: {e}")
+            return "抱歉，AI 服务响应超时，请稍后再试。"
+        logger.error(f"AutoDL API error: {e}")
+        return f"抱歉，AI 服务出现错误：{str(e)[:50]}"
+
+    async def _acall_autodl_api(self, user_message: str, system_prompt: str, context: str,
+                                cache_bucket: Optional[str] = None) -> str:
+        """
+        调用 AutoDL 部署的 Qwen2.5 推理服务（异步，复用长连接）
+        """
+        try:
+            api_url = self._autodl_url()
+            payload = self._build_autodl_payload(user_message, system_prompt, context)
 
             logger.info(f"Calling AutoDL API: {api_url}")
-            logger.info(f"Request prompt: {full_prompt[:100]}...")
+            logger.info(f"Request prompt: {payload['prompt'][:100]}...")
+
+            client = await self._get_async_client()
+            response = await client.post(
+                api_url,
+                json=payload,
+                headers={
+                    "Content-Type": "application/json",
+                    "Accept": "application/json"
+                }
+            )
+            return self._parse_autodl_response(response, user_message, cache_bucket)
+        except Exception as e:
+            return self._autodl_error_message(e)
+
+    def _call_autodl_api(self, user_message: str, system_prompt: str, context: str,
+                         cache_bucket: Optional[str] = None) -> str:
+        """
+        调用 AutoDL 部署的 Qwen2.5 推理服务
+        """
+        try:
+            api_url = self._autodl_url()
+            payload = self._build_autodl_payload(user_message, system_prompt, context)
+
+            logger.info(f"Calling AutoDL API: {api_url}")
+            logger.info(f"Request prompt: {payload['prompt'][:100]}...")
 
             # 使用 httpx 客户端，禁用 SSL 验证（AutoDL 使用自签名证书）
             with httpx.Client(
@@ -97,50 +428,16 @@ class AIService:
             ) as client:
                 response = client.post(
                     api_url,
-                    json={
-                        "prompt": full_prompt + constraint,
-                        "system_prompt": system_prompt,
-                        "max_tokens": 500,  # 增加 max_tokens 允许更长回复
-                        "temperature": 0.5
-                    },
+                    json=payload,
                     headers={
                         "Content-Type": "application/json",
                         "Accept": "application/json"
                     }
                 )
+                return self._parse_autodl_response(response, user_message, cache_bucket)
 
-                logger.info(f"Response status: {response.status_code}")
-                logger.info(f"Response content: {response.text[:200] if response.text else 'empty'}")
-
-                if response.status_code == 404:
-                    logger.error(f"404 Error - URL may be incorrect. Current URL: {api_url}")
-                    raise Exception(f"AI 服务地址错误：{api_url}")
-
-                response.raise_for_status()
-                result = response.json()
-                logger.info(f"Response data keys: {list(result.keys()) if isinstance(result, dict) else 'Not dict'}")
-
-                text = result.get("text", "")
-                if not text:
-                    text = result.get("response", "")
-                if text:
-                    # 后处理：截断过长回复
-                    return self._post_process_response(text)
-                return self._get_fallback_response(user_message)
-
-        except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP Status Error: {e}")
-            logger.error(f"Response: {e.response.text if hasattr(e.response, 'text') else 'N/A'}")
-            return f"抱歉，AI 服务响应异常（{e.response.status_code}），请稍后再试。"
-        except httpx.ConnectError as e:
-            logger.error(f"Connect Error: {e}")
-            return "抱歉，无法连接到 AI 服务，请检查网络或服务状态。"
-        except httpx.TimeoutException as e:
-            logger.error(f"Timeout Error: {e}")
-            return "抱歉，AI 服务响应超时，请稍后再试。"
         except Exception as e:
-            logger.error(f"AutoDL API error: {e}")
-            return f"抱歉，AI 服务出现错误：{str(e)[:50]}"
+            return self._autodl_error_message(e)
 
     def _post_process_response(self, text: str) -> str:
         """
@@ -190,13 +487,48 @@ class AIService:
 
         return text.strip()
 
-    def _call_llm_api(self, system_prompt: str, user_prompt: str) -> str:
+    def _build_llm_payload(self, system_prompt: str, user_prompt: str) -> Dict[str, Any]:
+        """构建通用大模型 API 请求体"""
+        return {
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature
+        }
+
+    def _parse_llm_result(self, result: Dict[str, Any], user_prompt: str, cache_bucket: Optional[str] = None) -> str:
+        """解析通用大模型 API 响应"""
+        text = result.get("response", result.get("choices", [{}])[0].get("message", {}).get("content"))
+        if not text:
+            return "抱歉，我暂时无法回答您的问题。"
+        return self._remember(cache_bucket, user_prompt, text)
+
+    async def _acall_llm_api(self, system_prompt: str, user_prompt: str, cache_bucket: Optional[str] = None) -> str:
+        """
+        调用大模型 API（通用格式，异步，复用长连接）
+        """
+        try:
+            client = await self._get_async_client()
+            response = await client.post(
+                self.api_url,
+                json=self._build_llm_payload(system_prompt, user_prompt)
+            )
+            response.raise_for_status()
+            return self._parse_llm_result(response.json(), user_prompt, cache_bucket)
+        except Exception as e:
+            logger.error(f"AI API call error: {e}")
+            return "抱歉，系统暂时无法连接 AI 服务，请稍后再试。"
+
+    def _call_llm_api(self, system_prompt: str, user_prompt: str, cache_bucket: Optional[str] = None) -> str:
         """
         调用大模型 API（通用格式）
 
         Args:
             system_prompt: 系统提示词
             user_prompt: 用户消息
+            cache_bucket: 回复缓存分桶（为 None 时不缓存）
 
         Returns:
             AI 回复内容
@@ -205,18 +537,10 @@ class AIService:
             with httpx.Client(timeout=self.timeout) as client:
                 response = client.post(
                     self.api_url,
-                    json={
-                        "messages": [
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_prompt}
-                        ],
-                        "max_tokens": self.max_tokens,
-                        "temperature": self.temperature
-                    }
+                    json=self._build_llm_payload(system_prompt, user_prompt)
                 )
                 response.raise_for_status()
-                result = response.json()
-                return result.get("response", result.get("choices", [{}])[0].get("message", {}).get("content", "抱歉，我暂时无法回答您的问题。"))
+                return self._parse_llm_result(response.json(), user_prompt, cache_bucket)
         except Exception as e:
             logger.error(f"AI API call error: {e}")
             return "抱歉，系统暂时无法连接 AI 服务，请稍后再试。"
@@ -232,47 +556,7 @@ class AIService:
         Returns:
             System Prompt 字符串
         """
-        base_prompt = """你叫小齿，是一名专业的牙科修复 AI 智能客服助手，服务于牙科修复复诊提醒与管理系统。
-
-【你的身份】
-- 名字：小齿
-- 定位：牙科修复术后护理专家
-- 服务对象：接受牙科修复治疗（种植牙、固定义齿、活动义齿等）的患者
-- 服务时间：7×24 小时在线
-
-【回答风格】
-1. 亲切友好：像温暖的牙科护士一样，语气温和、有同理心
-2. 专业可靠：基于权威医学知识，不提供未经证实的建议
-3. 简洁明了：用患者能听懂的话，避免过多专业术语
-4. 回复长度：根据问题复杂度灵活调整，确保信息完整
-
-【回答格式要求 - 必须遵守】
-1. 字数：简单问题 100-150 字，复杂问题 200-300 字，确保信息完整不遗漏
-2. 格式：使用简单段落，不要用标题、分点、序号
-3. 风格：像医生面对面说话一样自然
-4. 结尾：不要追问"请问您..."，直接给出建议即可
-5. 自称：可以使用"我"或"小齿"，不要用"本系统"
-6. 完整性：重要信息不要省略，必要时可以详细说明
-
-【对话场景识别】
-- 术后咨询：提供护理建议、注意事项
-- 复诊提醒：告知复诊时间、复诊前准备
-- 症状咨询：判断是否正常、何时需要就医
-- 日常护理：刷牙、饮食、清洁建议
-- 告别场景：用户说"谢谢/好的/知道了"等，回复"不客气，祝您早日康复！"
-
-【重要原则 - 关于预约复诊】
-1. 你只能查看已有的复诊计划，不能创建新的复诊预约
-2. 当用户要求"帮我预约复诊"时，直接回复："请您打电话或微信联系您的主治医生进行预约，我们会根据您的时间安排合适的复诊时间。"
-3. 不要说"已经帮您预约了"或"已经记录您的需求"等会误导用户的话
-4. 可以建议用户查看小程序中的"复诊"页面，查看已有的复诊计划
-
-【安全原则 - 必须遵守】
-1. 紧急情况（剧烈疼痛、大量出血、肿胀严重）→ 建议立即就医或联系主治医生
-2. 不提供诊断，只给一般性护理建议
-3. 个体差异问题建议咨询主治医生
-4. 不推荐具体药物品牌，只说药物类别
-5. 不替代医生的面诊和治疗建议"""
+        base_prompt = BASE_SYSTEM_PROMPT
 
         # 添加知识片段（精简版）
         if knowledge:
@@ -288,8 +572,10 @@ class AIService:
 
     def _get_session_context(self, session_id: Optional[str], db: Optional[Session] = None, max_turns: int = 3) -> str:
         """
-        从数据库获取会话历史上下文（不依赖 Redis）
-        
+        获取会话历史上下文
+
+        优先读 Redis，Redis 不可用时读进程内缓存，都未命中时才查询数据库（见 SessionStore）
+
         Args:
             session_id: 会话 ID
             db: 数据库会话
@@ -298,27 +584,15 @@ class AIService:
         Returns:
             格式化的对话历史字符串
         """
-        if not session_id or not db:
+        turns = session_store.recent(session_id, db, max_turns=max_turns)
+        if not turns:
             return ""
-        
-        from ..models.dialogue import Dialogue
-        
-        # 从数据库查询最近 N 轮对话
-        dialogues = db.query(Dialogue).filter(
-            Dialogue.session_id == session_id
-        ).order_by(Dialogue.created_at.desc()).limit(max_turns).all()
-        
-        if not dialogues:
-            return ""
-        
-        # 反转顺序（从旧到新）
-        dialogues = list(reversed(dialogues))
-        
-        # 格式化为对话历史
+
+        # 格式化为对话历史（从旧到新）
         context_parts = []
-        for d in dialogues:
-            context_parts.append(f"用户：{d.user_message}")
-            context_parts.append(f"AI: {d.ai_response}")
+        for turn in turns:
+            context_parts.append(f"用户：{turn['user_message']}")
+            context_parts.append(f"AI: {turn['ai_response']}")
         
         return "\n".join(context_parts)
 
@@ -350,6 +624,71 @@ class AIService:
             "allergy_history": patient.allergy_history
         }
 
+    def search_knowledge_scored(self, db: Session, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        按相关度检索知识（使用内存索引）
+
+        配置了向量索引时为混合检索：BM25 与向量检索结果按倒数排名融合（RRF）
+
+        Args:
+            db: 数据库会话（仅用于检查索引是否需要刷新）
+            query: 查询文本，无需空格分词
+            limit: 返回数量限制
+
+        Returns:
+            [{"id", "title", "content", "score", "bm25", "cosine"}]，按 score 降序；
+            索引未加载时返回空列表
+        """
+        if not knowledge_index.loaded:
+            return []
+        knowledge_index.ensure_fresh(db)
+
+        # 相关度门槛按查询的得分上限换算，短问题与长问句使用同一比例
+        min_score = settings.KNOWLEDGE_MIN_SCORE_RATIO * knowledge_index.max_score(query)
+        bm25 = {
+            knowledge_id: score
+            for knowledge_id, score in knowledge_index.rank(query, limit=limit)
+            if score >= min_score
+        }
+
+        cosine = {}
+        vectors = get_vector_index()
+        if vectors is not None:
+            for key, similarity in vectors.search(query, limit=limit):
+                knowledge_id = knowledge_index.id_for_key(key)
+                if knowledge_id is not None and similarity >= settings.KNOWLEDGE_VECTOR_MIN_SCORE:
+                    cosine.setdefault(knowledge_id, round(similarity, 4))
+
+        if cosine:
+            scores = self._rrf_fuse([list(bm25), list(cosine)], k=settings.KNOWLEDGE_RRF_K)
+        else:
+            scores = bm25
+
+        results = []
+        for knowledge_id in sorted(scores, key=scores.get, reverse=True)[:limit]:
+            doc = knowledge_index.get(knowledge_id)
+            if doc:
+                results.append({
+                    "id": knowledge_id,
+                    "title": doc["title"],
+                    "content": doc["content"],
+                    "score": scores[knowledge_id],
+                    "bm25": bm25.get(knowledge_id),
+                    "cosine": cosine.get(knowledge_id)
+                })
+        return results
+
+    @staticmethod
+    def _rrf_fuse(rankings: List[List[int]], k: int = 60) -> Dict[int, float]:
+        """
+        倒数排名融合：score = Σ 1 / (k + rank)，不依赖各路得分的量纲
+        """
+        scores: Dict[int, float] = {}
+        for ranking in rankings:
+            for rank, knowledge_id in enumerate(ranking, start=1):
+                scores[knowledge_id] = scores.get(knowledge_id, 0.0) + 1.0 / (k + rank)
+        return {knowledge_id: round(score, 6) for knowledge_id, score in scores.items()}
+
     def search_knowledge(self, db: Session, query: str, limit: int = 5) -> List[str]:
         """
         检索相关知识
@@ -360,15 +699,19 @@ class AIService:
             limit: 返回数量限制
 
         Returns:
-            知识内容列表
+            知识内容列表（按相关度排序）
         """
+        # 优先使用内存索引按 BM25 排序（无需访问数据库）
+        if knowledge_index.loaded:
+            return [item["content"] for item in self.search_knowledge_scored(db, query, limit)]
+
         # 从缓存中查找
         cache_key = f"knowledge_search:{query}"
         cached_result = cache.get(cache_key)
         if cached_result:
             return cached_result
 
-        # 从数据库查询（多字段匹配）
+        # 索引未加载时从数据库查询（多字段匹配）
         keywords = [k for k in query.split() if len(k) >= 2]  # 过滤单字
         results = []
         seen_titles = set()
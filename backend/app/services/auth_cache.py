@@ -0,0 +1,119 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Tuple
+from sqlalchemy import inspect
+from ..models.user import User
+from ..config import settings
+
+
+def token_key(token: str) -> str:
+    """Token 的缓存键（SHA-256，不在内存中以明文作为键保存 Token）"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class TokenCache:
+    """
+    已验证 Token 的 LRU
+
+    - 键为 Token 的哈希，值为解码后的 payload
+    - 条目在 Token 的 exp 到期时失效，未带 exp 的 Token 最多缓存 default_ttl 秒
+    """
+
+    def __init__(self, max_entries: int = 10000, default_ttl: int = 300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Dict, float]]" = OrderedDict()
+        self._metrics = {"hits": 0, "misses": 0}
+
+    def get(self, token: str) -> Optional[Dict]:
+        key = token_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self._metrics["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._metrics["hits"] += 1
+            return entry[0]
+
+    def put(self, token: str, payload: Dict) -> None:
+        exp = payload.get("exp")
+        expires_at = float(exp) if exp is not None else time.time() + self.default_ttl
+        if expires_at <= time.time():
+            return
+        key = token_key(token)
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        metrics = dict(self._metrics)
+        metrics["entries"] = len(self._entries)
+        return metrics
+
+
+class UserCache:
+    """
+    医护用户记录的短期缓存
+
+    缓存的是与数据库会话无关的 User 副本（只含列属性），多个请求共享也不会触发延迟加载；
+    修改密码、注册用户后调用 invalidate，其他 worker 中的副本最多滞后 ttl_seconds 秒
+    """
+
+    def __init__(self, ttl_seconds: int = 30, max_entries: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[User, float]]" = OrderedDict()
+        self._metrics = {"hits": 0, "misses": 0}
+
+    def get(self, user_id: int) -> Optional[User]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self._metrics["misses"] += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self._metrics["hits"] += 1
+            return entry[0]
+
+    def put(self, user: User) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        snapshot = User(**{attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs})
+        with self._lock:
+            self._entries[user.id] = (snapshot, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        """清除某个用户（不传则清除全部）"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        metrics = dict(self._metrics)
+        metrics["entries"] = len(self._entries)
+        return metrics
+
+
+# 全局认证缓存
+token_cache = TokenCache(max_entries=settings.AUTH_TOKEN_CACHE_MAX)
+user_cache = UserCache(ttl_seconds=settings.AUTH_USER_CACHE_TTL_SECONDS, max_entries=settings.AUTH_USER_CACHE_MAX)
@@ -1,14 +1,14 @@
 from datetime import timedelta
 from sqlalchemy.orm import Session
 from ..models.user import User
-from ..utils.security import hash_password, verify_password
+from ..utils.security import ahash_password, averify_password
 from ..utils.jwt import create_access_token
 from ..config import settings
 
 
-def authenticate_user(db: Session, username: str, password: str) -> User:
+async def authenticate_user(db: Session, username: str, password: str) -> User:
     """
-    验证用户登录
+    验证用户登录（密码校验在密码哈希线程池中执行，不阻塞事件循环）
 
     Args:
         db: 数据库会话
@@ -22,13 +22,13 @@ def authenticate_user(db: Session, username: str, password: str) -> User:
     if not user:
         return None
 
-    if not verify_password(password, user.password_hash):
+    if not await averify_password(password, user.password_hash):
         return None
 
     return user
 
 
-def login_for_access_token(db: Session, username: str, password: str) -> str:
+async def login_for_access_token(db: Session, username: str, password: str) -> str:
     """
     登录并获取 Access Token
 
@@ -43,7 +43,7 @@ def login_for_access_token(db: Session, username: str, password: str) -> str:
     Raises:
         ValueError: 认证失败
     """
-    user = authenticate_user(db, username, password)
+    user = await authenticate_user(db, username, password)
     if not user:
         raise ValueError("用户名或密码错误")
 
@@ -57,10 +57,10 @@ def login_for_access_token(db: Session, username: str, password: str) -> str:
     return access_token
 
 
-def create_user(db: Session, username: str, password: str, real_name: str,
-                role: str = "doctor", phone: str = None) -> User:
+async def create_user(db: Session, username: str, password: str, real_name: str,
+                      role: str = "doctor", phone: str = None) -> User:
     """
-    创建新用户
+    创建新用户（密码哈希在密码哈希线程池中执行）
 
     Args:
         db: 数据库会话
@@ -84,7 +84,7 @@ def create_user(db: Session, username: str, password: str, real_name: str,
     # 创建用户
     user = User(
         username=username,
-        password_hash=hash_password(password),
+        password_hash=await ahash_password(password),
         real_name=real_name,
         role=role,
         phone=phone
@@ -0,0 +1,315 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+from typing import Optional, List, Dict, Callable, Tuple
+from sqlalchemy import insert, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+from ..models.dialogue import Dialogue
+from ..config import settings
+from .stats_service import record_dialogue_rows
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def reserve_dialogue_ids(db: Session, count: int) -> int:
+    """
+    从 id_sequences 表预留一段连续的对话 ID（hi/lo 分配）
+
+    以 LAST_INSERT_ID(expr) 原子地推进序列，多个 worker 并发预留互不重叠。
+    开启 DIALOGUE_WRITE_BEHIND 时写后模式与同步写入（save_dialogue）都从该序列取 ID；
+    序列值至少为 MAX(dialogues.id) + 1，兼容自增 ID 写入的已有记录
+
+    Returns:
+        预留区间的第一个 ID（区间为 [first, first + count)）
+    """
+    db.execute(text("INSERT IGNORE INTO id_sequences (name, next_id) VALUES ('dialogues', 1)"))
+    db.execute(
+        text(
+            "UPDATE id_sequences SET next_id = LAST_INSERT_ID("
+            "GREATEST(next_id, (SELECT COALESCE(MAX(id), 0) + 1 FROM dialogues)) + :count"
+            ") WHERE name = 'dialogues'"
+        ),
+        {"count": count}
+    )
+    end = db.execute(text("SELECT LAST_INSERT_ID()")).scalar()
+    db.commit()
+    return int(end) - count
+
+
+class DialogueWriter:
+    """
+    对话记录写后（write-behind）持久化
+
+    - 请求线程只分配 ID 并把记录放入有界队列，立即返回
+    - 后台任务每攒够 batch_size 条或每隔 flush_interval_ms 用一条多行 INSERT 写入
+    - 队列满时 submit 等待，数据库变慢时向请求方施加背压
+    - 写入失败按指数退避重试；关闭时排空队列，仍无法写入的记录落盘，下次启动时补写
+    - 违反约束、无法写入的记录（如患者已删除）另存到 spill_path + ".rejected"，不自动补写，也不丢弃
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        batch_size: int = 100,
+        flush_interval_ms: int = 200,
+        max_queue: int = 5000,
+        id_block_size: int = 100,
+        spill_path: Optional[str] = None,
+        reserve_ids: Callable[[Session, int], int] = reserve_dialogue_ids
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_queue = max_queue
+        self.id_block_size = id_block_size
+        self.spill_path = spill_path
+        self.reserve_ids = reserve_ids
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._id_lock: Optional[asyncio.Lock] = None
+        self._next_id = 0
+        self._block_end = 0
+        self._stopping = False
+        self._spilling = False
+        self._metrics = {
+            "submitted": 0, "flushed": 0, "batches": 0, "max_batch": 0,
+            "retries": 0, "rejected": 0, "dropped": 0, "spilled": 0, "backpressure_waits": 0
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        """启动后台写入任务（先补写上次关闭时落盘的记录）"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._id_lock = asyncio.Lock()
+        self._stopping = False
+        self._spilling = False
+        await self._replay_spill()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台任务：排空队列后返回"""
+        if not self.running:
+            return
+        self._stopping = True
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(
+        self,
+        patient_id: int,
+        session_id: str,
+        user_message: str,
+        ai_response: str,
+        message_type: str = "consultation"
+    ) -> Dict:
+        """
+        提交一条对话记录
+
+        Returns:
+            对话记录字典（含预分配的 ID），字段与 DialogueResponse 一致
+        """
+        if not self.running or self._stopping:
+            raise RuntimeError("对话写入任务未运行")
+        row = {
+            "id": await self._allocate_id(),
+            "patient_id": patient_id,
+            "session_id": session_id,
+            "user_message": user_message,
+            "ai_response": ai_response,
+            "message_type": message_type or "consultation",
+            "is_handover": 0,
+            "created_at": datetime.now(),
+        }
+        if self._queue.full():
+            self._metrics["backpressure_waits"] += 1
+        # 队列满时在此等待（背压）
+        await self._queue.put(row)
+        self._metrics["submitted"] += 1
+        return row
+
+    async def _allocate_id(self) -> int:
+        async with self._id_lock:
+            if self._next_id >= self._block_end:
+                first = await asyncio.to_thread(self._reserve_block)
+                self._next_id, self._block_end = first, first + self.id_block_size
+            dialogue_id = self._next_id
+            self._next_id += 1
+            return dialogue_id
+
+    def _reserve_block(self) -> int:
+        db = self.session_factory()
+        try:
+            return self.reserve_ids(db, self.id_block_size)
+        finally:
+            db.close()
+
+    # ========== 后台写入 ==========
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            row = await self._queue.get()
+            if row is None:
+                return
+            batch = [row]
+            deadline = loop.time() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                getter = asyncio.ensure_future(self._queue.get())
+                done, _ = await asyncio.wait({getter}, timeout=timeout)
+                if not done:
+                    getter.cancel()
+                    break
+                row = getter.result()
+                if row is None:
+                    stop = True
+                    break
+                batch.append(row)
+
+            await self._flush_with_retry(batch)
+            if stop:
+                return
+
+    async def _flush_with_retry(self, rows: List[Dict]) -> None:
+        attempt = 0
+        while True:
+            if self._spilling:
+                self._spill(rows)
+                return
+            try:
+                inserted, rejected = await asyncio.to_thread(self._flush, rows)
+            except Exception as e:
+                attempt += 1
+                self._metrics["retries"] += 1
+                logger.warning(f"Dialogue flush failed (attempt {attempt}, {len(rows)} rows): {e}")
+                if self._stopping and attempt >= 3:
+                    # 关闭时数据库仍不可用：剩余记录全部落盘
+                    self._spilling = True
+                    continue
+                await asyncio.sleep(min(0.1 * 2 ** attempt, 5.0))
+                continue
+            self._metrics["flushed"] += inserted
+            self._reject(rejected)
+            self._metrics["batches"] += 1
+            self._metrics["max_batch"] = max(self._metrics["max_batch"], len(rows))
+            return
+
+    def _flush(self, rows: List[Dict]) -> Tuple[int, List[Dict]]:
+        """
+        一条多行 INSERT 写入一批记录
+
+        违反约束时（如患者已删除、补写时 ID 已存在）逐条写入，找出无法写入的记录
+
+        Returns:
+            (写入条数, 无法写入的记录)
+        """
+        db = self.session_factory()
+        try:
+            try:
+                db.execute(insert(Dialogue.__table__).values(rows))
+                record_dialogue_rows(db, rows)
+                db.commit()
+                return len(rows), []
+            except IntegrityError:
+                db.rollback()
+
+            inserted, rejected = 0, []
+            for row in rows:
+                try:
+                    db.execute(insert(Dialogue.__table__).values(row))
+                    record_dialogue_rows(db, [row])
+                    db.commit()
+                    inserted += 1
+                except IntegrityError as e:
+                    db.rollback()
+                    logger.warning(f"Dialogue {row['id']} rejected: {e.orig}")
+                    rejected.append(row)
+            return inserted, rejected
+        finally:
+            db.close()
+
+    # ========== 落盘与补写 ==========
+
+    @staticmethod
+    def _dump(rows: List[Dict]) -> List[str]:
+        return [json.dumps(dict(row, created_at=row["created_at"].isoformat()), ensure_ascii=False) for row in rows]
+
+    @staticmethod
+    def _append_lines(path: str, lines: List[str]) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for line in lines:
+                f.write(line + "\n")
+
+    def _spill(self, rows: List[Dict]) -> None:
+        if not self.spill_path:
+            self._metrics["dropped"] += len(rows)
+            logger.error(f"Dialogue write-behind: {len(rows)} rows lost (no spill path)")
+            return
+        self._append_lines(self.spill_path, self._dump(rows))
+        self._metrics["spilled"] += len(rows)
+        logger.warning(f"Dialogue write-behind: {len(rows)} rows spilled to {self.spill_path}")
+
+    def _reject(self, rows: List[Dict]) -> None:
+        """保存无法写入的记录（ID 已返回给客户端，需人工处理）"""
+        if not rows:
+            return
+        self._metrics["rejected"] += len(rows)
+        lines = self._dump(rows)
+        if not self.spill_path:
+            # 没有落盘路径时把完整记录写入错误日志
+            for line in lines:
+                logger.error(f"Dialogue write-behind: rejected row {line}")
+            return
+        path = self.spill_path + ".rejected"
+        self._append_lines(path, lines)
+        logger.error(f"Dialogue write-behind: {len(rows)} rejected rows saved to {path}")
+
+    async def _replay_spill(self) -> None:
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        with open(self.spill_path, "r", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        for row in rows:
+            row["created_at"] = datetime.fromisoformat(row["created_at"])
+        try:
+            for start in range(0, len(rows), self.batch_size):
+                inserted, rejected = await asyncio.to_thread(self._flush, rows[start:start + self.batch_size])
+                self._metrics["flushed"] += inserted
+                self._reject(rejected)
+        except Exception as e:
+            # 数据库仍不可用：保留文件，下次启动再补写
+            logger.warning(f"Dialogue spill replay failed, keeping {self.spill_path}: {e}")
+            return
+        os.remove(self.spill_path)
+        logger.info(f"Dialogue write-behind: replayed {len(rows)} spilled rows")
+
+    def stats(self) -> Dict:
+        """写入统计"""
+        metrics = dict(self._metrics)
+        metrics["enabled"] = self.running
+        metrics["queue_depth"] = self._queue.qsize() if self._queue is not None else 0
+        return metrics
+
+
+# 全局对话写入器（DIALOGUE_WRITE_BEHIND 开启时在应用启动时运行）
+dialogue_writer = DialogueWriter(
+    batch_size=settings.DIALOGUE_FLUSH_BATCH_SIZE,
+    flush_interval_ms=settings.DIALOGUE_FLUSH_INTERVAL_MS,
+    max_queue=settings.DIALOGUE_QUEUE_MAX,
+    id_block_size=settings.DIALOGUE_ID_BLOCK_SIZE,
+    spill_path=settings.DIALOGUE_SPILL_PATH
+)
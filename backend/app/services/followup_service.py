@@ -0,0 +1,144 @@
+"""
+复诊计划批量生成
+
+按治疗类型模板把一次治疗展开为完整的复诊序列（与 AI 客服兜底回复中的常规复诊时间一致）：
+- 种植义齿修复：术后 7 天拆线，3 个月二期手术（3-6 个月内）
+- 固定义齿修复：戴牙后 1 周、1 个月、3 个月复查
+- 活动义齿修复：初戴后 1 周、1 个月复查
+
+一次请求内：患者 ID 用一条 IN 查询校验，全部复诊计划在同一事务中批量插入，
+生成的 ID 直接取自插入语句（RETURNING 或 LAST_INSERT_ID），再按主键读回完整的行
+"""
+import calendar
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Tuple
+from sqlalchemy import Table, insert, select, text
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+from ..models.appointment import Appointment
+from ..models.patient import Patient
+from .stats_service import record_appointment_rows
+
+# 治疗类型 → [(复诊类型, 间隔天数, 间隔月数, 备注)]
+FOLLOWUP_TEMPLATES: Dict[str, List[Tuple[str, int, int, str]]] = {
+    "种植义齿修复": [
+        ("种植牙术后拆线", 7, 0, "术后 7 天拆线"),
+        ("种植二期手术", 0, 3, "术后 3-6 个月进行二期手术，请根据骨结合情况调整"),
+    ],
+    "固定义齿修复": [
+        ("固定义齿 1 周复查", 7, 0, "戴牙后 1 周复查"),
+        ("固定义齿 1 个月复查", 0, 1, "戴牙后 1 个月复查"),
+        ("固定义齿 3 个月复查", 0, 3, "戴牙后 3 个月复查"),
+    ],
+    "活动义齿修复": [
+        ("活动义齿 1 周复查", 7, 0, "初戴后 1 周复查"),
+        ("活动义齿 1 个月复查", 0, 1, "初戴后 1 个月复查"),
+    ],
+}
+
+# MySQL 多行 INSERT 分配的自增 ID 是否连续（进程内首次使用时查询一次）
+_consecutive_auto_increment: Optional[bool] = None
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    """加若干个月，目标月份没有该日期时取月末"""
+    month = value.year * 12 + value.month - 1 + months
+    year, month = month // 12, month % 12 + 1
+    return value.replace(year=year, month=month, day=min(value.day, calendar.monthrange(year, month)[1]))
+
+
+def expand_template(treatment_type: str, treatment_date: datetime) -> List[Dict]:
+    """
+    把一次治疗展开为复诊计划（复诊时间沿用治疗当天的时刻）
+
+    Raises:
+        ValueError: 没有该治疗类型的模板
+    """
+    template = FOLLOWUP_TEMPLATES.get(treatment_type)
+    if template is None:
+        raise ValueError(f"没有该治疗类型的复诊模板：{treatment_type}")
+    return [
+        {
+            "appointment_date": _add_months(treatment_date + timedelta(days=days), months),
+            "appointment_type": appointment_type,
+            "notes": notes,
+        }
+        for appointment_type, days, months, notes in template
+    ]
+
+
+def create_followup_plans(db: Session, items: List[Dict]) -> List[Row]:
+    """
+    批量生成复诊计划
+
+    Args:
+        items: [{"patient_id", "treatment_type", "treatment_date", "notes"（可选，追加到每条备注）}]
+
+    Returns:
+        已插入的复诊计划（含 ID 的完整行，顺序与请求一致）
+
+    Raises:
+        LookupError: 存在不存在的患者（args[0] 为缺失的 ID 列表）
+        ValueError: 治疗类型没有模板
+    """
+    patient_ids = {item["patient_id"] for item in items}
+    found = {
+        row.id for row in db.query(Patient.id).filter(Patient.id.in_(patient_ids)).all()
+    }
+    missing = sorted(patient_ids - found)
+    if missing:
+        raise LookupError(missing)
+
+    now = datetime.now()
+    rows = []
+    for item in items:
+        for plan in expand_template(item["treatment_type"], item["treatment_date"]):
+            if item.get("notes"):
+                plan["notes"] = f"{plan['notes']}；{item['notes']}"
+            rows.append({
+                **plan,
+                "patient_id": item["patient_id"],
+                "status": "pending",
+                "reminder_sent": 0,
+                "created_at": now,
+                "updated_at": now,
+            })
+    if not rows:
+        return []
+
+    # 批量插入并取得按行顺序的 ID，汇总表在同一事务中更新
+    table = Appointment.__table__
+    ids = _insert_returning_ids(db, table, rows)
+    record_appointment_rows(db, rows)
+    created = {row.id: row for row in db.execute(select(table).where(table.c.id.in_(ids)))}
+    db.commit()
+    return [created[appointment_id] for appointment_id in ids]
+
+
+def _insert_returning_ids(db: Session, table: Table, rows: List[Dict]) -> List[int]:
+    """
+    插入多行，返回与 rows 顺序一致的自增 ID
+
+    - 支持 executemany RETURNING 的数据库（SQLite、MariaDB）：插入时直接返回 ID
+    - MySQL：innodb_autoinc_lock_mode ≤ 1 且 auto_increment_increment = 1 时，一条多行 INSERT
+      分配的 ID 连续，LAST_INSERT_ID() 为第一行的 ID；否则（如 MySQL 8 默认的 interleaved 模式）
+      并发插入的 ID 可能交错，逐行插入取 ID
+    """
+    dialect = db.get_bind().dialect
+    if dialect.insert_executemany_returning_sort_by_parameter_order:
+        result = db.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows)
+        return list(result.scalars())
+    if dialect.name == "mysql" and _auto_increment_is_consecutive(db):
+        first = db.execute(insert(table).values(rows)).lastrowid
+        return list(range(first, first + len(rows)))
+    return [db.execute(insert(table), row).inserted_primary_key[0] for row in rows]
+
+
+def _auto_increment_is_consecutive(db: Session) -> bool:
+    global _consecutive_auto_increment
+    if _consecutive_auto_increment is None:
+        lock_mode, increment = db.execute(
+            text("SELECT @@innodb_autoinc_lock_mode, @@auto_increment_increment")
+        ).one()
+        _consecutive_auto_increment = int(lock_mode) <= 1 and int(increment) == 1
+    return _consecutive_auto_increment
@@ -0,0 +1,332 @@
+"""
+知识库导入
+
+- 流式解析 JSON 数组（逐个对象解码，不把整个文件读入内存），每 batch_size 条一次 executemany
+- 以 content_key（标题 + 内容指纹）识别条目，文件中重复的条目只导入一次
+- full 模式：写入影子表 knowledge_base_new，完成后用一条 RENAME TABLE 原子替换，
+  导入期间读者始终看到完整的旧知识库；内容未变的条目保留原 ID、创建时间和更新时间，
+  新条目的 ID 从原表最大 ID 之后分配；导入失败时删除影子表。
+  影子表存在期间知识库的增删改接口返回 409；替换前再次核对原表，
+  导入期间原表被其他途径修改时放弃替换（需要边导入边编辑时使用 incremental 模式）
+- incremental 模式：在原表上按指纹增量 upsert（新增插入、分类/关键词/来源变化时更新、未变化的跳过），
+  --prune 时停用文件中已不存在的条目；全部写入在同一事务中
+- 导入后重建本进程的内存检索索引；其他进程通过 KNOWLEDGE_INDEX_REFRESH_SECONDS 的版本检查自动重建
+
+命令行：
+    python -m app.services.knowledge_import ../data/knowledge/knowledge_base_v3.json [--mode incremental] [--prune]
+"""
+import argparse
+import json
+from datetime import datetime
+from typing import List, Dict, Iterator, TextIO, Tuple
+from sqlalchemy import MetaData, Table, bindparam, func, insert, inspect, text, update
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+from ..models.knowledge_base import KnowledgeBase
+from .knowledge_index import content_key, knowledge_index
+from .stats_service import data_version, mark_changed
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOURCE = "《口腔修复学》第 8 版"
+
+# 影子表与替换下来的旧表
+SHADOW_TABLE = "knowledge_base_new"
+RETIRED_TABLE = "knowledge_base_old"
+
+# 除标题和内容（指纹）之外，变化时需要更新的字段
+META_COLUMNS = ("category", "keywords", "source")
+
+
+def iter_json_array(stream: TextIO, read_size: int = 65536) -> Iterator[Dict]:
+    """
+    流式解析 JSON 数组，逐个产出元素
+
+    每次读取 read_size 个字符，用 raw_decode 解出完整的对象后丢弃已解析部分
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    eof = False
+    while True:
+        position = 0
+        while True:
+            # 跳过空白、数组起始符与分隔符
+            while position < len(buffer) and buffer[position] in " \t\r\n,[":
+                if buffer[position] == "[":
+                    started = True
+                position += 1
+            if position < len(buffer) and buffer[position] == "]":
+                return
+            if position >= len(buffer):
+                break
+            if not started:
+                raise ValueError("知识库文件必须是 JSON 数组")
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                break  # 对象不完整，继续读取
+            yield item
+            position = end
+        buffer = buffer[position:]
+        if eof:
+            if buffer.strip():
+                raise ValueError("知识库文件不完整")
+            return
+        chunk = stream.read(read_size)
+        eof = not chunk
+        buffer += chunk
+
+
+def _normalize(item: Dict) -> Dict:
+    return {
+        "category": item.get("category") or "",
+        "title": item.get("title") or "",
+        "content": item.get("content") or "",
+        "keywords": item.get("keywords") or None,
+        "source": item.get("source") or DEFAULT_SOURCE,
+    }
+
+
+def _existing(db: Session) -> Dict[str, Dict]:
+    """库中已有条目：指纹 → 行（只读取导入需要的列）"""
+    rows = db.query(
+        KnowledgeBase.id, KnowledgeBase.title, KnowledgeBase.content,
+        KnowledgeBase.category, KnowledgeBase.keywords, KnowledgeBase.source,
+        KnowledgeBase.is_active, KnowledgeBase.created_at, KnowledgeBase.updated_at
+    ).all()
+    return {content_key(row.title, row.content): row._asdict() for row in rows}
+
+
+def _table_signature(db: Session) -> Tuple:
+    """原表的修改标识（条目数、最大 ID、最近更新时间），用于发现导入期间的并发写入"""
+    return tuple(db.query(
+        func.count(KnowledgeBase.id), func.max(KnowledgeBase.id), func.max(KnowledgeBase.updated_at)
+    ).one())
+
+
+def full_import_running(db: Session) -> bool:
+    """是否有 full 模式导入正在进行（影子表存在期间写入原表的修改会在替换时丢失）"""
+    return inspect(db.connection()).has_table(SHADOW_TABLE)
+
+
+class KnowledgeImporter:
+    """
+    知识库导入器
+
+    Args:
+        batch_size: 每次 executemany 的行数
+    """
+
+    def __init__(self, db: Session, batch_size: int = 500):
+        self.db = db
+        self.batch_size = batch_size
+        self.report = {"read": 0, "duplicates": 0, "inserted": 0, "updated": 0, "unchanged": 0}
+
+    def _unique(self, items: Iterator[Dict]) -> Iterator[Tuple[str, Dict]]:
+        seen = set()
+        for item in items:
+            self.report["read"] += 1
+            row = _normalize(item)
+            key = content_key(row["title"], row["content"])
+            if key in seen:
+                self.report["duplicates"] += 1
+                continue
+            seen.add(key)
+            yield key, row
+
+    def _changed(self, old: Dict, row: Dict) -> bool:
+        return not old["is_active"] or any(old[c] != row[c] for c in META_COLUMNS)
+
+    # ========== full：影子表 + 原子替换 ==========
+
+    def full(self, items: Iterator[Dict]) -> Dict:
+        """
+        导入到影子表后原子替换 knowledge_base（失败时删除影子表，原表不变）
+
+        先创建影子表（知识库增删改接口据此拒绝写入）再读取原表；
+        替换前原表的修改标识发生变化时放弃替换并抛出 RuntimeError
+        """
+        shadow = self._create_shadow()
+        try:
+            existing = _existing(self.db)
+            signature = _table_signature(self.db)
+            self.db.commit()
+            self._fill_shadow(shadow, items, existing)
+            if _table_signature(self.db) != signature:
+                raise RuntimeError("全量导入期间知识库被修改，已放弃替换；请重新导入，或改用 incremental 模式")
+            # 文件中已不存在的条目（以及库中重复的条目）不再出现在新表中
+            self.report["removed"] = self.db.query(KnowledgeBase.id).count() - self.report["updated"] - self.report["unchanged"]
+            self._swap()
+        except Exception:
+            self.db.rollback()
+            self.db.execute(text(f"DROP TABLE IF EXISTS {SHADOW_TABLE}"))
+            self.db.commit()
+            raise
+        return self.report
+
+    def _fill_shadow(self, shadow: Table, items: Iterator[Dict], existing: Dict[str, Dict]) -> None:
+        # 新条目显式分配大于原表所有 ID 的主键：若交给影子表自增，
+        # 文件中排在前面的新条目可能占用后面保留条目的原 ID
+        next_id = max((old["id"] for old in existing.values()), default=0) + 1
+        now = datetime.now()
+        batch: List[Dict] = []
+        for key, row in self._unique(items):
+            old = existing.get(key)
+            if old is None:
+                row.update(id=next_id, is_active=1, created_at=now, updated_at=now)
+                next_id += 1
+                self.report["inserted"] += 1
+            else:
+                changed = self._changed(old, row)
+                row.update(
+                    id=old["id"], is_active=1, created_at=old["created_at"],
+                    updated_at=now if changed else old["updated_at"]
+                )
+                self.report["updated" if changed else "unchanged"] += 1
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self._insert_batch(shadow, batch)
+                batch = []
+        if batch:
+            self._insert_batch(shadow, batch)
+
+    def _create_shadow(self) -> Table:
+        shadow = KnowledgeBase.__table__.to_metadata(MetaData(), name=SHADOW_TABLE)
+        self.db.execute(text(f"DROP TABLE IF EXISTS {SHADOW_TABLE}"))
+        if self.db.get_bind().dialect.name == "mysql":
+            # 复制表结构（含索引与注释）
+            self.db.execute(text(f"CREATE TABLE {SHADOW_TABLE} LIKE {KnowledgeBase.__tablename__}"))
+        else:
+            shadow.create(self.db.connection())
+        self.db.commit()
+        return shadow
+
+    def _insert_batch(self, table: Table, rows: List[Dict]) -> None:
+        self.db.execute(insert(table), rows)
+        self.db.commit()
+
+    def _swap(self) -> None:
+        name = KnowledgeBase.__tablename__
+        self.db.execute(text(f"DROP TABLE IF EXISTS {RETIRED_TABLE}"))
+        if self.db.get_bind().dialect.name == "mysql":
+            # RENAME TABLE 一条语句交换两张表，读者不会看到中间状态
+            self.db.execute(text(
+                f"RENAME TABLE {name} TO {RETIRED_TABLE}, {SHADOW_TABLE} TO {name}"
+            ))
+        else:
+            self.db.execute(text(f"ALTER TABLE {name} RENAME TO {RETIRED_TABLE}"))
+            self.db.execute(text(f"ALTER TABLE {SHADOW_TABLE} RENAME TO {name}"))
+        self.db.execute(text(f"DROP TABLE {RETIRED_TABLE}"))
+        self.db.commit()
+
+    # ========== incremental：原表增量 upsert ==========
+
+    def incremental(self, items: Iterator[Dict], prune: bool = False) -> Dict:
+        """按内容指纹增量写入原表（同一事务）"""
+        existing = _existing(self.db)
+        table = KnowledgeBase.__table__
+        now = datetime.now()
+        seen_keys = set()
+        inserts: List[Dict] = []
+        updates: List[Dict] = []
+        for key, row in self._unique(items):
+            seen_keys.add(key)
+            old = existing.get(key)
+            if old is None:
+                inserts.append(dict(row, is_active=1, created_at=now, updated_at=now))
+                self.report["inserted"] += 1
+            elif self._changed(old, row):
+                updates.append({"knowledge_id": old["id"], **{c: row[c] for c in META_COLUMNS}, "now": now})
+                self.report["updated"] += 1
+            else:
+                self.report["unchanged"] += 1
+
+            if len(inserts) >= self.batch_size:
+                self.db.execute(insert(table), inserts)
+                inserts = []
+            if len(updates) >= self.batch_size:
+                self._update_batch(updates)
+                updates = []
+        if inserts:
+            self.db.execute(insert(table), inserts)
+        if updates:
+            self._update_batch(updates)
+
+        stale = []
+        if prune:
+            stale = [old["id"] for key, old in existing.items() if key not in seen_keys and old["is_active"]]
+            for start in range(0, len(stale), self.batch_size):
+                self.db.execute(
+                    update(table).where(table.c.id.in_(stale[start:start + self.batch_size]))
+                    .values(is_active=0, updated_at=now)
+                )
+        self.report["deactivated"] = len(stale)
+
+        if any(self.report[k] for k in ("inserted", "updated", "deactivated")):
+            mark_changed(self.db)
+        self.db.commit()
+        return self.report
+
+    def _update_batch(self, updates: List[Dict]) -> None:
+        table = KnowledgeBase.__table__
+        self.db.execute(
+            update(table).where(table.c.id == bindparam("knowledge_id")).values(
+                **{c: bindparam(c) for c in META_COLUMNS}, is_active=1, updated_at=bindparam("now")
+            ),
+            updates
+        )
+
+
+def import_knowledge(db: Session, stream: TextIO, mode: str = "full",
+                     prune: bool = False, batch_size: int = 500) -> Dict:
+    """
+    导入知识库 JSON 数组并重建内存检索索引
+
+    Args:
+        mode: full（影子表原子替换）/ incremental（原表增量 upsert）
+        prune: incremental 模式下停用文件中已不存在的条目
+
+    Returns:
+        {"read", "duplicates", "inserted", "updated", "unchanged"}，
+        另含 removed（full：新表中不再包含的条目数）或 deactivated（incremental：停用的条目数）
+    """
+    importer = KnowledgeImporter(db, batch_size=batch_size)
+    items = iter_json_array(stream)
+    if mode == "full":
+        report = importer.full(items)
+        # 替换表不经过 ORM 会话提交，直接递增统计数据版本
+        data_version.bump()
+    elif mode == "incremental":
+        report = importer.incremental(items, prune=prune)
+    else:
+        raise ValueError(f"不支持的导入模式：{mode}")
+
+    knowledge_index.load(db)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导入知识库 JSON 文件")
+    parser.add_argument("path", help="知识库 JSON 文件（如 ../data/knowledge/knowledge_base_v3.json）")
+    parser.add_argument("--mode", choices=["full", "incremental"], default="full",
+                        help="full：影子表导入后原子替换，导入期间知识库接口不可写；"
+                             "incremental：按内容指纹增量更新，可与接口写入并行")
+    parser.add_argument("--prune", action="store_true", help="incremental 模式下停用文件中已不存在的条目")
+    parser.add_argument("--batch-size", type=int, default=500, help="每次批量写入的行数")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        with open(args.path, "r", encoding="utf-8") as f:
+            report = import_knowledge(db, f, mode=args.mode, prune=args.prune, batch_size=args.batch_size)
+    finally:
+        db.close()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
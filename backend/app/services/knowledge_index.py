@@ -0,0 +1,332 @@
+import hashlib
+import heapq
+import math
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Optional, List, Dict, Set, Iterable, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from ..models.knowledge_base import KnowledgeBase
+from ..config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 按空白和标点切分文本片段（中文无空格，片段内部再切字符二元组）
+_SEGMENT_PATTERN = re.compile(r"[^\w]+", re.UNICODE)
+
+# BM25 字段权重：标题和关键词比正文更能代表条目主题
+FIELD_WEIGHTS = {"title": 3.0, "keywords": 2.0, "content": 1.0}
+
+
+def char_ngrams(text: str, n: int = 2) -> List[str]:
+    """
+    将文本切分为字符 n 元组
+
+    中文没有空格分词，使用字符二元组即可覆盖任意连续子串；
+    长度不足 n 的片段保留为单个词项
+
+    Args:
+        text: 原始文本
+        n: 元组长度
+
+    Returns:
+        n 元组列表（保留重复，顺序与原文一致）
+    """
+    grams = []
+    for segment in _SEGMENT_PATTERN.split((text or "").lower()):
+        if not segment:
+            continue
+        if len(segment) <= n:
+            grams.append(segment)
+            continue
+        grams.extend(segment[i:i + n] for i in range(len(segment) - n + 1))
+    return grams
+
+
+def content_key(title: str, content: str) -> str:
+    """
+    知识条目内容指纹（标题 + 内容的 SHA-1 前 16 位）
+
+    JSON 源文件中的条目没有数据库 ID，向量索引等离线产物用该指纹关联数据库条目
+    """
+    digest = hashlib.sha1(f"{title or ''}\n{content or ''}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class KnowledgeIndex:
+    """
+    知识库内存倒排索引
+
+    以字符二元组为词项，常驻进程内存，替代 LIKE '%kw%' 全表扫描。
+    倒排表记录各字段加权后的词频，支持 BM25 相关度排序。
+    启动时从数据库加载启用的知识条目，知识库增删改时增量更新
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._docs: Dict[int, Dict] = {}
+        # 词项 -> {条目 ID: 字段加权词频}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._doc_terms: Dict[int, Set[str]] = {}
+        # 条目 ID -> 字段加权长度，以及所有条目长度之和（用于平均长度）
+        self._doc_lengths: Dict[int, float] = {}
+        self._total_length = 0.0
+        # 内容指纹 -> 条目 ID
+        self._by_key: Dict[str, int] = {}
+        self._version: Optional[Tuple] = None
+        self._last_check = 0.0
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @staticmethod
+    def _doc_from_row(row: KnowledgeBase) -> Dict:
+        return {
+            "id": row.id,
+            "title": row.title or "",
+            "content": row.content or "",
+            "keywords": row.keywords or "",
+            "created_at": row.created_at or datetime.min,
+            "key": content_key(row.title, row.content),
+        }
+
+    @staticmethod
+    def _db_version(db: Session) -> Tuple:
+        """知识库版本标识（条目数 + 最近更新时间），用于发现其他进程的写入"""
+        count, latest = db.query(
+            func.count(KnowledgeBase.id),
+            func.max(KnowledgeBase.updated_at)
+        ).one()
+        return count, latest
+
+    def load(self, db: Session) -> int:
+        """
+        从数据库全量加载启用的知识条目并重建索引
+
+        Returns:
+            索引中的条目数
+        """
+        rows = db.query(KnowledgeBase).filter(KnowledgeBase.is_active == 1).all()
+        version = self._db_version(db)
+        self.build(self._doc_from_row(row) for row in rows)
+        with self._lock:
+            self._version = version
+            self._last_check = time.monotonic()
+        logger.info(f"Knowledge index loaded: {len(self)} entries")
+        return len(self)
+
+    def build(self, docs: Iterable[Dict]) -> None:
+        """根据条目字典重建索引（原子替换）"""
+        new_docs: Dict[int, Dict] = {}
+        new_postings: Dict[str, Dict[int, float]] = {}
+        new_doc_terms: Dict[int, Set[str]] = {}
+        new_doc_lengths: Dict[int, float] = {}
+        new_by_key: Dict[str, int] = {}
+        for doc in docs:
+            doc.setdefault("key", content_key(doc["title"], doc["content"]))
+            new_by_key[doc["key"]] = doc["id"]
+            tf, length = self._weighted_tf(doc)
+            new_docs[doc["id"]] = doc
+            new_doc_terms[doc["id"]] = set(tf)
+            new_doc_lengths[doc["id"]] = length
+            for term, freq in tf.items():
+                new_postings.setdefault(term, {})[doc["id"]] = freq
+
+        with self._lock:
+            self._docs = new_docs
+            self._postings = new_postings
+            self._doc_terms = new_doc_terms
+            self._doc_lengths = new_doc_lengths
+            self._total_length = sum(new_doc_lengths.values())
+            self._by_key = new_by_key
+            self.loaded = True
+
+    @staticmethod
+    def _weighted_tf(doc: Dict) -> Tuple[Dict[str, float], float]:
+        """
+        计算条目的字段加权词频和加权长度
+
+        Returns:
+            (词项 -> 加权词频, 加权长度)
+        """
+        tf: Dict[str, float] = {}
+        length = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            grams = char_ngrams(doc[field])
+            length += weight * len(grams)
+            for gram in grams:
+                tf[gram] = tf.get(gram, 0.0) + weight
+        return tf, length
+
+    def upsert(self, row: KnowledgeBase) -> None:
+        """
+        新增或更新单个条目（停用的条目从索引中移除）
+        """
+        if not row.is_active:
+            self.remove(row.id)
+            return
+
+        doc = self._doc_from_row(row)
+        tf, length = self._weighted_tf(doc)
+        with self._lock:
+            self._remove_locked(doc["id"])
+            self._docs[doc["id"]] = doc
+            self._by_key[doc["key"]] = doc["id"]
+            self._doc_terms[doc["id"]] = set(tf)
+            self._doc_lengths[doc["id"]] = length
+            self._total_length += length
+            for term, freq in tf.items():
+                self._postings.setdefault(term, {})[doc["id"]] = freq
+            self._version = None  # 本进程写入，下次检查时同步版本号
+
+    def remove(self, knowledge_id: int) -> None:
+        """从索引中移除单个条目"""
+        with self._lock:
+            self._remove_locked(knowledge_id)
+            self._version = None
+
+    def _remove_locked(self, knowledge_id: int) -> None:
+        doc = self._docs.pop(knowledge_id, None)
+        if doc is not None and self._by_key.get(doc["key"]) == knowledge_id:
+            del self._by_key[doc["key"]]
+        self._total_length -= self._doc_lengths.pop(knowledge_id, 0.0)
+        for term in self._doc_terms.pop(knowledge_id, ()):
+            ids = self._postings.get(term)
+            if ids is not None:
+                ids.pop(knowledge_id, None)
+                if not ids:
+                    del self._postings[term]
+
+    def ensure_fresh(self, db: Session) -> None:
+        """
+        定期检查数据库版本，发现其他进程写入时重建索引
+
+        检查间隔由 KNOWLEDGE_INDEX_REFRESH_SECONDS 控制，间隔内不访问数据库
+        """
+        now = time.monotonic()
+        if now - self._last_check < settings.KNOWLEDGE_INDEX_REFRESH_SECONDS:
+            return
+        self._last_check = now
+        try:
+            version = self._db_version(db)
+            if self._version is None:
+                self._version = version
+            elif version != self._version:
+                self.load(db)
+        except Exception as e:
+            logger.warning(f"Knowledge index refresh failed: {e}")
+
+    def search_ids(self, keyword: str) -> List[int]:
+        """
+        查找标题、关键词或内容中包含 keyword 的条目
+
+        先用二元组倒排表求交得到候选，再做子串校验，结果与 LIKE '%keyword%' 一致
+
+        Returns:
+            条目 ID 列表（按创建时间倒序）
+        """
+        keyword = (keyword or "").lower()
+        if not keyword.strip():
+            return []
+        # 不足二元组长度的片段无法走倒排表，由子串校验保证正确性
+        terms = {term for term in char_ngrams(keyword) if len(term) == 2}
+
+        with self._lock:
+            if terms:
+                postings = [self._postings.get(term) for term in terms]
+                if not all(postings):
+                    return []
+                postings.sort(key=len)
+                candidates = set(postings[0]).intersection(*postings[1:])
+                docs = [self._docs[i] for i in candidates]
+            else:
+                docs = list(self._docs.values())
+
+        matched = [
+            doc for doc in docs
+            if keyword in doc["title"].lower()
+            or keyword in doc["keywords"].lower()
+            or keyword in doc["content"].lower()
+        ]
+        matched.sort(key=lambda d: (d["created_at"], d["id"]), reverse=True)
+        return [doc["id"] for doc in matched]
+
+    def rank(self, query: str, limit: int = 5) -> List[Tuple[int, float]]:
+        """
+        BM25 相关度排序检索
+
+        查询按字符二元组切分，无需空格分词；各字段词频按 FIELD_WEIGHTS 加权
+
+        Args:
+            query: 查询文本（如"种植牙术后多久能吃饭"）
+            limit: 返回数量
+
+        Returns:
+            [(条目 ID, 得分)]，按得分降序
+        """
+        # 查询中重复的词项只计一次，避免长问句中的常见字组被放大
+        terms = set(char_ngrams(query))
+        if not terms:
+            return []
+
+        scores: Dict[int, float] = {}
+        with self._lock:
+            n_docs = len(self._docs)
+            if not n_docs:
+                return []
+            avg_length = self._total_length / n_docs or 1.0
+            k1, b = self.k1, self.b
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = self._idf(n_docs, len(postings))
+                for knowledge_id, tf in postings.items():
+                    norm = k1 * (1 - b + b * self._doc_lengths[knowledge_id] / avg_length)
+                    scores[knowledge_id] = scores.get(knowledge_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+
+        if not scores:
+            return []
+        if len(scores) > limit:
+            top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        else:
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [(knowledge_id, round(score, 4)) for knowledge_id, score in top]
+
+    @staticmethod
+    def _idf(n_docs: int, df: int) -> float:
+        return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+    def max_score(self, query: str) -> float:
+        """
+        查询可能达到的 BM25 得分上限（每个词项的 idf × (k1 + 1) 之和）
+
+        用于把得分换算为与查询长度无关的比例：短问题（如"拔牙"）得分天然偏低，
+        长问句中只命中"怎么"等常见字组的条目比例则很低
+        """
+        terms = set(char_ngrams(query))
+        with self._lock:
+            n_docs = len(self._docs)
+            if not terms or not n_docs:
+                return 0.0
+            return sum(
+                self._idf(n_docs, len(self._postings.get(term, ()))) for term in terms
+            ) * (self.k1 + 1)
+
+    def get(self, knowledge_id: int) -> Optional[Dict]:
+        """获取索引中的条目"""
+        return self._docs.get(knowledge_id)
+
+    def id_for_key(self, key: str) -> Optional[int]:
+        """根据内容指纹查找条目 ID（条目已删除或停用时返回 None）"""
+        return self._by_key.get(key)
+
+
+# 全局知识库索引实例
+knowledge_index = KnowledgeIndex()
@@ -0,0 +1,256 @@
+"""
+患者批量导入（CSV / XLSX）
+
+- 逐行流式解析，不把整个文件读入内存；XLSX 需要安装 openpyxl（只读模式逐行读取）
+- 每 chunk_size 行为一批：用 openid IN、phone IN 两条查询与库中已有患者去重，
+  PatientCreate 校验后以一条 INSERT ... ON DUPLICATE KEY UPDATE 写入，每批一个事务
+- 去重规则：
+  * openid 已存在：更新该患者
+  * 未填写 openid、手机号对应唯一的已有患者：更新该患者
+  * 手机号已被其他 openid 的患者使用，或与文件中前面的行重复：该行报错
+- 更新已有患者时只覆盖文件中有值的字段：缺少的列和空单元格保留库中原值（如既往病史、过敏史）
+- 返回逐行错误报告（行号从表头下一行的 2 开始）
+
+命令行：
+    python -m app.services.patient_import patients.xlsx [--dry-run]
+"""
+import argparse
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Optional, List, Dict, Iterator, Iterable, Tuple, Any, BinaryIO
+from pydantic import ValidationError
+from sqlalchemy import func
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+from ..models.patient import Patient
+from ..schemas.patient import PatientCreate
+from .stats_service import record_new_patients
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 表头（支持字段名或中文列名）→ 字段名
+HEADER_ALIASES = {
+    "openid": "openid", "微信标识": "openid", "微信用户标识": "openid",
+    "name": "name", "姓名": "name",
+    "gender": "gender", "性别": "gender",
+    "age": "age", "年龄": "age",
+    "phone": "phone", "手机号": "phone", "电话": "phone",
+    "medical_history": "medical_history", "既往病史": "medical_history",
+    "allergy_history": "allergy_history", "过敏史": "allergy_history",
+}
+
+# 更新已有患者时覆盖的字段（不修改 openid 与注册时间；新值为空时保留原值）
+UPDATE_COLUMNS = ("name", "gender", "age", "phone", "medical_history", "allergy_history")
+
+# 错误报告最多保留的条数
+MAX_REPORTED_ERRORS = 1000
+
+
+def _normalize_header(header: Iterable[Any]) -> List[Optional[str]]:
+    return [HEADER_ALIASES.get(str(h).strip().lower() if h is not None else "") for h in header]
+
+
+def _clean(value: Any) -> Any:
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    if isinstance(value, float) and value.is_integer():
+        # Excel 中的手机号、年龄常被存为浮点数
+        return str(int(value))
+    return value if value is None else str(value)
+
+
+def _records(header: List[Optional[str]], rows: Iterable[Iterable[Any]]) -> Iterator[Tuple[int, Dict]]:
+    for line, values in enumerate(rows, start=2):
+        record = {}
+        for field, value in zip(header, values):
+            if field is not None:
+                record[field] = _clean(value)
+        if any(v is not None for v in record.values()):
+            yield line, record
+
+
+def iter_csv(stream: BinaryIO) -> Iterator[Tuple[int, Dict]]:
+    """逐行读取 CSV（UTF-8，兼容带 BOM 的 Excel 导出）"""
+    reader = csv.reader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    header = next(reader, None)
+    if header is None:
+        return
+    yield from _records(_normalize_header(header), reader)
+
+
+def iter_xlsx(stream: BinaryIO) -> Iterator[Tuple[int, Dict]]:
+    """逐行读取 XLSX 的第一个工作表"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("导入 XLSX 文件需要先安装 openpyxl")
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        yield from _records(_normalize_header(header), rows)
+    finally:
+        workbook.close()
+
+
+def iter_records(stream: BinaryIO, filename: str) -> Iterator[Tuple[int, Dict]]:
+    """按扩展名选择解析方式"""
+    lower = filename.lower()
+    if lower.endswith(".csv"):
+        return iter_csv(stream)
+    if lower.endswith(".xlsx"):
+        return iter_xlsx(stream)
+    raise ValueError("只支持 .csv 或 .xlsx 文件")
+
+
+class PatientImporter:
+    """
+    分批导入患者
+
+    Args:
+        chunk_size: 每批行数（一次去重查询 + 一条 upsert + 一次提交）
+        dry_run: 只校验和去重，不写入
+    """
+
+    def __init__(self, db: Session, chunk_size: int = 500, dry_run: bool = False):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.report = {"total": 0, "created": 0, "updated": 0, "failed": 0, "errors": []}
+        self._seen_openids: set = set()
+        self._seen_phones: set = set()
+
+    def run(self, records: Iterable[Tuple[int, Dict]]) -> Dict:
+        chunk = []
+        for item in records:
+            chunk.append(item)
+            if len(chunk) >= self.chunk_size:
+                self._import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._import_chunk(chunk)
+        self.report["errors_truncated"] = self.report["failed"] > len(self.report["errors"])
+        return self.report
+
+    def _error(self, line: int, record: Dict, messages: List[str]) -> None:
+        self.report["failed"] += 1
+        if len(self.report["errors"]) < MAX_REPORTED_ERRORS:
+            self.report["errors"].append({"row": line, "openid": record.get("openid"), "errors": messages})
+
+    def _import_chunk(self, chunk: List[Tuple[int, Dict]]) -> None:
+        self.report["total"] += len(chunk)
+
+        # 两条批量查询：按 openid、按手机号查已有患者
+        openids = {r["openid"] for _, r in chunk if r.get("openid")}
+        phones = {r["phone"] for _, r in chunk if r.get("phone")}
+        existing_openids = {
+            row.openid for row in self.db.query(Patient.openid).filter(Patient.openid.in_(openids))
+        } if openids else set()
+        phone_owners: Dict[str, List[str]] = {}
+        if phones:
+            for row in self.db.query(Patient.phone, Patient.openid).filter(Patient.phone.in_(phones)):
+                phone_owners.setdefault(row.phone, []).append(row.openid)
+                existing_openids.add(row.openid)
+
+        rows, created_at = [], []
+        now = datetime.now()
+        for line, record in chunk:
+            phone = record.get("phone")
+            owners = phone_owners.get(phone, []) if phone else []
+            if not record.get("openid") and len(owners) == 1:
+                record["openid"] = owners[0]
+
+            try:
+                patient = PatientCreate(**record)
+            except ValidationError as e:
+                self._error(line, record, [
+                    f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+                ])
+                continue
+
+            if patient.openid in self._seen_openids:
+                self._error(line, record, ["openid 与文件中前面的行重复"])
+                continue
+            if phone and (phone in self._seen_phones or any(o != patient.openid for o in owners)):
+                self._error(line, record, ["手机号已被其他患者使用"])
+                continue
+            self._seen_openids.add(patient.openid)
+            if phone:
+                self._seen_phones.add(phone)
+
+            rows.append(dict(patient.model_dump(), created_at=now, updated_at=now))
+            if patient.openid in existing_openids:
+                self.report["updated"] += 1
+            else:
+                self.report["created"] += 1
+                created_at.append(now)
+
+        if rows and not self.dry_run:
+            self._upsert(rows)
+            record_new_patients(self.db, created_at)
+            self.db.commit()
+
+    def _upsert(self, rows: List[Dict]) -> None:
+        """
+        一条多行 INSERT ... ON DUPLICATE KEY UPDATE（以 uk_openid 判断重复）
+
+        更新时用 COALESCE(新值, 原值)：稀疏的导入文件不会把已有的病史、过敏史等清空
+        """
+        table = Patient.__table__
+        is_sqlite = self.db.get_bind().dialect.name == "sqlite"
+        if is_sqlite:
+            stmt = sqlite.insert(table).values(rows)
+            new = stmt.excluded
+        else:
+            stmt = mysql.insert(table).values(rows)
+            new = stmt.inserted
+        set_ = {c: func.coalesce(new[c], table.c[c]) for c in UPDATE_COLUMNS}
+        set_["updated_at"] = new.updated_at
+        if is_sqlite:
+            stmt = stmt.on_conflict_do_update(index_elements=[table.c.openid], set_=set_)
+        else:
+            stmt = stmt.on_duplicate_key_update(set_)
+        self.db.execute(stmt)
+
+
+def import_patients(db: Session, stream: BinaryIO, filename: str,
+                    chunk_size: int = 500, dry_run: bool = False) -> Dict:
+    """
+    从 CSV / XLSX 导入患者
+
+    Returns:
+        {"total", "created", "updated", "failed", "errors": [{"row", "openid", "errors"}], "errors_truncated"}
+
+    Raises:
+        ValueError: 不支持的文件类型
+        RuntimeError: 缺少 openpyxl
+    """
+    importer = PatientImporter(db, chunk_size=chunk_size, dry_run=dry_run)
+    return importer.run(iter_records(stream, filename))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从 CSV / XLSX 批量导入患者")
+    parser.add_argument("path", help="CSV 或 XLSX 文件路径")
+    parser.add_argument("--chunk-size", type=int, default=500, help="每批写入行数")
+    parser.add_argument("--dry-run", action="store_true", help="只校验，不写入数据库")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        with open(args.path, "rb") as f:
+            report = import_patients(db, f, args.path, chunk_size=args.chunk_size, dry_run=args.dry_run)
+    finally:
+        db.close()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
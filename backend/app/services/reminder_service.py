@@ -0,0 +1,406 @@
+"""
+复诊提醒发送
+
+- reminder_time 为空的复诊计划在复诊前 REMINDER_ADVANCE_HOURS 小时发送提醒；
+  设置了 reminder_time 的在该时间发送（需落在复诊前 REMINDER_ADVANCE_HOURS 小时以内）
+- 对账只做一次索引范围扫描：reminder_sent = 0 且 appointment_date 在 [now, now + 提前量 + horizon) 内
+  （idx_reminder_due (reminder_sent, appointment_date)），不扫描全表
+- 认领用 UPDATE ... WHERE reminder_sent = 0 原子完成，多个 worker 同时运行也不会重复发送；
+  发送成功后 reminder_time 记录实际发送时间，发送失败则恢复原值，稍后重试
+
+后台任务运行时，未来 REMINDER_QUEUE_HORIZON_HOURS 小时内到期的提醒保存在内存最小堆中：
+复诊计划的增删改由路由调用 track/forget 增量更新，每隔 REMINDER_RECONCILE_SECONDS 秒
+用一次范围扫描与数据库对账（兼顾其他进程的修改）。后台任务睡眠到堆顶的到期时间，
+到期时只按主键读取、认领对应的行，数据库负载与轮询频率无关。
+"""
+import asyncio
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Callable, Tuple
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+from ..models.appointment import Appointment
+from ..models.patient import Patient
+from ..config import settings
+from .time_buckets import local_now
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LogReminderSender:
+    """
+    本地提醒发送器：只写日志并记录已发送的提醒
+
+    未接入微信订阅消息时使用，也用于测试
+    """
+
+    def __init__(self):
+        self.sent: List[Dict] = []
+
+    def send(self, reminder: Dict) -> None:
+        self.sent.append(reminder)
+        logger.info(
+            f"Reminder: appointment {reminder['id']} for patient {reminder['patient_id']} "
+            f"at {reminder['appointment_date']:%Y-%m-%d %H:%M}"
+        )
+
+
+class ReminderQueue:
+    """
+    到期提醒的最小堆（按计划发送时间排序）
+
+    修改或删除时不在堆中查找旧条目，而是更新 appointment_id → 到期时间的映射，
+    弹出时跳过与映射不一致的过期条目（惰性删除），每次操作 O(log n)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[datetime, int]] = []
+        self._due: Dict[int, datetime] = {}
+
+    def push(self, appointment_id: int, due: datetime) -> bool:
+        """
+        加入或更新一条提醒
+
+        Returns:
+            是否成为新的堆顶（需要唤醒等待中的后台任务）
+        """
+        with self._lock:
+            self._due[appointment_id] = due
+            heapq.heappush(self._heap, (due, appointment_id))
+            self._compact()
+            return self._heap[0] == (due, appointment_id)
+
+    def remove(self, appointment_id: int) -> None:
+        with self._lock:
+            self._due.pop(appointment_id, None)
+
+    def replace(self, entries: Dict[int, datetime]) -> None:
+        """用对账结果整体替换"""
+        with self._lock:
+            self._due = dict(entries)
+            self._heap = [(due, appointment_id) for appointment_id, due in entries.items()]
+            heapq.heapify(self._heap)
+
+    def next_due(self) -> Optional[datetime]:
+        """最早的到期时间"""
+        with self._lock:
+            self._discard_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime, limit: int) -> List[int]:
+        """弹出最多 limit 条已到期的提醒"""
+        due_ids = []
+        with self._lock:
+            while len(due_ids) < limit:
+                self._discard_stale()
+                if not self._heap or self._heap[0][0] > now:
+                    break
+                _, appointment_id = heapq.heappop(self._heap)
+                del self._due[appointment_id]
+                due_ids.append(appointment_id)
+        return due_ids
+
+    def _discard_stale(self) -> None:
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _compact(self) -> None:
+        # 频繁修改时过期条目过多，重建堆
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._heap = [(due, appointment_id) for appointment_id, due in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+
+class ReminderEngine:
+    """
+    复诊提醒引擎
+
+    - 后台任务：按内存堆的到期时间触发，只处理堆中弹出的提醒，每批认领最多 batch_size 条；
+      每 reconcile_seconds 秒对账一次，堆为空时最多等待 poll_seconds 秒
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        sender=None,
+        batch_size: int = 200,
+        advance_hours: int = 24,
+        poll_seconds: float = 60.0,
+        horizon_hours: float = 6,
+        reconcile_seconds: float = 600.0,
+        retry_seconds: float = 60.0,
+        clock: Callable[[], datetime] = local_now
+    ):
+        self.session_factory = session_factory
+        self.sender = sender or LogReminderSender()
+        self.batch_size = batch_size
+        self.advance = timedelta(hours=advance_hours)
+        self.poll_seconds = poll_seconds
+        self.horizon = timedelta(hours=horizon_hours)
+        self.reconcile_seconds = reconcile_seconds
+        self.retry = timedelta(seconds=retry_seconds)
+        self.clock = clock
+        self.queue = ReminderQueue()
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._started_at: Optional[float] = None
+        self._metrics = {
+            "claimed": 0, "sent": 0, "failed": 0, "contended": 0,
+            "reconciles": 0, "fired": 0, "errors": 0,
+            "last_lag_seconds": 0.0, "max_lag_seconds": 0.0
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        """启动后台轮询任务"""
+        if self.running:
+            return
+        self._started_at = time.monotonic()
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台轮询任务"""
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        reconcile_at = 0.0
+        failures = 0
+        while True:
+            try:
+                if time.monotonic() >= reconcile_at:
+                    await asyncio.to_thread(self.reconcile)
+                    reconcile_at = time.monotonic() + self.reconcile_seconds
+                await asyncio.to_thread(self.fire_due)
+                failures = 0
+            except Exception as e:
+                # 数据库不可用时按指数退避（1 秒起，最多 poll_seconds 秒）后重新对账，避免空转
+                failures += 1
+                self._metrics["errors"] += 1
+                backoff = min(2.0 ** (failures - 1), self.poll_seconds)
+                logger.warning(f"Reminder engine iteration failed, retrying in {backoff:.0f}s: {e}")
+                reconcile_at = time.monotonic() + backoff
+
+            # 睡眠到堆顶到期、下次对账或被新的更早提醒唤醒
+            timeout = min(self.poll_seconds, max(reconcile_at - time.monotonic(), 0.0))
+            next_due = self.queue.next_due()
+            if next_due is not None and not failures:
+                timeout = min(timeout, max((next_due - self.clock()).total_seconds(), 0.0))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    # ========== 内存堆 ==========
+
+    def track(self, appointment: Appointment) -> None:
+        """
+        复诊计划新增或修改后更新内存堆（后台任务未运行时不做任何事）
+
+        已发送、非待复诊、已过复诊时间或不在 horizon 内的提醒从堆中移除，由对账重新加载
+        """
+        if not self.running:
+            return
+        now = self.clock()
+        due = self.due_time(appointment.appointment_date, appointment.reminder_time)
+        if (
+            appointment.reminder_sent
+            or appointment.status != "pending"
+            or appointment.appointment_date < now
+            or due >= now + self.horizon
+        ):
+            self.queue.remove(appointment.id)
+            return
+        # 提前量之外设置的 reminder_time 与范围扫描保持一致：进入提前量窗口后才发送
+        due = max(due, appointment.appointment_date - self.advance)
+        if self.queue.push(appointment.id, due):
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def forget(self, appointment_id: int) -> None:
+        """复诊计划删除后从内存堆移除"""
+        if self.running:
+            self.queue.remove(appointment_id)
+
+    def reconcile(self, now: Optional[datetime] = None) -> int:
+        """
+        与数据库对账：一次范围扫描加载 horizon 内到期的全部提醒并替换内存堆
+
+        Returns:
+            堆中的提醒数
+        """
+        now = now or self.clock()
+        db = self.session_factory()
+        try:
+            rows = db.query(
+                Appointment.id, Appointment.appointment_date, Appointment.reminder_time
+            ).filter(
+                Appointment.reminder_sent == 0,
+                Appointment.appointment_date >= now,
+                Appointment.appointment_date < now + self.advance + self.horizon,
+                Appointment.status == "pending"
+            ).all()
+        finally:
+            db.close()
+        entries = {}
+        for row in rows:
+            due = max(self.due_time(row.appointment_date, row.reminder_time), row.appointment_date - self.advance)
+            if due < now + self.horizon:
+                entries[row.id] = due
+        self.queue.replace(entries)
+        self._metrics["reconciles"] += 1
+        return len(entries)
+
+    def fire_due(self, now: Optional[datetime] = None) -> int:
+        """
+        发送内存堆中已到期的提醒
+
+        按主键读取并重新校验条件（其他进程可能已修改或发送），再认领、发送；
+        发送失败的 retry_seconds 秒后重试
+
+        Returns:
+            本次发送成功的条数
+        """
+        now = now or self.clock()
+        sent = 0
+        while True:
+            due_ids = self.queue.pop_due(now, self.batch_size)
+            if not due_ids:
+                return sent
+            self._metrics["fired"] += len(due_ids)
+            db = self.session_factory()
+            try:
+                candidates = self._due_candidates(db, now, due_ids)
+                claimed = self._claim(db, candidates, now) if candidates else []
+                failed = self._deliver(db, claimed, now)
+            finally:
+                db.close()
+            sent += len(claimed) - len(failed)
+            for appointment_id in failed:
+                self.queue.push(appointment_id, now + self.retry)
+
+    # ========== 认领与发送 ==========
+
+    def due_time(self, appointment_date: datetime, reminder_time: Optional[datetime]) -> datetime:
+        """提醒的计划发送时间"""
+        return reminder_time or appointment_date - self.advance
+
+    def _due_candidates(self, db: Session, now: datetime, ids: List[int]) -> List[Dict]:
+        """按主键读取内存堆弹出的提醒，只保留仍然到期、未发送的"""
+        rows = db.query(
+            Appointment.id,
+            Appointment.patient_id,
+            Appointment.appointment_date,
+            Appointment.appointment_type,
+            Appointment.reminder_time,
+            Patient.name,
+            Patient.openid
+        ).join(Patient, Patient.id == Appointment.patient_id).filter(
+            Appointment.id.in_(ids),
+            Appointment.reminder_sent == 0,
+            Appointment.appointment_date >= now,
+            Appointment.appointment_date < now + self.advance,
+            Appointment.status == "pending",
+            or_(Appointment.reminder_time.is_(None), Appointment.reminder_time <= now)
+        ).all()
+        return [row._asdict() for row in rows]
+
+    def _claim(self, db: Session, candidates: List[Dict], now: datetime) -> List[Dict]:
+        """
+        认领一批提醒
+
+        先整批 UPDATE；影响行数与候选数一致说明全部由本 worker 认领。
+        否则说明有其他 worker 同时认领了其中一部分，回滚后逐条认领以确定归属。
+        """
+        ids = [row["id"] for row in candidates]
+        claimed = db.execute(
+            update(Appointment.__table__)
+            .where(Appointment.id.in_(ids), Appointment.reminder_sent == 0)
+            .values(reminder_sent=1, reminder_time=now)
+        ).rowcount
+        if claimed == len(ids):
+            db.commit()
+            self._metrics["claimed"] += claimed
+            return candidates
+
+        db.rollback()
+        self._metrics["contended"] += 1
+        mine = []
+        for row in candidates:
+            result = db.execute(
+                update(Appointment.__table__)
+                .where(Appointment.id == row["id"], Appointment.reminder_sent == 0)
+                .values(reminder_sent=1, reminder_time=now)
+            )
+            if result.rowcount == 1:
+                mine.append(row)
+        db.commit()
+        self._metrics["claimed"] += len(mine)
+        return mine
+
+    def _deliver(self, db: Session, reminders: List[Dict], now: datetime) -> List[int]:
+        """
+        发送已认领的提醒，失败的释放认领
+
+        Returns:
+            发送失败的复诊计划 ID
+        """
+        failed = []
+        for reminder in reminders:
+            try:
+                self.sender.send(reminder)
+            except Exception as e:
+                logger.warning(f"Reminder for appointment {reminder['id']} failed: {e}")
+                db.execute(
+                    update(Appointment.__table__)
+                    .where(Appointment.id == reminder["id"])
+                    .values(reminder_sent=0, reminder_time=reminder["reminder_time"])
+                )
+                db.commit()
+                failed.append(reminder["id"])
+                continue
+            lag = max((now - self.due_time(reminder["appointment_date"], reminder["reminder_time"])).total_seconds(), 0.0)
+            self._metrics["last_lag_seconds"] = round(lag, 1)
+            self._metrics["max_lag_seconds"] = max(self._metrics["max_lag_seconds"], round(lag, 1))
+        self._metrics["sent"] += len(reminders) - len(failed)
+        self._metrics["failed"] += len(failed)
+        return failed
+
+    def stats(self) -> Dict:
+        """发送统计（含吞吐量与延迟）"""
+        metrics = dict(self._metrics)
+        metrics["running"] = self.running
+        metrics["queued"] = len(self.queue)
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        metrics["sent_per_minute"] = round(metrics["sent"] / uptime * 60, 2) if uptime else 0.0
+        return metrics
+
+
+# 全局提醒引擎（REMINDER_ENABLED 开启时在应用启动时运行）
+reminder_engine = ReminderEngine(
+    batch_size=settings.REMINDER_BATCH_SIZE,
+    advance_hours=settings.REMINDER_ADVANCE_HOURS,
+    poll_seconds=settings.REMINDER_POLL_SECONDS,
+    horizon_hours=settings.REMINDER_QUEUE_HORIZON_HOURS,
+    reconcile_seconds=settings.REMINDER_RECONCILE_SECONDS
+)
@@ -0,0 +1,148 @@
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional, List, Dict, Tuple
+from ..config import settings
+from ..utils.redis_cache import cache, RedisCache
+import logging
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD_PATTERN = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def normalize_question(text: str) -> str:
+    """
+    归一化患者问题：全角转半角、小写、去掉空白和标点
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _NON_WORD_PATTERN.sub("", text)
+
+
+class ResponseCache:
+    """
+    AI 回复缓存
+
+    按（提示词模板版本, 参考知识指纹）分桶，桶内只有归一化后完全相同的问题才复用回复：
+    「孕妇能拔牙吗」与「孕妇能种牙吗」这类只差一两个字的问题字面相似度很高，答案却不同，
+    不能按相似度命中。本地 LRU + TTL 为一级缓存，Redis 为二级缓存，多个 worker 之间共享
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 2000,
+        ttl_seconds: int = 86400,
+        redis: Optional[RedisCache] = None
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.redis = redis
+        self._lock = threading.Lock()
+        # 条目键 -> (回复, 过期时间)
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._metrics = {"hits": 0, "redis_hits": 0, "misses": 0, "bypass": 0, "stores": 0, "evictions": 0}
+
+    @staticmethod
+    def bucket_key(template_version: str, knowledge: Optional[List[str]]) -> Optional[str]:
+        """
+        桶键：提示词模板版本 + 注入提示词的参考知识指纹
+
+        没有参考知识时回复完全取决于模型对问题的理解，返回 None 表示不缓存
+        """
+        if not knowledge:
+            return None
+        digest = hashlib.sha1("\x1f".join(knowledge).encode("utf-8")).hexdigest()[:16]
+        return f"{template_version}:{digest}"
+
+    @staticmethod
+    def _entry_key(bucket: str, question: str) -> str:
+        return f"{bucket}:{hashlib.sha1(question.encode('utf-8')).hexdigest()[:16]}"
+
+    def record_bypass(self) -> None:
+        """记录一次因患者个性化上下文而跳过缓存"""
+        with self._lock:
+            self._metrics["bypass"] += 1
+
+    def get(self, bucket: str, user_message: str) -> Optional[str]:
+        """
+        查找同一问题的缓存回复
+
+        Returns:
+            缓存的回复，未命中返回 None
+        """
+        question = normalize_question(user_message)
+        if not bucket or not question:
+            return None
+        key = self._entry_key(bucket, question)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._metrics["hits"] += 1
+                return entry[0]
+
+        reply = None
+        if self.redis is not None and self.redis.enabled:
+            reply = self.redis.get(self._redis_key(key))
+        with self._lock:
+            if reply is not None:
+                self._metrics["redis_hits"] += 1
+                self._store_local(key, reply, now)
+            else:
+                self._metrics["misses"] += 1
+        return reply
+
+    def put(self, bucket: str, user_message: str, reply: str) -> None:
+        """保存一条回复到本地缓存和 Redis"""
+        question = normalize_question(user_message)
+        if not bucket or not question or not reply:
+            return
+        key = self._entry_key(bucket, question)
+        with self._lock:
+            self._store_local(key, reply, time.time())
+            self._metrics["stores"] += 1
+
+        if self.redis is not None and self.redis.enabled:
+            self.redis.set(self._redis_key(key), reply, expire=timedelta(seconds=self.ttl_seconds))
+
+    def _store_local(self, key: str, reply: str, now: float) -> None:
+        self._entries[key] = (reply, now + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._metrics["evictions"] += 1
+
+    @staticmethod
+    def _redis_key(key: str) -> str:
+        return f"ai_response_cache:{key}"
+
+    def clear(self) -> None:
+        """清空本地缓存（Redis 中的条目按 TTL 自然过期）"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """命中率等统计指标"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["entries"] = len(self._entries)
+        lookups = metrics["hits"] + metrics["redis_hits"] + metrics["misses"]
+        metrics["hit_rate"] = round((metrics["hits"] + metrics["redis_hits"]) / lookups, 4) if lookups else 0.0
+        return metrics
+
+
+# 全局回复缓存实例
+response_cache = ResponseCache(
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+    redis=cache
+)
@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, List, Dict, Tuple
+from sqlalchemy.orm import Session
+from ..models.dialogue import Dialogue
+from ..config import settings
+from ..utils.redis_cache import cache, RedisCache
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """
+    会话上下文存储
+
+    每个会话保留最近 max_turns 轮对话，两个聊天接口在每轮结束后写入：
+    - 首选 Redis 列表 dialogue_session:{session_id}（表头为最新一轮），多个 worker 共享
+    - Redis 不可用时读写进程内 LRU（同时作为 Redis 的写穿副本）
+    - 两者都未命中（冷启动、过期）时从 MySQL 加载最近几轮并回填
+    """
+
+    def __init__(
+        self,
+        redis: Optional[RedisCache] = None,
+        max_turns: int = 20,
+        max_sessions: int = 10000,
+        ttl_seconds: int = 1800
+    ):
+        self.redis = redis
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # session_id -> (最近的对话轮次（从旧到新）, 过期时间)
+        self._local: "OrderedDict[str, Tuple[List[Dict], float]]" = OrderedDict()
+        self._metrics = {"redis_hits": 0, "local_hits": 0, "db_loads": 0}
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"dialogue_session:{session_id}"
+
+    def append(self, session_id: Optional[str], user_message: str, ai_response: str) -> None:
+        """记录一轮对话"""
+        if not session_id:
+            return
+        turn = {"user_message": user_message, "ai_response": ai_response}
+        if self.redis is not None:
+            self.redis.push_capped(self._key(session_id), turn, max_length=self.max_turns, seconds=self.ttl_seconds)
+        with self._lock:
+            turns = self._local_get(session_id) or []
+            self._local_put(session_id, (turns + [turn])[-self.max_turns:])
+
+    def recent(self, session_id: Optional[str], db: Optional[Session] = None, max_turns: int = 3) -> List[Dict]:
+        """
+        获取最近 max_turns 轮对话（从旧到新）
+
+        Returns:
+            [{"user_message": ..., "ai_response": ...}]
+        """
+        if not session_id:
+            return []
+
+        redis_available = False
+        if self.redis is not None:
+            items = self.redis.try_lrange(self._key(session_id), 0, max_turns - 1)
+            if items is not None:
+                redis_available = True
+                if items:
+                    self._metrics["redis_hits"] += 1
+                    return list(reversed(items))
+
+        if not redis_available:
+            with self._lock:
+                turns = self._local_get(session_id)
+            if turns is not None:
+                self._metrics["local_hits"] += 1
+                return turns[-max_turns:]
+
+        if db is None:
+            return []
+        turns = self._load(session_id, db)
+        return turns[-max_turns:]
+
+    def _load(self, session_id: str, db: Session) -> List[Dict]:
+        """冷启动：从 MySQL 加载会话最近的对话并回填 Redis 和本地 LRU"""
+        self._metrics["db_loads"] += 1
+        rows = db.query(Dialogue.user_message, Dialogue.ai_response).filter(
+            Dialogue.session_id == session_id
+        ).order_by(Dialogue.created_at.desc(), Dialogue.id.desc()).limit(self.max_turns).all()
+        newest_first = [{"user_message": row.user_message, "ai_response": row.ai_response} for row in rows]
+        if newest_first and self.redis is not None:
+            self.redis.replace_list(self._key(session_id), newest_first, self.ttl_seconds)
+        turns = list(reversed(newest_first))
+        with self._lock:
+            self._local_put(session_id, turns)
+        return turns
+
+    def invalidate(self, session_id: str) -> None:
+        """会话记录被删除后清除缓存"""
+        if self.redis is not None:
+            self.redis.delete(self._key(session_id))
+        with self._lock:
+            self._local.pop(session_id, None)
+
+    def clear(self) -> None:
+        """清空所有会话缓存"""
+        if self.redis is not None:
+            self.redis.delete_pattern(self._key("*"))
+        with self._lock:
+            self._local.clear()
+
+    def _local_get(self, session_id: str) -> Optional[List[Dict]]:
+        entry = self._local.get(session_id)
+        if entry is None:
+            return None
+        turns, expires_at = entry
+        if expires_at <= time.time():
+            del self._local[session_id]
+            return None
+        self._local.move_to_end(session_id)
+        return turns
+
+    def _local_put(self, session_id: str, turns: List[Dict]) -> None:
+        self._local[session_id] = (turns, time.time() + self.ttl_seconds)
+        self._local.move_to_end(session_id)
+        while len(self._local) > self.max_sessions:
+            self._local.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """读取来源统计"""
+        metrics = dict(self._metrics)
+        metrics["local_sessions"] = len(self._local)
+        return metrics
+
+
+# 全局会话上下文存储
+session_store = SessionStore(
+    redis=cache,
+    max_turns=settings.SESSION_CONTEXT_MAX_TURNS,
+    max_sessions=settings.SESSION_CONTEXT_LOCAL_MAX,
+    ttl_seconds=settings.REDIS_SESSION_EXPIRE
+)
@@ -0,0 +1,505 @@
+"""
+统计汇总服务
+
+daily_stats 表按天保存新增患者、复诊、对话等计数，由 ORM 事件在同一事务内增量维护；
+概览统计对汇总表做一次条件聚合查询，结果在进程内缓存 STATS_CACHE_TTL_SECONDS 秒。
+影响统计的事务提交后数据版本号加 1，仪表盘接口据此生成 ETag。
+
+患者、复诊、对话的写入依赖 daily_stats 表：旧版建表脚本创建的库先执行
+docs/数据库设计/upgrade_existing_database.sql。首次部署、升级或数据不一致时全量重建：
+    python -m app.services.stats_service rebuild
+"""
+import argparse
+import secrets
+import threading
+import time
+from itertools import chain
+from datetime import date, datetime, timedelta
+from typing import Optional, List, Dict, Tuple, Callable, Any
+from sqlalchemy import event, func, case, select, update, inspect
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session, object_session
+from ..database import SessionLocal
+from ..models.patient import Patient
+from ..models.appointment import Appointment
+from ..models.dialogue import Dialogue
+from ..models.knowledge_base import KnowledgeBase
+from ..models.daily_stats import DailyStats
+from ..config import settings
+from ..utils.redis_cache import cache, RedisCache
+from .time_buckets import local_today, dense_series
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 汇总表中的计数列
+STAT_COLUMNS = (
+    "new_patients",
+    "appointments",
+    "appointments_pending",
+    "appointments_completed",
+    "dialogues",
+    "dialogues_handover",
+)
+
+# 本次 flush 累积的增量保存在 Session.info 中，flush 结束后一次写入
+_DELTA_KEY = "daily_stats_delta"
+
+# 事务中修改了统计相关数据的标记，提交后递增数据版本号
+_CHANGED_KEY = "stats_data_changed"
+_TRACKED_MODELS = (Patient, Appointment, Dialogue, KnowledgeBase)
+
+Deltas = Dict[Tuple[date, str], int]
+
+
+def _day(value: Any) -> Optional[date]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(str(value)).date()
+
+
+def _add(deltas: Deltas, day: Optional[date], column: str, amount: int) -> None:
+    if day is None or not amount:
+        return
+    key = (day, column)
+    deltas[key] = deltas.get(key, 0) + amount
+
+
+def _session_deltas(target) -> Optional[Deltas]:
+    session = object_session(target)
+    if session is None:
+        return None
+    return session.info.setdefault(_DELTA_KEY, {})
+
+
+def _committed(target, attr: str):
+    """属性修改前（数据库中）的值"""
+    history = inspect(target).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, attr)
+
+
+def _appointment_columns(status: Optional[str]) -> List[str]:
+    columns = ["appointments"]
+    if status == "pending":
+        columns.append("appointments_pending")
+    elif status == "completed":
+        columns.append("appointments_completed")
+    return columns
+
+
+def apply_deltas(connection, deltas: Deltas) -> None:
+    """
+    把增量写入汇总表（每天一行，一条多行 upsert）
+
+    Args:
+        connection: 当前事务的连接（与业务写入同一事务）
+        deltas: {(日期, 列名): 增量}
+    """
+    rows: Dict[date, Dict[str, Any]] = {}
+    for (day, column), amount in deltas.items():
+        if amount:
+            row = rows.setdefault(day, dict({c: 0 for c in STAT_COLUMNS}, stat_date=day))
+            row[column] += amount
+    if not rows:
+        return
+
+    table = DailyStats.__table__
+    values = [dict(row, updated_at=datetime.now()) for row in rows.values()]
+    if connection.dialect.name == "sqlite":
+        stmt = sqlite.insert(table).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.stat_date],
+            set_={**{c: table.c[c] + stmt.excluded[c] for c in STAT_COLUMNS}, "updated_at": stmt.excluded.updated_at}
+        )
+    else:
+        stmt = mysql.insert(table).values(values)
+        stmt = stmt.on_duplicate_key_update(
+            {**{c: table.c[c] + stmt.inserted[c] for c in STAT_COLUMNS}, "updated_at": stmt.inserted.updated_at}
+        )
+    connection.execute(stmt)
+
+
+# ========== ORM 事件：逐行累积增量 ==========
+
+@event.listens_for(Patient, "after_insert")
+def _patient_inserted(mapper, connection, target):
+    deltas = _session_deltas(target)
+    if deltas is not None:
+        _add(deltas, _day(target.created_at or datetime.now()), "new_patients", 1)
+
+
+@event.listens_for(Patient, "after_delete")
+def _patient_deleted(mapper, connection, target):
+    deltas = _session_deltas(target)
+    if deltas is not None:
+        _add(deltas, _day(_committed(target, "created_at")), "new_patients", -1)
+
+
+@event.listens_for(Appointment, "after_insert")
+def _appointment_inserted(mapper, connection, target):
+    deltas = _session_deltas(target)
+    if deltas is not None:
+        for column in _appointment_columns(target.status or "pending"):
+            _add(deltas, _day(target.appointment_date), column, 1)
+
+
+@event.listens_for(Appointment, "after_update")
+def _appointment_updated(mapper, connection, target):
+    deltas = _session_deltas(target)
+    if deltas is None:
+        return
+    old_day, old_status = _day(_committed(target, "appointment_date")), _committed(target, "status")
+    new_day, new_status = _day(target.appointment_date), target.status
+    if (old_day, old_status) == (new_day, new_status):
+        return
+    for column in _appointment_columns(old_status):
+        _add(deltas, old_day, column, -1)
+    for column in _appointment_columns(new_status):
+        _add(deltas, new_day, column, 1)
+
+
+@event.listens_for(Appointment, "after_delete")
+def _appointment_deleted(mapper, connection, target):
+    deltas = _session_deltas(target)
+    if deltas is not None:
+        for column in _appointment_columns(_committed(target, "status")):
+            _add(deltas, _day(_committed(target, "appointment_date")), column, -1)
+
+
+@event.listens_for(Dialogue, "after_insert")
+def _dialogue_inserted(mapper, connection, target):
+    deltas = _session_deltas(target)
+    if deltas is not None:
+        day = _day(target.created_at or datetime.now())
+        _add(deltas, day, "dialogues", 1)
+        _add(deltas, day, "dialogues_handover", 1 if target.is_handover else 0)
+
+
+@event.listens_for(Dialogue, "after_update")
+def _dialogue_updated(mapper, connection, target):
+    deltas = _session_deltas(target)
+    if deltas is not None:
+        change = int(bool(target.is_handover)) - int(bool(_committed(target, "is_handover")))
+        _add(deltas, _day(target.created_at), "dialogues_handover", change)
+
+
+@event.listens_for(Dialogue, "after_delete")
+def _dialogue_deleted(mapper, connection, target):
+    deltas = _session_deltas(target)
+    if deltas is not None:
+        day = _day(_committed(target, "created_at"))
+        _add(deltas, day, "dialogues", -1)
+        _add(deltas, day, "dialogues_handover", -1 if _committed(target, "is_handover") else 0)
+
+
+def register_session(session_factory) -> None:
+    """
+    为会话工厂注册汇总表维护：flush 后把累积的增量写入同一事务，提交后递增数据版本号
+    """
+    @event.listens_for(session_factory, "after_flush")
+    def _apply_after_flush(session, flush_context):
+        deltas = session.info.pop(_DELTA_KEY, None)
+        if deltas:
+            apply_deltas(session.connection(), deltas)
+        # after_flush 中 new/dirty/deleted 仍是 flush 前的状态
+        if any(isinstance(obj, _TRACKED_MODELS) for obj in chain(session.new, session.dirty, session.deleted)):
+            mark_changed(session)
+
+    @event.listens_for(session_factory, "after_commit")
+    def _bump_after_commit(session):
+        if session.info.pop(_CHANGED_KEY, False):
+            data_version.bump()
+
+    @event.listens_for(session_factory, "after_soft_rollback")
+    def _discard_on_rollback(session, previous_transaction):
+        session.info.pop(_DELTA_KEY, None)
+        session.info.pop(_CHANGED_KEY, None)
+
+
+def mark_changed(db: Session) -> None:
+    """标记当前事务修改了统计相关数据（绕过 ORM 的批量写入需显式调用）"""
+    db.info[_CHANGED_KEY] = True
+
+
+class DataVersion:
+    """
+    统计数据版本号
+
+    - 首选 Redis 计数器 stats:data_version，多个 worker 共享
+    - 版本号带上 Redis 中的随机纪元 stats:data_epoch：Redis 清空或重启后计数器从 0 重新开始，
+      纪元随之重新生成，不会重复发出客户端已持有、但对应旧数据的 ETag
+    - Redis 不可用时 current() 返回 None，调用方退回到按内容计算 ETag
+      （进程内计数器看不到其他 worker 的写入，不能用来判断数据未变）
+    """
+
+    def __init__(self, redis: Optional[RedisCache] = None, key: str = "stats:data_version",
+                 epoch_key: str = "stats:data_epoch"):
+        self.redis = redis
+        self.key = key
+        self.epoch_key = epoch_key
+        self.bumps = 0
+
+    def bump(self) -> None:
+        self.bumps += 1
+        if self.redis is not None:
+            self.redis.incr(self.key)
+
+    def current(self) -> Optional[str]:
+        """当前版本（"纪元.计数"）"""
+        if self.redis is None:
+            return None
+        # 先读计数器再读纪元：两次读取之间 Redis 被清空时得到的是新纪元，不会与旧版本号重复
+        version = self.redis.get_counter(self.key)
+        if version is None:
+            return None
+        epoch = self.redis.get(self.epoch_key)
+        if epoch is None:
+            self.redis.setnx(self.epoch_key, secrets.token_hex(4))
+            epoch = self.redis.get(self.epoch_key)
+        if epoch is None:
+            return None
+        return f"{epoch}.{version}"
+
+
+data_version = DataVersion(cache)
+
+
+# ========== 批量写入路径（绕过 ORM 事件时显式调用） ==========
+
+def record_dialogue_rows(db: Session, rows: List[Dict]) -> None:
+    """多行 INSERT 写入对话后更新汇总表（与插入在同一事务）"""
+    deltas: Deltas = {}
+    for row in rows:
+        day = _day(row.get("created_at") or datetime.now())
+        _add(deltas, day, "dialogues", 1)
+        _add(deltas, day, "dialogues_handover", 1 if row.get("is_handover") else 0)
+    apply_deltas(db.connection(), deltas)
+    mark_changed(db)
+
+
+def record_appointment_rows(db: Session, rows: List[Dict]) -> None:
+    """批量插入复诊计划后更新汇总表（与插入在同一事务）"""
+    deltas: Deltas = {}
+    for row in rows:
+        for column in _appointment_columns(row.get("status") or "pending"):
+            _add(deltas, _day(row["appointment_date"]), column, 1)
+    apply_deltas(db.connection(), deltas)
+    mark_changed(db)
+
+
+def record_new_patients(db: Session, created_at: List[datetime]) -> None:
+    """批量插入患者后更新汇总表（与插入在同一事务）"""
+    deltas: Deltas = {}
+    for value in created_at:
+        _add(deltas, _day(value or datetime.now()), "new_patients", 1)
+    apply_deltas(db.connection(), deltas)
+    mark_changed(db)
+
+
+def subtract_dialogues(db: Session, *criteria) -> None:
+    """
+    批量删除对话前调用：按天扣减将被删除的对话数
+
+    Args:
+        criteria: 与随后 query(Dialogue).filter(...).delete() 相同的过滤条件
+    """
+    rows = db.query(
+        func.date(Dialogue.created_at).label("day"),
+        func.count(Dialogue.id).label("total"),
+        func.coalesce(func.sum(Dialogue.is_handover), 0).label("handover")
+    ).filter(*criteria).group_by(func.date(Dialogue.created_at)).all()
+    deltas: Deltas = {}
+    for row in rows:
+        _add(deltas, _day(row.day), "dialogues", -int(row.total))
+        _add(deltas, _day(row.day), "dialogues_handover", -int(row.handover))
+    apply_deltas(db.connection(), deltas)
+    mark_changed(db)
+
+
+def reset_dialogues(db: Session) -> None:
+    """清空所有对话后将汇总表中的对话计数归零"""
+    db.execute(update(DailyStats).values(dialogues=0, dialogues_handover=0))
+    mark_changed(db)
+
+
+def rebuild_daily_stats(db: Session) -> int:
+    """
+    从业务表全量重建汇总表（首次部署或修复不一致时使用）
+
+    Returns:
+        汇总表行数
+    """
+    deltas: Deltas = {}
+
+    for row in db.query(func.date(Patient.created_at).label("day"), func.count(Patient.id).label("n")).group_by(
+        func.date(Patient.created_at)
+    ):
+        _add(deltas, _day(row.day), "new_patients", int(row.n))
+
+    for row in db.query(
+        func.date(Appointment.appointment_date).label("day"), Appointment.status, func.count(Appointment.id).label("n")
+    ).group_by(func.date(Appointment.appointment_date), Appointment.status):
+        for column in _appointment_columns(row.status):
+            _add(deltas, _day(row.day), column, int(row.n))
+
+    for row in db.query(
+        func.date(Dialogue.created_at).label("day"),
+        func.count(Dialogue.id).label("n"),
+        func.coalesce(func.sum(Dialogue.is_handover), 0).label("handover")
+    ).group_by(func.date(Dialogue.created_at)):
+        _add(deltas, _day(row.day), "dialogues", int(row.n))
+        _add(deltas, _day(row.day), "dialogues_handover", int(row.handover))
+
+    db.query(DailyStats).delete()
+    apply_deltas(db.connection(), deltas)
+    mark_changed(db)
+    db.commit()
+    return db.query(func.count(DailyStats.stat_date)).scalar()
+
+
+# ========== 概览统计 ==========
+
+class StatsCache:
+    """统计结果的进程内短期缓存（数据最多滞后 ttl_seconds 秒）"""
+
+    def __init__(self, ttl_seconds: int = 10):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Any, float]] = {}
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+        value = compute()
+        with self._lock:
+            # 顺带清理过期条目（键中带版本号时旧键不会再被访问）
+            for stale in [k for k, (_, expires_at) in self._entries.items() if expires_at <= now]:
+                del self._entries[stale]
+            self._entries[key] = (value, now + self.ttl_seconds)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+stats_cache = StatsCache(ttl_seconds=settings.STATS_CACHE_TTL_SECONDS)
+
+
+def _growth_rate(today: int, yesterday: int) -> float:
+    if yesterday > 0:
+        return round(((today - yesterday) / yesterday) * 100, 1)
+    return 100 if today > 0 else 0
+
+
+def compute_overview(db: Session, today: Optional[date] = None) -> Dict:
+    """
+    概览统计：对汇总表做一次条件聚合（知识库计数作为标量子查询），一次往返
+    """
+    today = today or local_today()
+    yesterday = today - timedelta(days=1)
+    week_start = datetime.combine(today - timedelta(days=today.weekday()), datetime.min.time())
+    t = DailyStats
+
+    def total(column):
+        return func.coalesce(func.sum(column), 0)
+
+    def on(day, column):
+        return func.coalesce(func.sum(case((t.stat_date == day, column), else_=0)), 0)
+
+    total_knowledge = select(func.count(KnowledgeBase.id)).where(
+        KnowledgeBase.is_active == 1
+    ).scalar_subquery()
+    new_knowledge = select(func.count(KnowledgeBase.id)).where(
+        KnowledgeBase.is_active == 1,
+        KnowledgeBase.created_at >= week_start
+    ).scalar_subquery()
+
+    row = db.query(
+        total(t.new_patients).label("total_patients"),
+        on(today, t.new_patients).label("new_patients_today"),
+        total(t.appointments).label("total_appointments"),
+        on(today, t.appointments).label("today_appointments"),
+        on(yesterday, t.appointments).label("yesterday_appointments"),
+        total(t.appointments_pending).label("pending_appointments"),
+        on(today, t.appointments_completed).label("completed_appointments_today"),
+        total(t.dialogues).label("total_dialogues"),
+        on(today, t.dialogues).label("today_dialogues"),
+        on(yesterday, t.dialogues).label("yesterday_dialogues"),
+        total(t.dialogues_handover).label("handover_count"),
+        total_knowledge.label("total_knowledge"),
+        new_knowledge.label("new_knowledge_this_week"),
+    ).one()
+
+    overview = {key: int(value or 0) for key, value in row._mapping.items()}
+    yesterday_dialogues = overview.pop("yesterday_dialogues")
+    overview["dialogue_growth_rate"] = _growth_rate(overview["today_dialogues"], yesterday_dialogues)
+    return overview
+
+
+def get_overview(db: Session) -> Dict:
+    """概览统计（带短期缓存）"""
+    return stats_cache.get_or_compute("overview", lambda: compute_overview(db))
+
+
+def gender_distribution(db: Session) -> List[Dict]:
+    """患者性别分布"""
+    rows = db.query(Patient.gender, func.count(Patient.id).label("count")).group_by(Patient.gender).all()
+    return [{"gender": r.gender or "未知", "count": r.count} for r in rows]
+
+
+def status_distribution(db: Session) -> List[Dict]:
+    """复诊状态分布"""
+    rows = db.query(Appointment.status, func.count(Appointment.id).label("count")).group_by(Appointment.status).all()
+    return [{"status": r.status, "count": r.count} for r in rows]
+
+
+def compute_dashboard(db: Session, today: Optional[date] = None, days: int = 7) -> Dict:
+    """
+    仪表盘全部面板（同一个数据库会话）：概览、最近 days 天复诊趋势与对话量、性别分布、复诊状态分布
+    """
+    today = today or local_today()
+    return {
+        "overview": compute_overview(db, today=today),
+        "appointments_trend": dense_series(db, Appointment.appointment_date, "day", days, today=today),
+        "dialogues_daily": dense_series(db, Dialogue.created_at, "day", days, today=today),
+        "patients_gender": gender_distribution(db),
+        "appointments_status": status_distribution(db),
+    }
+
+
+def get_dashboard(db: Session, version: str, today: date) -> Dict:
+    """按数据版本号缓存的仪表盘数据（版本不变时不再查询数据库）"""
+    return stats_cache.get_or_compute(
+        f"dashboard:{version}:{today.isoformat()}",
+        lambda: compute_dashboard(db, today=today)
+    )
+
+
+register_session(SessionLocal)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="统计汇总表维护")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild：从业务表全量重建 daily_stats")
+    parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        count = rebuild_daily_stats(db)
+        print(f"daily_stats 已重建：{count} 天")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+统计时间分桶
+
+把“最近 N 天/周/月”转换为半开区间 [start, end) 的范围条件，直接作用在带索引的原始时间列上
+（不对列套 DATE() 等函数，MySQL 可以走索引范围扫描），并在服务端补零返回连续的序列。
+
+数据库中的时间为不带时区的本地时间，“今天”按 SCHEDULER_TIMEZONE 计算。
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional, List, Dict
+from sqlalchemy import and_, case, func
+from sqlalchemy.orm import Session
+from ..config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("day", "week", "month")
+
+# 单次请求允许的最大桶数
+MAX_BUCKETS = 366
+
+
+def local_now(timezone: Optional[str] = None) -> datetime:
+    """配置时区下的当前时间（去掉时区信息，与库中的时间可直接比较）"""
+    name = timezone or settings.SCHEDULER_TIMEZONE
+    try:
+        from zoneinfo import ZoneInfo
+        return datetime.now(ZoneInfo(name)).replace(tzinfo=None)
+    except Exception as e:
+        # 缺少时区数据（如 Windows 未安装 tzdata）时退回服务器本地时间
+        logger.warning(f"Timezone {name} unavailable, using local time: {e}")
+        return datetime.now()
+
+
+def local_today(timezone: Optional[str] = None) -> date:
+    """配置时区下的今天"""
+    return local_now(timezone).date()
+
+
+def bucket_start(day: date, granularity: str) -> date:
+    """day 所在桶的第一天（周从周一开始）"""
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    raise ValueError(f"不支持的时间粒度：{granularity}")
+
+
+def _shift(start: date, granularity: str, count: int) -> date:
+    if granularity == "day":
+        return start + timedelta(days=count)
+    if granularity == "week":
+        return start + timedelta(weeks=count)
+    month = start.year * 12 + start.month - 1 + count
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def bucket_edges(granularity: str, count: int, today: Optional[date] = None) -> List[datetime]:
+    """
+    最近 count 个桶（含当前桶）的边界
+
+    Returns:
+        count + 1 个升序的零点时间，第 i 个桶为 [edges[i], edges[i + 1])
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"不支持的时间粒度：{granularity}")
+    if not 1 <= count <= MAX_BUCKETS:
+        raise ValueError(f"桶数量必须在 1 到 {MAX_BUCKETS} 之间")
+    first = _shift(bucket_start(today or local_today(), granularity), granularity, 1 - count)
+    return [datetime.combine(_shift(first, granularity, i), datetime.min.time()) for i in range(count + 1)]
+
+
+def in_range(column, start: datetime, end: datetime):
+    """半开区间范围条件：start <= column < end"""
+    return and_(column >= start, column < end)
+
+
+def dense_series(
+    db: Session,
+    column,
+    granularity: str = "day",
+    count: int = 7,
+    *criteria,
+    today: Optional[date] = None
+) -> List[Dict]:
+    """
+    按时间桶计数，缺失的桶补 0
+
+    WHERE 只对原始列做范围过滤，桶编号由边界比较的 CASE 表达式得到，一次聚合查询完成。
+
+    Args:
+        column: 时间列（如 Appointment.appointment_date）
+        criteria: 额外的过滤条件
+
+    Returns:
+        [{"date": "YYYY-MM-DD"（桶的第一天）, "count": n}]，按时间升序，长度为 count
+    """
+    edges = bucket_edges(granularity, count, today)
+    bucket = case(
+        *[(column < edge, index) for index, edge in enumerate(edges[1:])],
+        else_=count - 1
+    ).label("bucket")
+
+    rows = db.query(bucket, func.count().label("count")).filter(
+        in_range(column, edges[0], edges[-1]), *criteria
+    ).group_by(bucket).all()
+
+    counts = [0] * count
+    for row in rows:
+        counts[int(row.bucket)] = int(row.count)
+    return [
+        {"date": edges[index].date().isoformat(), "count": counts[index]}
+        for index in range(count)
+    ]
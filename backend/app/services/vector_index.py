@@ -0,0 +1,234 @@
+"""
+知识库稠密向量索引
+
+离线从 knowledge_base_v3.json 计算向量，保存为 float32 .npy 矩阵和 JSON 附属文件；
+在线以内存映射方式加载，一次矩阵-向量乘法加 argpartition 得到 Top-K。
+
+构建索引：
+    python -m app.services.vector_index ../data/knowledge/knowledge_base_v3.json data/knowledge_vectors
+"""
+import argparse
+import json
+import os
+import zlib
+from typing import Optional, List, Dict, Tuple, Iterable
+import numpy as np
+from .knowledge_index import char_ngrams, content_key
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class HashedNgramEncoder:
+    """
+    哈希 n 元组 TF-IDF 投影编码器（无需模型的默认编码器）
+
+    字符一元组和二元组经 CRC32 哈希到固定维度（带符号，减少冲突偏差），
+    按语料 IDF 加权后做 L2 归一化
+    """
+
+    name = "hashed_ngram"
+
+    def __init__(self, dim: int = 1024, idf: Optional[np.ndarray] = None):
+        self.dim = dim
+        self.idf = idf if idf is not None else np.ones(dim, dtype=np.float32)
+
+    @staticmethod
+    def _grams(text: str) -> List[str]:
+        return char_ngrams(text, n=1) + char_ngrams(text, n=2)
+
+    def _buckets(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        grams = self._grams(text)
+        hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint32, count=len(grams))
+        buckets = (hashes % self.dim).astype(np.int64)
+        signs = np.where((hashes >> 31) & 1, -1.0, 1.0).astype(np.float32)
+        return buckets, signs
+
+    def fit(self, texts: Iterable[str]) -> "HashedNgramEncoder":
+        """根据语料计算各哈希桶的 IDF"""
+        df = np.zeros(self.dim, dtype=np.float64)
+        n_docs = 0
+        for text in texts:
+            buckets, _ = self._buckets(text)
+            df[np.unique(buckets)] += 1
+            n_docs += 1
+        self.idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+        return self
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """编码为 L2 归一化的 float32 矩阵（每行一个文本）"""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            buckets, signs = self._buckets(text)
+            np.add.at(matrix[row], buckets, signs)
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def save(self, prefix: str) -> Dict:
+        np.save(f"{prefix}.idf.npy", self.idf)
+        return {"type": self.name, "dim": self.dim}
+
+    @classmethod
+    def load(cls, prefix: str, meta: Dict) -> "HashedNgramEncoder":
+        return cls(dim=meta["dim"], idf=np.load(f"{prefix}.idf.npy"))
+
+
+class SentenceTransformerEncoder:
+    """
+    sentence-transformers 编码器（可选，需安装 sentence-transformers，CPU 可运行）
+    """
+
+    name = "sentence_transformer"
+
+    def __init__(self, model_name: str = "BAAI/bge-small-zh-v1.5"):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise RuntimeError("使用 sentence_transformer 编码器需要先安装 sentence-transformers")
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def fit(self, texts: Iterable[str]) -> "SentenceTransformerEncoder":
+        return self
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+    def save(self, prefix: str) -> Dict:
+        return {"type": self.name, "dim": self.dim, "model_name": self.model_name}
+
+    @classmethod
+    def load(cls, prefix: str, meta: Dict) -> "SentenceTransformerEncoder":
+        return cls(model_name=meta["model_name"])
+
+
+# 可用编码器（按名称注册）
+ENCODERS = {
+    HashedNgramEncoder.name: HashedNgramEncoder,
+    SentenceTransformerEncoder.name: SentenceTransformerEncoder,
+}
+
+
+def document_text(item: Dict) -> str:
+    """用于编码的条目文本（标题 + 关键词 + 内容）"""
+    return " ".join([item.get("title") or "", item.get("keywords") or "", item.get("content") or ""])
+
+
+def build_vector_index(items: List[Dict], output_prefix: str, encoder=None) -> int:
+    """
+    离线构建向量索引
+
+    Args:
+        items: 知识条目（含 title/keywords/content）
+        output_prefix: 输出路径前缀，生成 {prefix}.npy、{prefix}.json 及编码器附属文件
+        encoder: 编码器实例，默认使用 HashedNgramEncoder
+
+    Returns:
+        向量条数
+    """
+    encoder = encoder or HashedNgramEncoder()
+    texts = [document_text(item) for item in items]
+    encoder.fit(texts)
+    matrix = encoder.encode(texts).astype(np.float32)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_prefix)), exist_ok=True)
+    np.save(f"{output_prefix}.npy", matrix)
+    sidecar = {
+        "encoder": encoder.save(output_prefix),
+        "ids": [content_key(item.get("title"), item.get("content")) for item in items],
+    }
+    with open(f"{output_prefix}.json", "w", encoding="utf-8") as f:
+        json.dump(sidecar, f, ensure_ascii=False)
+    return len(items)
+
+
+class VectorIndex:
+    """
+    向量检索索引
+
+    向量矩阵以 mmap_mode="r" 加载，多个 uvicorn worker 共享同一份页缓存
+    """
+
+    def __init__(self, matrix: np.ndarray, ids: List[str], encoder):
+        self.matrix = matrix
+        self.ids = ids
+        self.encoder = encoder
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, prefix: str) -> "VectorIndex":
+        """加载离线构建的索引"""
+        with open(f"{prefix}.json", "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+        meta = sidecar["encoder"]
+        encoder = ENCODERS[meta["type"]].load(prefix, meta)
+        matrix = np.load(f"{prefix}.npy", mmap_mode="r")
+        if matrix.shape[0] != len(sidecar["ids"]):
+            raise ValueError("向量矩阵行数与 ID 附属文件不一致")
+        return cls(matrix, sidecar["ids"], encoder)
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """
+        余弦相似度检索
+
+        Returns:
+            [(内容指纹, 相似度)]，按相似度降序
+        """
+        if not len(self) or not query:
+            return []
+        vector = self.encoder.encode([query])[0]
+        scores = self.matrix @ vector
+        if limit < len(scores):
+            top = np.argpartition(-scores, limit)[:limit]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+
+# 全局向量索引实例（未配置 KNOWLEDGE_VECTOR_PATH 或加载失败时为 None）
+vector_index: Optional[VectorIndex] = None
+
+
+def get_vector_index() -> Optional[VectorIndex]:
+    """获取全局向量索引（未加载时返回 None）"""
+    return vector_index
+
+
+def load_vector_index(prefix: Optional[str]) -> Optional[VectorIndex]:
+    """加载全局向量索引"""
+    global vector_index
+    if not prefix:
+        return None
+    vector_index = VectorIndex.load(prefix)
+    logger.info(f"Vector index loaded: {len(vector_index)} vectors")
+    return vector_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建知识库向量索引")
+    parser.add_argument("input", help="知识库 JSON 文件（如 data/knowledge/knowledge_base_v3.json）")
+    parser.add_argument("output", help="输出路径前缀（如 data/knowledge_vectors）")
+    parser.add_argument("--encoder", default=HashedNgramEncoder.name, choices=sorted(ENCODERS))
+    parser.add_argument("--dim", type=int, default=1024, help="hashed_ngram 编码器维度")
+    parser.add_argument("--model", default="BAAI/bge-small-zh-v1.5", help="sentence_transformer 模型名")
+    args = parser.parse_args()
+
+    if args.encoder == HashedNgramEncoder.name:
+        encoder = HashedNgramEncoder(dim=args.dim)
+    else:
+        encoder = SentenceTransformerEncoder(model_name=args.model)
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    count = build_vector_index(items, args.output, encoder)
+    print(f"已写入 {count} 条向量：{args.output}.npy")
+
+
+if __name__ == "__main__":
+    main()
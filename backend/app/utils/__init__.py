@@ -1,10 +1,13 @@
-from .security import hash_password, verify_password
+from .security import hash_password, verify_password, ahash_password, averify_password, password_executor
 from .jwt import create_access_token, verify_token
 from .redis_cache import cache, RedisCache
 
 __all__ = [
     "hash_password",
     "verify_password",
+    "ahash_password",
+    "averify_password",
+    "password_executor",
     "create_access_token",
     "verify_token",
     "cache",
@@ -2,6 +2,9 @@ from datetime import datetime, timedelta
 from typing import Optional
 from jose import jwt, JWTError
 from ..config import settings
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -44,14 +47,11 @@ def verify_token(token: str) -> Optional[dict]:
         解码后的数据，验证失败返回 None
     """
     try:
-        print(f"正在验证 Token，SECRET_KEY: {settings.SECRET_KEY[:10]}...")
-        payload = jwt.decode(
+        return jwt.decode(
             token,
             settings.SECRET_KEY,
             algorithms=[settings.ALGORITHM]
         )
-        print(f"Token 验证成功：{payload}")
-        return payload
     except Exception as e:
-        print(f"Token 验证失败：{e}")
+        logger.info(f"Token 验证失败：{e}")
         return None
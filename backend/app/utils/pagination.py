@@ -0,0 +1,99 @@
+"""
+游标（keyset）分页
+
+列表按 (时间列, id) 排序（默认倒序），下一页的条件为 (时间列, id) 越过上一页最后一行，
+MySQL 直接在时间列索引上定位起点（InnoDB 二级索引隐含主键），翻到第 N 页与第 1 页代价相同。
+
+下一页游标放在响应头 X-Next-Cursor 中，响应体仍是原来的列表，旧客户端不受影响；
+游标对客户端不透明，没有更多数据时不返回该响应头。
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, List, Tuple
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, or_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+
+def encode_cursor(timestamp: datetime, row_id: int, descending: bool = True) -> str:
+    """把排序键编码为不透明的游标字符串"""
+    raw = json.dumps(
+        {"t": timestamp.isoformat(), "id": row_id, "d": int(descending)},
+        separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, descending: bool = True) -> Tuple[datetime, int]:
+    """解析游标，格式错误或与当前排序方向不一致时返回 400"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if bool(data.get("d", 1)) != descending:
+            raise ValueError("sort order changed")
+        return datetime.fromisoformat(data["t"]), int(data["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的分页游标"
+        )
+
+
+def keyset_page(
+    query,
+    time_column,
+    id_column,
+    limit: int,
+    cursor: Optional[str] = None,
+    offset: int = 0,
+    response: Optional[Response] = None,
+    descending: bool = True,
+    include_total: bool = False
+) -> List:
+    """
+    按 (time_column, id_column) 排序取一页
+
+    Args:
+        cursor: 上一页返回的游标；提供时忽略 offset
+        offset: 兼容旧的 skip/page 参数
+        response: 用于写入 X-Next-Cursor / X-Total-Count 响应头
+        descending: 是否倒序
+        include_total: 是否额外执行一次 COUNT 返回筛选后的总数
+
+    Returns:
+        本页记录
+    """
+    if include_total and response is not None:
+        response.headers[TOTAL_COUNT_HEADER] = str(query.order_by(None).count())
+
+    if cursor:
+        last_time, last_id = decode_cursor(cursor, descending)
+        # 先以时间列的单边范围确定索引区间，再排除同一时间已返回的行
+        if descending:
+            query = query.filter(
+                time_column <= last_time,
+                or_(time_column < last_time, and_(time_column == last_time, id_column < last_id))
+            )
+        else:
+            query = query.filter(
+                time_column >= last_time,
+                or_(time_column > last_time, and_(time_column == last_time, id_column > last_id))
+            )
+
+    if descending:
+        query = query.order_by(time_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(time_column.asc(), id_column.asc())
+    if offset and not cursor:
+        query = query.offset(offset)
+    rows = query.limit(limit + 1).all()
+    page = rows[:limit]
+    if response is not None and len(rows) > limit:
+        last = page[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            getattr(last, time_column.key), getattr(last, id_column.key), descending
+        )
+    return page
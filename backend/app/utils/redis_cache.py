@@ -133,6 +133,57 @@ class RedisCache:
             print(f"Redis lrange error: {e}")
             return []
 
+    def try_lrange(self, key: str, start: int = 0, end: int = -1) -> Optional[list]:
+        """
+        获取列表范围，Redis 未启用或出错时返回 None（用于区分"列表为空"和"Redis 不可用"）
+        """
+        if not self.enabled:
+            return None
+        try:
+            values = self.redis_client.lrange(key, start, end)
+        except Exception as e:
+            print(f"Redis lrange error: {e}")
+            return None
+        result = []
+        for v in values:
+            try:
+                result.append(json.loads(v))
+            except (json.JSONDecodeError, TypeError):
+                result.append(v)
+        return result
+
+    def replace_list(self, key: str, values: list, seconds: int) -> bool:
+        """用 values 整体替换列表并设置过期时间（一次往返）"""
+        if not self.enabled:
+            return False
+        try:
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.delete(key)
+            if values:
+                pipe.rpush(key, *[
+                    json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v
+                    for v in values
+                ])
+                pipe.expire(key, seconds)
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f"Redis replace_list error: {e}")
+            return False
+
+    def delete_pattern(self, pattern: str) -> int:
+        """删除匹配 pattern 的所有键（SCAN 遍历，不阻塞 Redis）"""
+        if not self.enabled:
+            return 0
+        try:
+            keys = list(self.redis_client.scan_iter(match=pattern, count=500))
+            for start in range(0, len(keys), 500):
+                self.redis_client.delete(*keys[start:start + 500])
+            return len(keys)
+        except Exception as e:
+            print(f"Redis delete_pattern error: {e}")
+            return 0
+
     def ltrim(self, key: str, start: int = 0, end: int = -1) -> bool:
         """修剪列表"""
         if not self.enabled:
@@ -144,6 +195,58 @@ class RedisCache:
             print(f"Redis ltrim error: {e}")
             return False
 
+    def push_capped(self, key: str, value: Any, max_length: int, seconds: int) -> bool:
+        """
+        列表左侧推送并保留最近 max_length 条、刷新过期时间
+
+        lpush、ltrim、expire 通过 pipeline 一次往返完成
+        """
+        if not self.enabled:
+            return False
+        try:
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value, ensure_ascii=False)
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.lpush(key, value)
+            pipe.ltrim(key, 0, max_length - 1)
+            pipe.expire(key, seconds)
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f"Redis push_capped error: {e}")
+            return False
+
+    def incr(self, key: str) -> Optional[int]:
+        """计数器加 1，返回新值；Redis 未启用或出错时返回 None"""
+        if not self.enabled:
+            return None
+        try:
+            return int(self.redis_client.incr(key))
+        except Exception as e:
+            print(f"Redis incr error: {e}")
+            return None
+
+    def setnx(self, key: str, value: str) -> bool:
+        """键不存在时写入，返回是否写入"""
+        if not self.enabled:
+            return False
+        try:
+            return bool(self.redis_client.set(key, value, nx=True))
+        except Exception as e:
+            print(f"Redis setnx error: {e}")
+            return False
+
+    def get_counter(self, key: str) -> Optional[int]:
+        """读取计数器（不存在为 0）；Redis 未启用或出错时返回 None"""
+        if not self.enabled:
+            return None
+        try:
+            value = self.redis_client.get(key)
+        except Exception as e:
+            print(f"Redis get error: {e}")
+            return None
+        return int(value) if value is not None else 0
+
     def expire(self, key: str, seconds: int) -> bool:
         """设置过期时间"""
         if not self.enabled:
@@ -1,4 +1,10 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
 from passlib.context import CryptContext
+from ..config import settings
 
 # 创建密码加密上下文
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -29,3 +35,81 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         验证结果
     """
     return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordExecutor:
+    """
+    密码哈希专用线程池
+
+    bcrypt 每次计算约 100-300ms CPU，直接在 async 路由中调用会阻塞事件循环；
+    这里用固定线程数的线程池执行，线程数即同时进行的哈希计算上限，超出的请求排队等待，
+    并记录排队时间（提交到开始执行）
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._metrics = {
+            "submitted": 0, "started": 0, "completed": 0, "queue_ms_total": 0.0, "queue_ms_max": 0.0
+        }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="password"
+                )
+            return self._executor
+
+    async def run(self, func: Callable, *args):
+        """在线程池中执行 func(*args)，不阻塞事件循环"""
+        submitted_at = time.perf_counter()
+
+        def task():
+            queue_ms = (time.perf_counter() - submitted_at) * 1000
+            with self._lock:
+                self._metrics["started"] += 1
+                self._metrics["queue_ms_total"] += queue_ms
+                self._metrics["queue_ms_max"] = max(self._metrics["queue_ms_max"], queue_ms)
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self._metrics["completed"] += 1
+
+        with self._lock:
+            self._metrics["submitted"] += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), task)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["queued"] = metrics["submitted"] - metrics["started"]
+        metrics["running"] = metrics["started"] - metrics["completed"]
+        started = metrics["started"]
+        metrics["queue_ms_avg"] = round(metrics["queue_ms_total"] / started, 2) if started else 0.0
+        metrics["queue_ms_total"] = round(metrics["queue_ms_total"], 2)
+        metrics["queue_ms_max"] = round(metrics["queue_ms_max"], 2)
+        return metrics
+
+
+# 全局密码哈希线程池
+password_executor = PasswordExecutor(max_workers=settings.PASSWORD_HASH_WORKERS)
+
+
+async def ahash_password(password: str) -> str:
+    """hash_password 的异步版本（在密码哈希线程池中执行）"""
+    return await password_executor.run(hash_password, password)
+
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    """verify_password 的异步版本（在密码哈希线程池中执行）"""
+    return await password_executor.run(verify_password, plain_password, hashed_password)
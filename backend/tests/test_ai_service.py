@@ -0,0 +1,190 @@
+"""
+AI 服务测试文件
+"""
+import asyncio
+import httpx
+import pytest
+from app.config import settings
+from app.services.ai_service import AIService
+from app.services.response_cache import ResponseCache, response_cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_response_cache(monkeypatch):
+    """默认关闭回复缓存，避免测试之间相互影响"""
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", False)
+    response_cache.clear()
+    yield
+    response_cache.clear()
+
+
+def _make_service(handler) -> AIService:
+    """创建使用 MockTransport 的 AI 服务实例"""
+    service = AIService()
+    service.api_url = "http://inference.test"
+    service.service_type = "autodl"
+    service._async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return service
+
+
+def test_agenerate_response_uses_pooled_client():
+    """测试异步生成复用同一个长连接客户端"""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(str(request.url))
+        return httpx.Response(200, json={"text": "术后 2 小时后可以吃温凉软食。"})
+
+    service = _make_service(handler)
+    client = service._async_client
+
+    async def run():
+        replies = await asyncio.gather(*[
+            service.agenerate_response("种植牙术后多久能吃饭") for _ in range(5)
+        ])
+        await service.shutdown()
+        return replies
+
+    replies = asyncio.run(run())
+    assert replies == ["术后 2 小时后可以吃温凉软食。"] * 5
+    assert calls == ["http://inference.test/generate"] * 5
+    assert client.is_closed
+    assert service._async_client is None
+
+
+def test_autodl_payload_marks_cacheable_prefix():
+    """测试请求体标明系统提示词中可缓存的人设前缀"""
+    from app.services.ai_service import BASE_SYSTEM_PROMPT
+
+    service = AIService()
+    system_prompt = service._build_system_prompt(knowledge=["术后 2 小时后可以进食。"])
+    payload = service._build_autodl_payload("种植牙术后多久能吃饭", system_prompt, "")
+    assert payload["system_prefix_chars"] == len(BASE_SYSTEM_PROMPT)
+    assert payload["system_prompt"][:payload["system_prefix_chars"]] == BASE_SYSTEM_PROMPT
+
+
+def test_agenerate_response_error_message():
+    """测试 AI 服务异常时返回提示语"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(503, json={"detail": "busy"})
+
+    service = _make_service(handler)
+    reply = asyncio.run(service.agenerate_response("你好"))
+    assert "503" in reply
+
+
+def test_astream_response_forwards_deltas():
+    """测试流式生成逐段转发并产出完整回复"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/generate/stream"
+        body = (
+            'data: {"text": "术后"}\n\n'
+            'data: {"text": "2 小时后可以进食。"}\n\n'
+            'data: [DONE]\n\n'
+        )
+        return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+    service = _make_service(handler)
+
+    async def run():
+        return [event async for event in service.astream_response("种植牙术后多久能吃饭")]
+
+    events = asyncio.run(run())
+    assert events[:-1] == [{"delta": "术后"}, {"delta": "2 小时后可以进食。"}]
+    assert events[-1] == {"text": "术后2 小时后可以进食。"}
+
+
+def test_agenerate_response_uses_response_cache(monkeypatch):
+    """测试同一问题复用缓存回复，出错回复不缓存，没有参考知识时不缓存"""
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", True)
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"text": "术后 2 小时后可以进食。"})
+
+    service = _make_service(handler)
+    knowledge = ["种植牙术后 2 小时后可以进食温凉软食。"]
+    monkeypatch.setattr(service, "search_knowledge", lambda db, query, limit=5: knowledge)
+
+    async def run():
+        first = await service.agenerate_response("种植牙后多久能吃东西？", db=object())
+        second = await service.agenerate_response("种植牙后多久能吃东西？", db=object())
+        third = await service.agenerate_response("种植牙后多久能吃东西", db=object())
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert "503" in first
+    assert second == third == "术后 2 小时后可以进食。"
+    assert len(calls) == 2
+
+    knowledge.clear()
+    asyncio.run(service.agenerate_response("全口义齿多少钱", db=object()))
+    asyncio.run(service.agenerate_response("全口义齿多少钱", db=object()))
+    assert len(calls) == 4
+
+
+def test_response_cache_exact_question_and_lru():
+    """测试缓存只按归一化后相同的问题命中，并按 LRU 淘汰"""
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    bucket = cache.bucket_key("v1", ["种植牙术后饮食"])
+    cache.put(bucket, "种植牙后多久能吃东西", "A")
+    cache.put(bucket, "活动义齿怎么清洁", "B")
+    assert cache.get(bucket, "种植牙后多久能吃东西？") == "A"
+    assert cache.get(bucket, "种植牙术后多久能吃东西") is None
+    assert cache.get(cache.bucket_key("v2", ["种植牙术后饮食"]), "种植牙后多久能吃东西") is None
+
+    cache.put(bucket, "烤瓷牙能用多久", "C")  # 淘汰最久未使用的 B
+    assert cache.get(bucket, "活动义齿怎么清洁") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["evictions"] == 1 and stats["entries"] == 2
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("种植牙能用多久", "烤瓷牙能用多久"),
+    ("全口义齿多少钱", "半口义齿多少钱"),
+    ("孕妇能拔牙吗", "孕妇能种牙吗"),
+])
+def test_response_cache_rejects_similar_but_different_questions(cached, asked):
+    """测试字面相似但含义不同的问题不会命中其他问题的回复"""
+    cache = ResponseCache(max_entries=10, ttl_seconds=60)
+    bucket = cache.bucket_key("v1", ["修复体使用寿命与费用"])
+    cache.put(bucket, cached, "回复")
+    assert cache.get(bucket, asked) is None
+    assert cache.get(bucket, cached) == "回复"
+
+
+def test_response_cache_skips_empty_knowledge():
+    """测试没有参考知识时不分桶，既不写入也不命中"""
+    cache = ResponseCache(max_entries=10, ttl_seconds=60)
+    bucket = cache.bucket_key("v1", [])
+    assert bucket is None
+    cache.put(bucket, "全口义齿多少钱", "回复")
+    assert cache.get(bucket, "全口义齿多少钱") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_search_knowledge_keeps_short_query_hits(monkeypatch):
+    """测试短问题的命中不会被相关度门槛全部过滤，无关问题不返回参考知识"""
+    import time
+    from datetime import datetime
+    from app.services import ai_service
+    from app.services.knowledge_index import KnowledgeIndex
+
+    index = KnowledgeIndex()
+    index.build([
+        {"id": 1, "title": "拔牙后注意事项", "content": "拔牙后 24 小时内不要漱口。", "keywords": "拔牙", "created_at": datetime(2026, 1, 1)},
+        {"id": 2, "title": "种植牙术后饮食", "content": "术后吃温凉软食。", "keywords": "种植牙", "created_at": datetime(2026, 1, 1)},
+        {"id": 3, "title": "活动义齿的清洁", "content": "每餐后取下义齿清洗，疼痛怎么办请复诊。", "keywords": "义齿", "created_at": datetime(2026, 1, 1)},
+    ])
+    index.loaded = True
+    index._last_check = time.monotonic()
+    monkeypatch.setattr(ai_service, "knowledge_index", index)
+    monkeypatch.setattr(ai_service, "get_vector_index", lambda: None)
+
+    service = AIService()
+    assert [item["id"] for item in service.search_knowledge_scored(None, "拔牙", limit=3)][:1] == [1]
+    assert [item["id"] for item in service.search_knowledge_scored(None, "种植牙", limit=3)][:1] == [2]
+    assert service.search_knowledge_scored(None, "今天天气怎么样", limit=3) == []
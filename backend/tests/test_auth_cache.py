@@ -0,0 +1,89 @@
+"""
+认证缓存测试文件
+"""
+import time
+from datetime import timedelta
+import pytest
+from types import SimpleNamespace
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models import User
+from app.dependencies import get_current_user, get_patient_id
+from app.services.auth_cache import TokenCache, token_cache, user_cache
+from app.utils.jwt import create_access_token
+
+
+def _session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[User.__table__])
+    db = sessionmaker(bind=engine)()
+    db.add(User(id=1, username="doctor", password_hash="x", real_name="王医生", role="doctor"))
+    db.commit()
+    return db
+
+
+class _NoDatabase:
+    """命中缓存时不应访问数据库"""
+
+    def query(self, *args):
+        raise AssertionError("unexpected database query")
+
+
+def test_token_cache_respects_exp():
+    """测试 Token 缓存在 exp 到期后失效"""
+    cache = TokenCache(max_entries=2)
+    cache.put("a", {"sub": "1", "exp": time.time() + 60})
+    cache.put("b", {"sub": "2", "exp": time.time() - 1})
+    assert cache.get("a")["sub"] == "1"
+    assert cache.get("b") is None
+
+    cache.put("c", {"sub": "3", "exp": time.time() + 60})
+    cache.put("d", {"sub": "4", "exp": time.time() + 60})
+    assert cache.get("a") is None  # LRU 淘汰
+
+
+def test_get_current_user_cached():
+    """测试第二次认证只查缓存，失效后重新查库"""
+    token_cache.clear()
+    user_cache.invalidate()
+    db = _session()
+    token = create_access_token({"sub": "1"}, expires_delta=timedelta(minutes=5))
+
+    user = get_current_user(token=token, db=db)
+    assert user.username == "doctor"
+
+    cached = get_current_user(token=token, db=_NoDatabase())
+    assert cached.id == 1 and cached.role == "doctor"
+
+    user_cache.invalidate(1)
+    assert get_current_user(token=token, db=db).real_name == "王医生"
+
+    with pytest.raises(HTTPException):
+        get_current_user(token="invalid", db=db)
+    db.close()
+
+
+def test_get_patient_id_cached_per_request():
+    """测试患者 Token 只解码一次，结果保存在 request.state"""
+    token_cache.clear()
+    token = create_access_token({"sub": "patient:42"}, expires_delta=timedelta(minutes=5))
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    request = SimpleNamespace(state=SimpleNamespace())
+    assert get_patient_id(request, credentials) == 42
+    assert request.state.patient_id == 42
+    assert get_patient_id(request, None) == 42  # 同一请求直接复用
+    assert token_cache.stats()["entries"] == 1
+
+    other = SimpleNamespace(state=SimpleNamespace())
+    assert get_patient_id(other, credentials) == 42
+    assert token_cache.stats()["hits"] >= 1
+
+    staff_token = create_access_token({"sub": "1"}, expires_delta=timedelta(minutes=5))
+    staff = HTTPAuthorizationCredentials(scheme="Bearer", credentials=staff_token)
+    assert get_patient_id(SimpleNamespace(state=SimpleNamespace()), staff) is None
+    assert get_patient_id(SimpleNamespace(state=SimpleNamespace()), None) is None
@@ -0,0 +1,139 @@
+"""
+对话写后持久化测试文件
+"""
+import asyncio
+import itertools
+import json
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models import Dialogue, DailyStats
+from app.services.dialogue_writer import DialogueWriter
+
+
+def _session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine, tables=[Dialogue.__table__, DailyStats.__table__])
+    return sessionmaker(bind=engine)
+
+
+def _writer(session_factory, **kwargs) -> DialogueWriter:
+    counter = itertools.count(1, 10)
+    return DialogueWriter(
+        session_factory=session_factory,
+        id_block_size=10,
+        reserve_ids=lambda db, count: next(counter),
+        **kwargs
+    )
+
+
+def test_write_behind_batches_rows():
+    """测试对话记录批量写入，返回的 ID 与库中一致"""
+    session_factory = _session_factory()
+    writer = _writer(session_factory, batch_size=50, flush_interval_ms=50)
+
+    async def run():
+        await writer.start()
+        rows = await asyncio.gather(*[
+            writer.submit(1, "s1", f"问题{i}", f"回复{i}") for i in range(25)
+        ])
+        await writer.stop()
+        return rows
+
+    rows = asyncio.run(run())
+    assert sorted(row["id"] for row in rows) == list(range(1, 26))
+
+    db = session_factory()
+    stored = {d.id: d.user_message for d in db.query(Dialogue).all()}
+    assert stored == {row["id"]: row["user_message"] for row in rows}
+    assert sum(day.dialogues for day in db.query(DailyStats).all()) == 25
+    db.close()
+
+    stats = writer.stats()
+    assert stats["flushed"] == 25
+    assert stats["batches"] < 25
+
+
+def test_write_behind_spills_on_shutdown(tmp_path):
+    """测试关闭时数据库不可用则落盘，下次启动补写"""
+    spill_path = str(tmp_path / "pending.jsonl")
+    session_factory = _session_factory()
+
+    def broken_factory():
+        raise RuntimeError("database down")
+
+    writer = _writer(broken_factory, flush_interval_ms=10, spill_path=spill_path)
+    writer._next_id, writer._block_end = 1, 100  # 跳过 ID 预留
+
+    async def run_down():
+        await writer.start()
+        await writer.submit(1, "s1", "问题", "回复")
+        await writer.stop()
+
+    asyncio.run(run_down())
+    assert writer.stats()["spilled"] == 1
+
+    restarted = _writer(session_factory, spill_path=spill_path)
+
+    async def run_up():
+        await restarted.start()
+        await restarted.stop()
+
+    asyncio.run(run_up())
+    db = session_factory()
+    assert db.query(Dialogue).count() == 1
+    db.close()
+    assert not (tmp_path / "pending.jsonl").exists()
+
+
+def test_write_behind_keeps_rejected_rows(tmp_path):
+    """测试违反约束的记录另存到 .rejected 文件，其余记录照常写入"""
+    spill_path = str(tmp_path / "pending.jsonl")
+    session_factory = _session_factory()
+    db = session_factory()
+    db.add(Dialogue(id=1, patient_id=1, session_id="old", user_message="旧问题", ai_response="旧回复"))
+    db.commit()
+    db.close()
+
+    writer = _writer(session_factory, flush_interval_ms=50, spill_path=spill_path)
+
+    async def run():
+        await writer.start()
+        rows = [await writer.submit(1, "s1", f"问题{i}", f"回复{i}") for i in range(3)]
+        await writer.stop()
+        return rows
+
+    rows = asyncio.run(run())
+    stats = writer.stats()
+    assert (stats["flushed"], stats["rejected"], stats["dropped"]) == (2, 1, 0)
+
+    rejected = [json.loads(line) for line in (tmp_path / "pending.jsonl.rejected").read_text(encoding="utf-8").splitlines()]
+    assert [(r["id"], r["user_message"]) for r in rejected] == [(rows[0]["id"], "问题0")]
+    assert not (tmp_path / "pending.jsonl").exists()
+
+
+def test_sync_save_uses_auto_increment(monkeypatch):
+    """测试未开启写后模式时同步写入沿用自增 ID，不访问 id_sequences"""
+    from sqlalchemy import event
+    from app.api import dialogues
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "DIALOGUE_WRITE_BEHIND", False)
+    session_factory = _session_factory()
+    db = session_factory()
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+    saved = [
+        asyncio.run(dialogues.save_dialogue(db, 1, "s1", f"问题{i}", f"回复{i}", "ai"))
+        for i in range(2)
+    ]
+    assert [d.id for d in saved] == [1, 2]
+    assert not any("id_sequences" in statement for statement in statements)
+    db.close()
@@ -0,0 +1,88 @@
+"""
+复诊计划批量生成测试文件
+"""
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models import Patient, Appointment, DailyStats
+from app.services.followup_service import create_followup_plans, expand_template
+
+
+def _session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[Patient.__table__, Appointment.__table__, DailyStats.__table__])
+    db = sessionmaker(bind=engine)()
+    db.add_all([Patient(id=1, openid="o1", name="张三"), Patient(id=2, openid="o2", name="李四")])
+    db.commit()
+    return db
+
+
+def test_expand_template_schedules():
+    """测试模板展开的复诊时间（月末日期取目标月最后一天）"""
+    plans = expand_template("固定义齿修复", datetime(2026, 1, 31, 9, 30))
+    assert [p["appointment_date"] for p in plans] == [
+        datetime(2026, 2, 7, 9, 30), datetime(2026, 2, 28, 9, 30), datetime(2026, 4, 30, 9, 30)
+    ]
+    with pytest.raises(ValueError):
+        expand_template("正畸", datetime(2026, 1, 1))
+
+
+def test_create_followup_plans_bulk():
+    """测试批量生成复诊计划并更新汇总表；有不存在的患者时整批不写入"""
+    db = _session()
+    treatment_date = datetime(2026, 3, 2, 10, 0)
+    rows = create_followup_plans(db, [
+        {"patient_id": 1, "treatment_type": "种植义齿修复", "treatment_date": treatment_date},
+        {"patient_id": 2, "treatment_type": "活动义齿修复", "treatment_date": treatment_date, "notes": "上颌"},
+    ])
+    assert len(rows) == 4
+    assert db.query(Appointment).count() == 4
+    stored = {a.id: (a.patient_id, a.appointment_type) for a in db.query(Appointment).all()}
+    assert {row.id: (row.patient_id, row.appointment_type) for row in rows} == stored
+    assert [row.appointment_type for row in rows][:2] == ["种植牙术后拆线", "种植二期手术"]
+    assert db.query(Appointment).filter(Appointment.patient_id == 2).first().notes.endswith("上颌")
+    assert sum(day.appointments for day in db.query(DailyStats).all()) == 4
+
+    with pytest.raises(LookupError) as error:
+        create_followup_plans(db, [
+            {"patient_id": 1, "treatment_type": "固定义齿修复", "treatment_date": treatment_date},
+            {"patient_id": 99, "treatment_type": "固定义齿修复", "treatment_date": treatment_date},
+        ])
+    assert error.value.args[0] == [99]
+    assert db.query(Appointment).count() == 4
+    db.close()
+
+
+def test_followup_ids_come_from_insert(monkeypatch):
+    """测试返回的 ID 取自插入语句：同一秒创建的相同复诊计划不会被误认为本次插入的行"""
+    from app.services import followup_service
+
+    now = datetime(2026, 3, 2, 10, 0, 0)
+
+    class _FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now
+
+    monkeypatch.setattr(followup_service, "datetime", _FrozenDatetime)
+    db = _session()
+    treatment_date = datetime(2026, 3, 2, 10, 0)
+    db.add(Appointment(
+        id=50, patient_id=1, appointment_date=datetime(2026, 3, 9, 10, 0), appointment_type="种植牙术后拆线",
+        created_at=now, updated_at=now
+    ))
+    db.commit()
+
+    item = {"patient_id": 1, "treatment_type": "种植义齿修复", "treatment_date": treatment_date}
+    rows = create_followup_plans(db, [item])
+    assert [row.id for row in rows] == [51, 52]
+
+    # 不支持 executemany RETURNING 时逐行插入取 ID
+    monkeypatch.setattr(db.get_bind().dialect, "insert_executemany_returning_sort_by_parameter_order", False)
+    rows = create_followup_plans(db, [item])
+    assert [row.id for row in rows] == [53, 54]
+    assert [row.appointment_type for row in rows] == ["种植牙术后拆线", "种植二期手术"]
+    db.close()
@@ -0,0 +1,144 @@
+"""
+知识库导入测试文件
+"""
+import io
+import json
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models import KnowledgeBase
+from app.services.knowledge_import import KnowledgeImporter, import_knowledge, iter_json_array
+from app.services.knowledge_index import knowledge_index
+
+
+def _session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[KnowledgeBase.__table__])
+    return sessionmaker(bind=engine)()
+
+
+def _stream(items):
+    # 与源文件一致：每行一个对象
+    return io.StringIO("[\n" + ",\n".join(json.dumps(i, ensure_ascii=False) for i in items) + "\n]\n")
+
+
+ITEMS = [
+    {"category": "术后护理", "title": "种植牙术后不要用力漱口", "content": "术后 24 小时内只可轻轻含漱。", "keywords": "种植牙，漱口"},
+    {"category": "术后护理", "title": "种植牙术后不要用力漱口", "content": "术后 24 小时内只可轻轻含漱。", "keywords": "种植牙，漱口"},
+    {"category": "义齿护理", "title": "活动义齿的清洁", "content": "每餐后取下义齿清洗。", "keywords": "活动义齿，清洁"},
+]
+
+
+def test_iter_json_array_small_reads():
+    """测试流式解析在对象跨越读取边界时仍能正确解码"""
+    items = list(iter_json_array(_stream(ITEMS), read_size=7))
+    assert items == ITEMS
+    assert list(iter_json_array(io.StringIO("[]"))) == []
+
+
+def test_full_import_swaps_table_and_keeps_ids():
+    """测试全量导入替换整表，未变化的条目保留原 ID 与更新时间"""
+    db = _session()
+    report = import_knowledge(db, _stream(ITEMS), batch_size=1)
+    assert (report["read"], report["duplicates"], report["inserted"]) == (3, 1, 2)
+    rows = {r.title: (r.id, r.updated_at) for r in db.query(KnowledgeBase).all()}
+    assert len(rows) == 2
+
+    # 修改一条、删除一条、新增一条
+    changed = [
+        dict(ITEMS[2], keywords="义齿，清洁"),
+        {"category": "饮食", "title": "术后饮食", "content": "术后当天进食温凉软食。"},
+    ]
+    report = import_knowledge(db, _stream(changed))
+    assert (report["inserted"], report["updated"], report["unchanged"], report["removed"]) == (1, 1, 0, 1)
+    cleaning = db.query(KnowledgeBase).filter(KnowledgeBase.title == "活动义齿的清洁").one()
+    assert cleaning.id == rows["活动义齿的清洁"][0] and cleaning.keywords == "义齿，清洁"
+    assert db.query(KnowledgeBase).count() == 2
+    assert len(knowledge_index) == 2
+    db.close()
+
+
+def test_incremental_import_skips_unchanged():
+    """测试增量导入只写入变化的条目，--prune 停用文件中不存在的条目"""
+    db = _session()
+    import_knowledge(db, _stream(ITEMS), mode="incremental")
+    before = {r.id: r.updated_at for r in db.query(KnowledgeBase).all()}
+
+    items = [ITEMS[0], {"category": "饮食", "title": "术后饮食", "content": "术后当天进食温凉软食。"}]
+    report = import_knowledge(db, _stream(items), mode="incremental", prune=True)
+    assert (report["inserted"], report["updated"], report["unchanged"], report["deactivated"]) == (1, 0, 1, 1)
+
+    kept = db.query(KnowledgeBase).filter(KnowledgeBase.title == ITEMS[0]["title"]).one()
+    assert kept.updated_at == before[kept.id]
+    assert db.query(KnowledgeBase).filter(KnowledgeBase.is_active == 1).count() == 2
+    assert len(knowledge_index) == 2
+    db.close()
+
+
+def test_full_import_new_entry_before_kept_ids():
+    """测试新条目排在保留条目之前时不会占用保留条目的原 ID"""
+    db = _session()
+    a, b, c = ({"category": "护理", "title": t, "content": f"{t}的内容"} for t in "ABC")
+    import_knowledge(db, _stream([a, b, c]), batch_size=2)
+    ids = {r.title: r.id for r in db.query(KnowledgeBase).all()}
+
+    new = {"category": "护理", "title": "N", "content": "N的内容"}
+    report = import_knowledge(db, _stream([a, new, b, c]), batch_size=2)
+    assert (report["inserted"], report["unchanged"]) == (1, 3)
+    after = {r.title: r.id for r in db.query(KnowledgeBase).all()}
+    assert {t: after[t] for t in "ABC"} == ids
+    assert after["N"] > max(ids.values())
+    db.close()
+
+
+def test_full_import_failure_drops_shadow_table():
+    """测试导入失败时删除影子表，原表保持不变"""
+    db = _session()
+    import_knowledge(db, _stream(ITEMS))
+    broken = io.StringIO('[{"category": "护理", "title": "X", "content": "X"}, {"title": ')
+    with pytest.raises(ValueError):
+        import_knowledge(db, broken)
+    assert not inspect(db.get_bind()).has_table("knowledge_base_new")
+    assert db.query(KnowledgeBase).count() == 2
+    db.close()
+
+
+def test_full_import_aborts_on_concurrent_write():
+    """测试导入期间原表被修改时放弃替换，修改不丢失"""
+    db = _session()
+    import_knowledge(db, _stream(ITEMS))
+
+    def items():
+        yield from ITEMS
+        # 模拟导入过程中其他进程新增的条目
+        db.add(KnowledgeBase(category="护理", title="并发新增", content="导入期间新增的内容"))
+        db.commit()
+
+    importer = KnowledgeImporter(db)
+    with pytest.raises(RuntimeError):
+        importer.full(items())
+    assert not inspect(db.get_bind()).has_table("knowledge_base_new")
+    assert db.query(KnowledgeBase).filter(KnowledgeBase.title == "并发新增").count() == 1
+    db.close()
+
+
+def test_knowledge_routes_reject_writes_during_full_import():
+    """测试影子表存在期间知识库增删改接口返回 409"""
+    import asyncio
+    from fastapi import HTTPException
+    from app.api import knowledge
+    from app.schemas.knowledge_base import KnowledgeBaseCreate
+
+    db = _session()
+    KnowledgeImporter(db)._create_shadow()
+    data = KnowledgeBaseCreate(category="护理", title="新条目", content="内容")
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(knowledge.create_knowledge(data, db=db, current_user=None))
+    assert error.value.status_code == 409
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(knowledge.delete_knowledge(1, db=db, current_user=None))
+    assert error.value.status_code == 409
+    assert db.query(KnowledgeBase).count() == 0
+    db.close()
@@ -0,0 +1,98 @@
+"""
+知识库检索测试文件
+"""
+from datetime import datetime
+from app.models.knowledge_base import KnowledgeBase
+from app.services.knowledge_index import KnowledgeIndex, char_ngrams
+
+
+def _doc(id, title, content, keywords="", day=1):
+    return {
+        "id": id,
+        "title": title,
+        "content": content,
+        "keywords": keywords,
+        "created_at": datetime(2026, 1, day),
+    }
+
+
+def _index() -> KnowledgeIndex:
+    index = KnowledgeIndex()
+    index.build([
+        _doc(1, "种植牙术后不要用力漱口", "术后 24 小时内只可轻轻含漱。", "种植牙，漱口，术后", day=1),
+        _doc(2, "种植牙术后饮食", "术后 2 小时内不要进食，之后吃温凉软食。", "种植牙，饮食", day=2),
+        _doc(3, "活动义齿的清洁", "每天取下义齿清洗。", "活动义齿，清洁", day=3),
+    ])
+    return index
+
+
+def test_char_ngrams():
+    """测试字符二元组切分"""
+    assert char_ngrams("种植牙") == ["种植", "植牙"]
+    assert char_ngrams("种植牙，漱口") == ["种植", "植牙", "漱口"]
+    assert char_ngrams("牙") == ["牙"]
+
+
+def test_search_ids_matches_substring():
+    """测试检索结果与子串匹配一致，按创建时间倒序"""
+    index = _index()
+    assert index.search_ids("种植牙") == [2, 1]
+    assert index.search_ids("温凉软食") == [2]
+    assert index.search_ids("义齿") == [3]
+    # 二元组都存在但不连续出现，不应命中
+    assert index.search_ids("种植义齿") == []
+
+
+def test_upsert_and_remove():
+    """测试增量更新索引"""
+    index = _index()
+    row = KnowledgeBase(id=4, title="种植牙刷牙方法", content="使用软毛牙刷。", keywords="种植牙，刷牙",
+                        is_active=1, created_at=datetime(2026, 1, 4))
+    index.upsert(row)
+    assert index.search_ids("种植牙") == [4, 2, 1]
+
+    row.is_active = 0
+    index.upsert(row)
+    assert index.search_ids("刷牙") == []
+
+    index.remove(1)
+    assert index.search_ids("漱口") == []
+    assert len(index) == 2
+
+
+def test_rank_bm25_without_spaces():
+    """测试整句中文查询按 BM25 排序，标题命中优先"""
+    index = _index()
+    ranked = index.rank("种植牙术后多久能吃饭", limit=2)
+    assert [knowledge_id for knowledge_id, _ in ranked] == [2, 1]
+    assert ranked[0][1] > ranked[1][1] > 0
+    assert index.rank("你好") == []
+
+
+def test_vector_index_roundtrip(tmp_path):
+    """测试向量索引离线构建、内存映射加载与检索"""
+    from app.services.knowledge_index import content_key
+    from app.services.vector_index import VectorIndex, build_vector_index
+
+    items = [
+        {"title": "种植牙术后多久能正常吃饭", "content": "术后 2 小时后可进食温凉软食。", "keywords": "种植牙，饮食"},
+        {"title": "活动义齿的清洁", "content": "每天取下义齿清洗。", "keywords": "活动义齿，清洁"},
+    ]
+    prefix = str(tmp_path / "knowledge_vectors")
+    assert build_vector_index(items, prefix) == 2
+
+    index = VectorIndex.load(prefix)
+    assert index.matrix.dtype.name == "float32"
+    key, similarity = index.search("种植牙术后什么时候能吃东西", limit=1)[0]
+    assert key == content_key(items[0]["title"], items[0]["content"])
+    assert 0 < similarity <= 1
+
+
+def test_max_score_normalizes_short_queries():
+    """测试得分上限换算：短问题的命中比例高，只命中常见字组的长问句比例低"""
+    index = _index()
+    top_id, top_score = index.rank("漱口")[0]
+    assert top_id == 1 and top_score / index.max_score("漱口") > 0.5
+    _, weak = index.rank("今天天气怎么样术后")[0]
+    assert weak / index.max_score("今天天气怎么样术后") < 0.1
+    assert index.max_score("") == 0.0 and KnowledgeIndex().max_score("漱口") == 0.0
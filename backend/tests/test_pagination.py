@@ -0,0 +1,75 @@
+"""
+游标分页测试文件
+"""
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models import Patient, Dialogue
+from app.utils.pagination import NEXT_CURSOR_HEADER, keyset_page, decode_cursor
+
+
+def _session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[Patient.__table__, Dialogue.__table__])
+    db = sessionmaker(bind=engine)()
+    db.add(Patient(id=1, openid="o1", name="张三"))
+    base = datetime(2024, 3, 1, 9, 0)
+    # 每两条记录时间相同，检验同一时间的记录不会重复或遗漏
+    for i in range(7):
+        db.add(Dialogue(
+            patient_id=1, session_id="s1", user_message=f"问{i}", ai_response="答",
+            created_at=base + timedelta(minutes=i // 2)
+        ))
+    db.commit()
+    return db
+
+
+def test_keyset_pages_match_offset():
+    """测试沿游标翻页的结果与 OFFSET 分页一致"""
+    db = _session()
+    expected = [d.id for d in keyset_page(db.query(Dialogue), Dialogue.created_at, Dialogue.id, limit=100)]
+
+    seen, cursor = [], None
+    while True:
+        response = Response()
+        page = keyset_page(db.query(Dialogue), Dialogue.created_at, Dialogue.id,
+                           limit=3, cursor=cursor, response=response)
+        seen.extend(d.id for d in page)
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if not cursor:
+            break
+
+    assert seen == expected
+    assert len(seen) == 7
+    offset_page = keyset_page(db.query(Dialogue), Dialogue.created_at, Dialogue.id, limit=3, offset=3)
+    assert [d.id for d in offset_page] == expected[3:6]
+    db.close()
+
+
+def test_invalid_cursor():
+    """测试无效游标返回 400"""
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor("not-a-cursor")
+    assert exc.value.status_code == 400
+
+
+def test_keyset_ascending_and_total():
+    """测试正序翻页、总数响应头，以及排序方向变化时游标失效"""
+    db = _session()
+    response = Response()
+    first = keyset_page(db.query(Dialogue), Dialogue.created_at, Dialogue.id,
+                        limit=4, response=response, descending=False, include_total=True)
+    assert response.headers["X-Total-Count"] == "7"
+    cursor = response.headers[NEXT_CURSOR_HEADER]
+
+    second = keyset_page(db.query(Dialogue), Dialogue.created_at, Dialogue.id,
+                         limit=4, cursor=cursor, descending=False)
+    assert [d.id for d in first + second] == list(range(1, 8))
+
+    with pytest.raises(HTTPException):
+        keyset_page(db.query(Dialogue), Dialogue.created_at, Dialogue.id, limit=4, cursor=cursor)
+    db.close()
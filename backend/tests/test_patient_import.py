@@ -0,0 +1,80 @@
+"""
+患者批量导入测试文件
+"""
+import io
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models import Patient, DailyStats
+from app.services.patient_import import import_patients
+
+
+def _session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[Patient.__table__, DailyStats.__table__])
+    db = sessionmaker(bind=engine)()
+    db.add(Patient(openid="o1", name="张三", phone="13800000001"))
+    db.commit()
+    return db
+
+
+CSV = (
+    "﻿微信标识,姓名,性别,年龄,手机号,过敏史\n"
+    "o2,李四,男,45,13800000002,\n"
+    ",张三（更新）,男,50,13800000001,青霉素\n"
+    "o3,王五,女,abc,13800000003,\n"
+    "o4,赵六,女,30,13800000002,\n"
+    "o2,李四,男,46,13800000009,\n"
+    ",,,,,\n"
+    "o5,孙七,女,28,,\n"
+)
+
+
+def test_import_csv_upserts_and_reports_errors():
+    """测试 CSV 导入：新增、按手机号匹配更新、逐行错误报告"""
+    db = _session()
+    report = import_patients(db, io.BytesIO(CSV.encode("utf-8")), "patients.csv", chunk_size=2)
+
+    assert (report["total"], report["created"], report["updated"], report["failed"]) == (6, 2, 1, 3)
+    assert [e["row"] for e in report["errors"]] == [4, 5, 6]
+    assert report["errors"][0]["errors"][0].startswith("age")
+
+    zhang = db.query(Patient).filter(Patient.openid == "o1").one()
+    assert zhang.name == "张三（更新）" and zhang.age == 50 and zhang.allergy_history == "青霉素"
+    assert db.query(Patient).count() == 3
+    assert sum(day.new_patients for day in db.query(DailyStats).all()) == 2
+
+    # 重复导入只更新，不新增
+    again = import_patients(db, io.BytesIO(CSV.encode("utf-8")), "patients.csv")
+    assert again["created"] == 0 and db.query(Patient).count() == 3
+    db.close()
+
+
+def test_import_dry_run_and_file_type():
+    """测试只校验模式不写库，不支持的文件类型报错"""
+    db = _session()
+    report = import_patients(db, io.BytesIO(CSV.encode("utf-8")), "patients.csv", dry_run=True)
+    assert report["created"] == 2 and db.query(Patient).count() == 1
+    with pytest.raises(ValueError):
+        import_patients(db, io.BytesIO(b""), "patients.txt")
+    db.close()
+
+
+def test_sparse_import_keeps_existing_fields():
+    """测试只含部分列的文件不会清空已有患者的病史、过敏史"""
+    db = _session()
+    zhang = db.query(Patient).filter(Patient.openid == "o1").one()
+    zhang.age, zhang.medical_history, zhang.allergy_history = 50, "高血压", "青霉素"
+    db.commit()
+
+    csv_text = "openid,name,phone,过敏史\no1,张三（新）,13800000001,\n"
+    report = import_patients(db, io.BytesIO(csv_text.encode("utf-8")), "patients.csv")
+    assert report["updated"] == 1 and report["failed"] == 0
+
+    db.expire_all()
+    zhang = db.query(Patient).filter(Patient.openid == "o1").one()
+    assert zhang.name == "张三（新）"
+    assert (zhang.age, zhang.medical_history, zhang.allergy_history) == (50, "高血压", "青霉素")
+    db.close()
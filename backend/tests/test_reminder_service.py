@@ -0,0 +1,205 @@
+"""
+复诊提醒引擎测试文件
+"""
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models import Patient, Appointment, DailyStats
+from app.services.reminder_service import ReminderEngine, ReminderQueue, LogReminderSender
+
+NOW = datetime(2026, 3, 14, 9, 0)
+
+
+def _session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine, tables=[Patient.__table__, Appointment.__table__, DailyStats.__table__])
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add(Patient(id=1, openid="o1", name="张三"))
+    db.add_all([
+        Appointment(id=1, patient_id=1, appointment_date=NOW + timedelta(hours=2), appointment_type="复查"),
+        Appointment(id=2, patient_id=1, appointment_date=NOW + timedelta(hours=20), appointment_type="复查"),
+        Appointment(id=3, patient_id=1, appointment_date=NOW + timedelta(hours=30), appointment_type="复查"),
+        Appointment(id=4, patient_id=1, appointment_date=NOW + timedelta(hours=5), appointment_type="复查",
+                    status="cancelled"),
+        Appointment(id=5, patient_id=1, appointment_date=NOW + timedelta(hours=10), appointment_type="复查",
+                    reminder_time=NOW + timedelta(hours=1)),
+        Appointment(id=6, patient_id=1, appointment_date=NOW - timedelta(hours=1), appointment_type="复查"),
+    ])
+    db.commit()
+    db.close()
+    return factory
+
+
+class _FlakySender(LogReminderSender):
+    def send(self, reminder):
+        if reminder["id"] == 2:
+            raise RuntimeError("wechat unavailable")
+        super().send(reminder)
+
+
+def test_fire_due_sends_due_reminders_once():
+    """测试只发送到期的待复诊提醒，重复触发和多个 worker 不会重复发送"""
+    factory = _session_factory()
+    sender = LogReminderSender()
+    engine = ReminderEngine(session_factory=factory, sender=sender, batch_size=1)
+    other = ReminderEngine(session_factory=factory, sender=sender)
+
+    # 3 号不在 horizon 内，4 号已取消，6 号已过复诊时间
+    assert engine.reconcile(NOW) == 3
+    assert other.reconcile(NOW) == 3
+    assert engine.fire_due(NOW) == 2
+    assert other.fire_due(NOW) == 0
+    assert sorted(r["id"] for r in sender.sent) == [1, 2]
+
+    # 设置了 reminder_time 的在该时间之后发送
+    assert other.fire_due(NOW + timedelta(hours=1)) == 1
+    assert engine.fire_due(NOW + timedelta(hours=1)) == 0
+    assert sender.sent[-1]["id"] == 5
+
+    db = factory()
+    sent = {a.id: a.reminder_time for a in db.query(Appointment).filter(Appointment.reminder_sent == 1)}
+    db.close()
+    assert set(sent) == {1, 2, 5} and sent[1] == NOW
+
+    stats = engine.stats()
+    assert stats["sent"] == 2 and stats["claimed"] == 2 and stats["fired"] == 3
+    assert stats["max_lag_seconds"] == 22 * 3600  # 2 小时后的复诊应在 22 小时前发送
+
+
+def test_failed_send_is_released():
+    """测试发送失败时释放认领，retry_seconds 秒后重试"""
+    factory = _session_factory()
+    engine = ReminderEngine(session_factory=factory, sender=_FlakySender(), retry_seconds=60)
+
+    engine.reconcile(NOW)
+    assert engine.fire_due(NOW) == 1
+    assert engine.stats()["failed"] == 1
+
+    engine.sender = LogReminderSender()
+    assert engine.fire_due(NOW) == 0
+    assert engine.fire_due(NOW + timedelta(seconds=60)) == 1
+    assert engine.sender.sent[0]["id"] == 2
+
+
+def test_reminder_queue_lazy_updates():
+    """测试最小堆按到期时间弹出，修改和删除的旧条目被跳过"""
+    queue = ReminderQueue()
+    assert queue.push(1, NOW + timedelta(minutes=30))
+    assert queue.push(2, NOW + timedelta(minutes=10))
+    assert not queue.push(3, NOW + timedelta(minutes=20))
+    queue.push(1, NOW + timedelta(minutes=5))  # 修改：提前
+    queue.remove(3)
+
+    assert queue.next_due() == NOW + timedelta(minutes=5)
+    assert queue.pop_due(NOW + timedelta(minutes=15), limit=10) == [1, 2]
+    assert queue.pop_due(NOW + timedelta(hours=1), limit=10) == []
+    assert len(queue) == 0
+
+
+def test_heap_mode_tracks_route_changes():
+    """测试对账加载堆后，只在到期时读取对应的行；路由修改增量更新堆"""
+    factory = _session_factory()
+    sender = LogReminderSender()
+    clock = {"now": NOW}
+    engine = ReminderEngine(
+        session_factory=factory, sender=sender, horizon_hours=6,
+        poll_seconds=3600, reconcile_seconds=3600, clock=lambda: clock["now"]
+    )
+
+    async def run():
+        await engine.start()
+        await asyncio.sleep(0.05)  # 启动时对账并发送已到期的提醒
+        assert sorted(r["id"] for r in sender.sent) == [1, 2]
+        assert len(engine.queue) == 1  # 5 号在 1 小时后到期；3 号不在 horizon 内
+
+        db = factory()
+        appointment = db.get(Appointment, 3)
+        appointment.appointment_date = NOW + timedelta(hours=40)  # 推迟到 horizon 之外
+        db.commit()
+        engine.track(appointment)
+        engine.forget(5)
+        assert len(engine.queue) == 0
+
+        appointment.appointment_date = NOW + timedelta(hours=24, minutes=30)  # 提醒 30 分钟后到期
+        db.commit()
+        engine.track(appointment)
+        db.close()
+        assert engine.queue.next_due() == NOW + timedelta(minutes=30)
+
+        clock["now"] = NOW + timedelta(hours=1)
+        assert engine.fire_due() == 1
+        assert engine.reconcile() == 1  # 5 号仍在库中，对账后重新加入
+        assert engine.fire_due() == 1
+        await engine.stop()
+
+    asyncio.run(run())
+    assert [r["id"] for r in sender.sent][2:] == [3, 5]
+    assert engine.stats()["reconciles"] == 2
+
+
+def test_run_backs_off_when_database_fails():
+    """测试数据库不可用时后台任务退避重试，不会空转"""
+    attempts = []
+
+    def broken_factory():
+        attempts.append(1)
+        raise RuntimeError("database down")
+
+    engine = ReminderEngine(session_factory=broken_factory, poll_seconds=60)
+
+    async def run():
+        await engine.start()
+        await asyncio.sleep(0.5)
+        await engine.stop()
+
+    asyncio.run(run())
+    assert len(attempts) == 1
+    assert engine.stats()["errors"] == 1
+
+
+def test_routes_reschedule_and_bulk_followup_update_heap(monkeypatch):
+    """测试改期后重置已发送的提醒，批量生成的复诊计划直接加入内存堆"""
+    from app.api import appointments
+    from app.schemas.appointment import AppointmentUpdate, FollowupPlanBulkCreate
+
+    factory = _session_factory()
+    sender = LogReminderSender()
+    engine = ReminderEngine(
+        session_factory=factory, sender=sender, horizon_hours=6,
+        poll_seconds=3600, reconcile_seconds=3600, clock=lambda: NOW
+    )
+    monkeypatch.setattr(appointments, "reminder_engine", engine)
+
+    async def run():
+        await engine.start()
+        await asyncio.sleep(0.05)
+        assert 2 in [r["id"] for r in sender.sent]
+
+        db = factory()
+        moved = await appointments.update_appointment(
+            2, AppointmentUpdate(appointment_date=NOW + timedelta(hours=24, minutes=30)), db=db, current_user=None
+        )
+        assert not moved.reminder_sent and moved.reminder_time is None
+        assert engine.queue.next_due() == NOW + timedelta(minutes=30)
+
+        # 7 天后拆线的复诊在 25 小时后，提醒 1 小时后到期
+        plan = FollowupPlanBulkCreate(items=[{
+            "patient_id": 1, "treatment_type": "种植义齿修复",
+            "treatment_date": NOW - timedelta(days=7) + timedelta(hours=25)
+        }])
+        result = await appointments.create_followup_plans_bulk(plan, db=db, current_user=None)
+        db.close()
+        await engine.stop()
+        return result
+
+    result = asyncio.run(run())
+    ids = [row.id for row in result["appointments"]]
+    assert len(engine.queue) == 3 and ids[0] in engine.queue._due and ids[1] not in engine.queue._due
@@ -0,0 +1,59 @@
+"""
+密码哈希线程池测试文件
+"""
+import asyncio
+import time
+from app.utils.security import PasswordExecutor, hash_password, verify_password
+
+
+def test_password_executor_keeps_event_loop_free():
+    """测试哈希计算在线程池中执行，事件循环期间仍可调度其他任务"""
+    executor = PasswordExecutor(max_workers=1)
+
+    def slow_hash(password):
+        time.sleep(0.1)
+        return password[::-1]
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        results = await asyncio.gather(*[executor.run(slow_hash, f"pw{i}") for i in range(3)])
+        task.cancel()
+        return results, ticks
+
+    results, ticks = asyncio.run(run())
+    executor.shutdown()
+    assert results == ["0wp", "1wp", "2wp"]
+    assert ticks >= 10
+
+    stats = executor.stats()
+    assert stats["completed"] == 3 and stats["queued"] == 0
+    assert stats["queue_ms_max"] >= 150  # 单线程时第三个任务至少排队两次计算的时间
+
+
+def test_async_password_roundtrip():
+    """测试异步哈希结果与同步校验兼容"""
+    from app.utils.security import ahash_password, averify_password
+
+    hashed = asyncio.run(ahash_password("secret123"))
+    assert verify_password("secret123", hashed)
+    assert asyncio.run(averify_password("secret123", hash_password("secret123")))
+    assert not asyncio.run(averify_password("wrong", hashed))
+
+
+def test_password_pool_stats_endpoint():
+    """测试统计接口返回全局密码哈希线程池的排队指标"""
+    from app.api.stats import get_password_pool_stats
+    from app.utils.security import ahash_password
+
+    asyncio.run(ahash_password("secret123"))
+    stats = asyncio.run(get_password_pool_stats(current_user=None))
+    assert stats["completed"] >= 1
+    assert {"queued", "running", "queue_ms_avg", "queue_ms_max"} <= set(stats)
@@ -0,0 +1,83 @@
+"""
+会话上下文存储测试文件
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models import Dialogue
+from app.services.session_store import SessionStore
+
+
+class FakeRedis:
+    """只实现 SessionStore 用到的列表操作"""
+
+    def __init__(self, available: bool = True):
+        self.available = available
+        self.lists = {}
+
+    def try_lrange(self, key, start=0, end=-1):
+        if not self.available:
+            return None
+        items = self.lists.get(key, [])
+        return items[start:end + 1 if end >= 0 else None]
+
+    def push_capped(self, key, value, max_length, seconds):
+        if not self.available:
+            return False
+        self.lists[key] = ([value] + self.lists.get(key, []))[:max_length]
+        return True
+
+    def replace_list(self, key, values, seconds):
+        if not self.available:
+            return False
+        self.lists[key] = list(values)
+        return True
+
+    def delete(self, key):
+        self.lists.pop(key, None)
+        return True
+
+
+def _db_with_history():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[Dialogue.__table__])
+    db = sessionmaker(bind=engine)()
+    start = datetime(2026, 1, 1, 9, 0)
+    for i in range(5):
+        db.add(Dialogue(patient_id=1, session_id="s1", user_message=f"问题{i}", ai_response=f"回复{i}",
+                        message_type="consultation", is_handover=0, created_at=start + timedelta(minutes=i)))
+    db.commit()
+    return db
+
+
+def test_cold_miss_warm_loads_from_db():
+    """测试冷启动从数据库加载并回填 Redis，之后不再查询数据库"""
+    db = _db_with_history()
+    redis = FakeRedis()
+    store = SessionStore(redis=redis)
+
+    turns = store.recent("s1", db, max_turns=3)
+    assert [t["user_message"] for t in turns] == ["问题2", "问题3", "问题4"]
+    assert store.stats()["db_loads"] == 1
+
+    store.append("s1", "问题5", "回复5")
+    turns = store.recent("s1", db, max_turns=3)
+    assert [t["user_message"] for t in turns] == ["问题3", "问题4", "问题5"]
+    assert store.stats() == {"redis_hits": 1, "local_hits": 0, "db_loads": 1, "local_sessions": 1}
+
+
+def test_local_lru_when_redis_down():
+    """测试 Redis 不可用时读取进程内缓存"""
+    store = SessionStore(redis=FakeRedis(available=False), max_sessions=2)
+    store.append("s1", "问题", "回复")
+    assert store.recent("s1", db=None) == [{"user_message": "问题", "ai_response": "回复"}]
+    assert store.stats()["local_hits"] == 1
+
+    store.append("s2", "问题", "回复")
+    store.append("s3", "问题", "回复")
+    assert store.recent("s1", db=None) == []
+
+    store.invalidate("s3")
+    assert store.recent("s3", db=None) == []
@@ -0,0 +1,155 @@
+"""
+统计汇总测试文件
+"""
+from datetime import date, datetime, timedelta
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models import Patient, Appointment, Dialogue, DailyStats
+from app.services.stats_service import (
+    register_session, compute_overview, compute_dashboard, rebuild_daily_stats, subtract_dialogues, data_version,
+    DataVersion
+)
+
+TODAY = date.today()
+NOW = datetime.combine(TODAY, datetime.min.time()) + timedelta(hours=10)
+
+
+def _session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    register_session(factory)
+    return factory()
+
+
+def _seed(db):
+    patient = Patient(openid="o1", name="张三", created_at=NOW)
+    old_patient = Patient(openid="o2", name="李四", created_at=NOW - timedelta(days=3))
+    db.add_all([patient, old_patient])
+    db.flush()
+    db.add_all([
+        Appointment(patient_id=patient.id, appointment_date=NOW, appointment_type="拆线", status="pending"),
+        Appointment(patient_id=patient.id, appointment_date=NOW, appointment_type="复查", status="completed"),
+        Appointment(patient_id=old_patient.id, appointment_date=NOW - timedelta(days=1), appointment_type="复查"),
+        Dialogue(patient_id=patient.id, session_id="s1", user_message="问", ai_response="答", created_at=NOW),
+        Dialogue(patient_id=patient.id, session_id="s1", user_message="问", ai_response="答", created_at=NOW,
+                 is_handover=1),
+        Dialogue(patient_id=old_patient.id, session_id="s2", user_message="问", ai_response="答",
+                 created_at=NOW - timedelta(days=1)),
+    ])
+    db.commit()
+    return patient, old_patient
+
+
+def test_overview_from_rollup():
+    """测试汇总表随增删改增量维护，概览与直接计数一致"""
+    db = _session()
+    patient, old_patient = _seed(db)
+
+    overview = compute_overview(db, today=TODAY)
+    assert overview["total_patients"] == 2
+    assert overview["new_patients_today"] == 1
+    assert overview["total_appointments"] == 3
+    assert overview["today_appointments"] == 2
+    assert overview["yesterday_appointments"] == 1
+    assert overview["pending_appointments"] == 2
+    assert overview["completed_appointments_today"] == 1
+    assert overview["total_dialogues"] == 3
+    assert overview["today_dialogues"] == 2
+    assert overview["dialogue_growth_rate"] == 100.0
+    assert overview["handover_count"] == 1
+
+    # 状态变更、改期
+    appointment = db.query(Appointment).filter(Appointment.status == "pending", Appointment.patient_id == patient.id).one()
+    appointment.status = "completed"
+    moved = db.query(Appointment).filter(Appointment.patient_id == old_patient.id).one()
+    moved.appointment_date = NOW
+    db.commit()
+    overview = compute_overview(db, today=TODAY)
+    assert overview["completed_appointments_today"] == 2
+    assert overview["today_appointments"] == 3
+    assert overview["pending_appointments"] == 1
+
+    # 删除患者级联删除复诊和对话
+    db.delete(old_patient)
+    db.commit()
+    overview = compute_overview(db, today=TODAY)
+    assert overview["total_patients"] == 1
+    assert overview["total_appointments"] == 2
+    assert overview["total_dialogues"] == 2
+
+    # 批量删除对话
+    subtract_dialogues(db, Dialogue.session_id == "s1")
+    db.query(Dialogue).filter(Dialogue.session_id == "s1").delete()
+    db.commit()
+    overview = compute_overview(db, today=TODAY)
+    assert overview["total_dialogues"] == 0
+    assert overview["handover_count"] == 0
+
+
+def test_rebuild_matches_incremental():
+    """测试全量重建结果与增量维护一致"""
+    db = _session()
+    _seed(db)
+    incremental = compute_overview(db, today=TODAY)
+    assert rebuild_daily_stats(db) == db.query(func.count(DailyStats.stat_date)).scalar()
+    assert compute_overview(db, today=TODAY) == incremental
+
+
+def test_data_version_bumps_on_commit():
+    """测试修改统计数据的事务提交后版本号递增，回滚和只读事务不递增"""
+    db = _session()
+    before = data_version.bumps
+    _seed(db)
+    assert data_version.bumps == before + 1
+
+    db.add(Patient(openid="o3", name="王五"))
+    db.flush()
+    db.rollback()
+    db.query(Patient).count()
+    db.commit()
+    assert data_version.bumps == before + 1
+
+    dashboard = compute_dashboard(db, today=TODAY)
+    assert dashboard["overview"]["total_patients"] == 2
+    assert [day["count"] for day in dashboard["appointments_trend"][-2:]] == [1, 2]
+    assert {item["status"]: item["count"] for item in dashboard["appointments_status"]} == {
+        "pending": 2, "completed": 1
+    }
+
+
+class _FakeRedis:
+    """只实现 DataVersion 用到的方法"""
+
+    def __init__(self):
+        self.data = {}
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+    def get_counter(self, key):
+        return int(self.data.get(key, 0))
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setnx(self, key, value):
+        return self.data.setdefault(key, value) == value
+
+
+def test_data_version_epoch_changes_after_redis_flush():
+    """测试 Redis 清空后计数器回到相同的值，版本号也不会与清空前重复"""
+    redis = _FakeRedis()
+    version = DataVersion(redis)
+    version.bump()
+    before = version.current()
+    assert before == version.current() and before.endswith(".1")
+
+    redis.data.clear()
+    version.bump()
+    after = version.current()
+    assert after.endswith(".1") and after != before
+    assert DataVersion(None).current() is None
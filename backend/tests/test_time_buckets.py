@@ -0,0 +1,55 @@
+"""
+统计时间分桶测试文件
+"""
+from datetime import date, datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models import Patient, Dialogue
+from app.services.time_buckets import bucket_edges, dense_series
+
+TODAY = date(2024, 3, 6)  # 周三
+
+
+def test_bucket_edges():
+    """测试日/周/月桶边界为连续的半开区间"""
+    days = bucket_edges("day", 3, today=TODAY)
+    assert [d.date() for d in days] == [date(2024, 3, 4), date(2024, 3, 5), date(2024, 3, 6), date(2024, 3, 7)]
+
+    weeks = bucket_edges("week", 2, today=TODAY)
+    assert [d.date() for d in weeks] == [date(2024, 2, 26), date(2024, 3, 4), date(2024, 3, 11)]
+
+    months = bucket_edges("month", 3, today=TODAY)
+    assert [d.date() for d in months] == [date(2024, 1, 1), date(2024, 2, 1), date(2024, 3, 1), date(2024, 4, 1)]
+
+    with pytest.raises(ValueError):
+        bucket_edges("year", 3, today=TODAY)
+
+
+def test_dense_series_zero_fills():
+    """测试按天计数补 0，边界时刻归入后一个桶"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[Patient.__table__, Dialogue.__table__])
+    db = sessionmaker(bind=engine)()
+    db.add(Patient(id=1, openid="o1", name="张三"))
+    for created_at in [
+        datetime(2024, 3, 3, 23, 59),  # 范围之前
+        datetime(2024, 3, 4, 0, 0),
+        datetime(2024, 3, 4, 12, 0),
+        datetime(2024, 3, 6, 0, 0),
+        datetime(2024, 3, 7, 0, 0),  # 范围之后
+    ]:
+        db.add(Dialogue(patient_id=1, session_id="s1", user_message="问", ai_response="答", created_at=created_at))
+    db.commit()
+
+    series = dense_series(db, Dialogue.created_at, "day", 3, today=TODAY)
+    assert series == [
+        {"date": "2024-03-04", "count": 2},
+        {"date": "2024-03-05", "count": 0},
+        {"date": "2024-03-06", "count": 1},
+    ]
+    assert dense_series(db, Dialogue.created_at, "month", 1, today=TODAY) == [{"date": "2024-03-01", "count": 5}]
+    db.close()
+
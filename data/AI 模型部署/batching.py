@@ -0,0 +1,370 @@
+# 推理请求连续批处理调度器（iteration-level scheduling）
+# 后台线程逐步解码：每一步之间新请求完成预填充后加入正在运行的批次，
+# 生成结束（遇到结束符或达到 max_new_tokens）的序列立即离开批次并返回结果，
+# 不必等待同批次中最长的序列。共享系统提示词前缀的请求复用前缀 KV 缓存，只预填充后缀
+
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import List, Optional, Dict, AsyncIterator, Callable
+
+import torch
+
+from prefix_cache import PrefixCache, PastKeyValues
+
+
+@dataclass
+class GenerationRequest:
+    """单个生成请求"""
+    input_ids: List[int]
+    max_new_tokens: int
+    temperature: float
+    future: asyncio.Future
+    loop: asyncio.AbstractEventLoop
+    prefix_ids: Optional[List[int]] = None
+    on_token: Optional[Callable[[int], None]] = None  # 流式请求：每生成一个 token 在事件循环中回调一次
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class _Sequence:
+    """批次中正在解码的序列"""
+    request: GenerationRequest
+    past: PastKeyValues  # batch=1，序列长度为 length
+    length: int
+    seen: set  # 已出现过的 token（重复惩罚用）
+    generated: List[int] = field(default_factory=list)
+
+
+def _to_legacy(past) -> PastKeyValues:
+    if hasattr(past, "to_legacy_cache"):
+        past = past.to_legacy_cache()
+    return tuple(past)
+
+
+class BatchScheduler:
+    """
+    连续批处理调度器
+
+    - 每个解码步之间接纳新请求（单独预填充，带前缀的请求从前缀 KV 缓存开始）
+    - 批次中各序列的 KV 按长度左填充后拼成一批，一次前向得到所有序列的下一个 token
+    - 序列生成结束即移出批次，其 future 立即完成
+    - temperature 按序列分别应用，top_p、repetition_penalty 全局统一
+    """
+
+    def __init__(
+        self,
+        model,
+        pad_token_id: int,
+        eos_token_id: Optional[int] = None,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        generate_kwargs: Optional[Dict] = None,
+        prefix_cache: Optional[PrefixCache] = None
+    ):
+        self.model = model
+        self.pad_token_id = pad_token_id
+        self.eos_token_id = pad_token_id if eos_token_id is None else eos_token_id
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        generate_kwargs = generate_kwargs or {}
+        self.top_p = generate_kwargs.get("top_p", 1.0)
+        self.repetition_penalty = generate_kwargs.get("repetition_penalty", 1.0)
+        self.prefix_cache = prefix_cache
+        self._queue: "queue.Queue[Optional[GenerationRequest]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._active: List[_Sequence] = []
+        self._stopping = False
+        # 最近 10 秒内每次前向的 (时间, 生成 token 数)，用于计算 tokens/sec
+        self._recent: "deque" = deque()
+        self._stats = {"requests": 0, "completed": 0, "steps": 0, "tokens": 0, "max_active": 0}
+
+    def start(self) -> None:
+        """启动工作线程"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._loop, name="batch-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """停止工作线程（处理完已在队列中和正在解码的请求）"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _enqueue(
+        self,
+        input_ids: List[int],
+        max_new_tokens: int,
+        temperature: float,
+        prefix_ids: Optional[List[int]],
+        on_token: Optional[Callable[[int], None]] = None
+    ) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if prefix_ids and self.prefix_cache is None:
+            input_ids, prefix_ids = list(prefix_ids) + list(input_ids), None
+        request = GenerationRequest(
+            list(input_ids), max_new_tokens, temperature, future, loop,
+            prefix_ids=list(prefix_ids) if prefix_ids else None,
+            on_token=on_token
+        )
+        self._queue.put(request)
+        return future
+
+    async def submit(
+        self,
+        input_ids: List[int],
+        max_new_tokens: int,
+        temperature: float,
+        prefix_ids: Optional[List[int]] = None
+    ) -> List[int]:
+        """
+        提交生成请求
+
+        Args:
+            input_ids: 已编码的提示词 token（不含填充；指定 prefix_ids 时为前缀之后的部分）
+            max_new_tokens: 最大生成 token 数
+            temperature: 温度参数（0 为贪心解码）
+            prefix_ids: 可缓存的系统提示词前缀 token（可选）
+
+        Returns:
+            新生成的 token（不含提示词和结束符）
+        """
+        return await self._enqueue(input_ids, max_new_tokens, temperature, prefix_ids)
+
+    async def stream(
+        self,
+        input_ids: List[int],
+        max_new_tokens: int,
+        temperature: float,
+        prefix_ids: Optional[List[int]] = None
+    ) -> AsyncIterator[int]:
+        """
+        流式提交生成请求，逐个产出新生成的 token
+
+        调用方提前结束迭代（如客户端断开）时，序列在下一个解码步离开批次
+        """
+        tokens: "asyncio.Queue[int]" = asyncio.Queue()
+        future = self._enqueue(input_ids, max_new_tokens, temperature, prefix_ids, on_token=tokens.put_nowait)
+        try:
+            while True:
+                # token 回调先于 future 完成回调入队，future 完成时队列中已是全部 token
+                if tokens.empty() and future.done():
+                    future.result()  # 传播生成异常
+                    return
+                getter = asyncio.ensure_future(tokens.get())
+                await asyncio.wait([getter, future], return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def stats(self) -> Dict:
+        """调度统计：队列深度、活跃序列数、吞吐量"""
+        stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["active_sequences"] = len(self._active)
+        now = time.monotonic()
+        recent = [(t, n) for t, n in list(self._recent) if now - t <= 10.0]
+        if recent:
+            elapsed = max(now - recent[0][0], 1e-3)
+            stats["tokens_per_sec"] = round(sum(n for _, n in recent) / elapsed, 2)
+        else:
+            stats["tokens_per_sec"] = 0.0
+        return stats
+
+    # ========== 工作线程 ==========
+
+    def _loop(self) -> None:
+        while True:
+            self._admit()
+            if not self._active:
+                if self._stopping:
+                    return
+                continue
+            try:
+                self._step()
+            except Exception as e:
+                # 批次前向失败：批次内所有序列以异常结束
+                for seq in self._active:
+                    self._finish(seq, error=e)
+                self._active = []
+
+    def _admit(self) -> None:
+        """在解码步之间接纳新请求"""
+        if self._stopping:
+            return
+        if not self._active:
+            # 空闲时阻塞等待第一个请求，再等待 max_wait_ms 让并发请求一起开始
+            request = self._queue.get()
+            if request is None:
+                self._stopping = True
+                return
+            self._prefill(request)
+            deadline = time.monotonic() + self.max_wait
+        else:
+            deadline = time.monotonic()
+
+        while len(self._active) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if request is None:
+                self._stopping = True
+                return
+            self._prefill(request)
+
+    def _prefill(self, request: GenerationRequest) -> None:
+        """预填充单个请求，采样第一个 token 后加入批次"""
+        self._stats["requests"] += 1
+        if request.future.done():  # 排队期间已被取消
+            return
+        try:
+            device = next(self.model.parameters()).device
+            prefix = request.prefix_ids or []
+            past = self.prefix_cache.get(prefix) if prefix else None
+            length = len(prefix) + len(request.input_ids)
+            with torch.no_grad():
+                outputs = self.model(
+                    input_ids=torch.tensor([request.input_ids], dtype=torch.long, device=device),
+                    attention_mask=torch.ones((1, length), dtype=torch.long, device=device),
+                    position_ids=torch.arange(len(prefix), length, device=device).unsqueeze(0),
+                    past_key_values=past,
+                    use_cache=True
+                )
+            seq = _Sequence(
+                request=request,
+                past=_to_legacy(outputs.past_key_values),
+                length=length,
+                seen=set(prefix) | set(request.input_ids)
+            )
+            self._record(1)
+            if self._append(seq, self._sample(outputs.logits[0, -1], seq)):
+                self._active.append(seq)
+                self._stats["max_active"] = max(self._stats["max_active"], len(self._active))
+        except Exception as e:
+            request.loop.call_soon_threadsafe(_set_exception, request.future, e)
+
+    def _step(self) -> None:
+        """批次中所有序列解码一步"""
+        device = next(self.model.parameters()).device
+        batch = self._active
+        max_len = max(seq.length for seq in batch)
+
+        # 各序列 KV 左填充到相同长度后按批拼接（每步重新拼接，序列可随时加入或离开）
+        past = []
+        for layer in range(len(batch[0].past)):
+            keys, values = [], []
+            for seq in batch:
+                k, v = seq.past[layer]
+                pad = max_len - seq.length
+                if pad:
+                    k = torch.cat([k.new_zeros(k.shape[:2] + (pad, k.shape[3])), k], dim=2)
+                    v = torch.cat([v.new_zeros(v.shape[:2] + (pad, v.shape[3])), v], dim=2)
+                keys.append(k)
+                values.append(v)
+            past.append((torch.cat(keys, dim=0), torch.cat(values, dim=0)))
+
+        attention_mask = torch.zeros((len(batch), max_len + 1), dtype=torch.long, device=device)
+        for i, seq in enumerate(batch):
+            attention_mask[i, max_len - seq.length:] = 1
+        input_ids = torch.tensor([[seq.generated[-1]] for seq in batch], dtype=torch.long, device=device)
+        position_ids = torch.tensor([[seq.length] for seq in batch], dtype=torch.long, device=device)
+
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                past_key_values=tuple(past),
+                use_cache=True
+            )
+        new_past = _to_legacy(outputs.past_key_values)
+
+        still_active = []
+        for i, seq in enumerate(batch):
+            start = max_len - seq.length
+            seq.past = tuple((k[i:i + 1, :, start:], v[i:i + 1, :, start:]) for k, v in new_past)
+            seq.length += 1
+            if self._append(seq, self._sample(outputs.logits[i, -1], seq)):
+                still_active.append(seq)
+        self._active = still_active
+        self._stats["steps"] += 1
+        self._record(len(batch))
+
+    def _record(self, tokens: int) -> None:
+        self._stats["tokens"] += tokens
+        now = time.monotonic()
+        self._recent.append((now, tokens))
+        while self._recent and now - self._recent[0][0] > 10.0:
+            self._recent.popleft()
+
+    def _sample(self, logits: torch.Tensor, seq: _Sequence) -> int:
+        """按序列的采样参数选出下一个 token"""
+        logits = logits.float()
+        if self.repetition_penalty != 1.0 and seq.seen:
+            index = torch.tensor(list(seq.seen), dtype=torch.long, device=logits.device)
+            scores = logits[index]
+            logits[index] = torch.where(scores < 0, scores * self.repetition_penalty, scores / self.repetition_penalty)
+        temperature = seq.request.temperature
+        if temperature <= 0:
+            return int(torch.argmax(logits))
+        probs = torch.softmax(logits / temperature, dim=-1)
+        if self.top_p < 1.0:
+            sorted_probs, sorted_index = torch.sort(probs, descending=True)
+            # 保留累计概率达到 top_p 的最小集合（至少一个 token）
+            keep = torch.cumsum(sorted_probs, dim=-1) - sorted_probs < self.top_p
+            sorted_probs = sorted_probs * keep
+            choice = torch.multinomial(sorted_probs / sorted_probs.sum(), 1)
+            return int(sorted_index[choice])
+        return int(torch.multinomial(probs, 1))
+
+    def _append(self, seq: _Sequence, token: int) -> bool:
+        """
+        追加生成的 token
+
+        Returns:
+            序列是否继续解码
+        """
+        request = seq.request
+        if request.future.done():  # 调用方已取消
+            return False
+        if token == self.eos_token_id:
+            self._finish(seq)
+            return False
+        seq.generated.append(token)
+        seq.seen.add(token)
+        if request.on_token is not None:
+            request.loop.call_soon_threadsafe(request.on_token, token)
+        if len(seq.generated) >= request.max_new_tokens:
+            self._finish(seq)
+            return False
+        return True
+
+    def _finish(self, seq: _Sequence, error: Optional[Exception] = None) -> None:
+        self._stats["completed"] += 1
+        request = seq.request
+        if error is not None:
+            request.loop.call_soon_threadsafe(_set_exception, request.future, error)
+        else:
+            request.loop.call_soon_threadsafe(_set_result, request.future, list(seq.generated))
+
+
+def _set_result(future: asyncio.Future, result) -> None:
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, error: Exception) -> None:
+    if not future.done():
+        future.set_exception(error)
@@ -0,0 +1,87 @@
+# 系统提示词前缀 KV 缓存
+# 固定的人设提示词每次请求都相同，预先计算其 past_key_values 并按 token 哈希缓存，
+# 之后的请求只需预填充变化的后缀（参考知识、过敏史、对话历史、问题）
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Dict, Tuple
+
+import torch
+
+# 每层一个 (key, value)，形状为 [batch, heads, seq_len, head_dim]
+PastKeyValues = Tuple[Tuple[torch.Tensor, torch.Tensor], ...]
+
+
+def prefix_key(prefix_ids: List[int]) -> str:
+    """前缀 token 序列的哈希键"""
+    data = ",".join(map(str, prefix_ids)).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+class PrefixCache:
+    """
+    前缀 KV 缓存（LRU）
+
+    缓存内容为只读的 legacy tuple 格式：transformers 每步生成都通过拼接得到新张量，
+    不会原地修改缓存中的张量，因此同一份前缀可被并发请求共享
+    """
+
+    def __init__(self, model, max_entries: int = 8):
+        self.model = model
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, PastKeyValues]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "saved_tokens": 0}
+
+    def get(self, prefix_ids: List[int]) -> PastKeyValues:
+        """
+        获取前缀的 past_key_values，未命中时做一次前向计算并缓存
+
+        Args:
+            prefix_ids: 前缀 token 序列
+
+        Returns:
+            batch=1 的 past_key_values
+        """
+        key = prefix_key(prefix_ids)
+        with self._lock:
+            past = self._entries.get(key)
+            if past is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                self._stats["saved_tokens"] += len(prefix_ids)
+                return past
+
+            # 同一前缀只计算一次（计算期间其他请求等待锁）
+            past = self._compute(prefix_ids)
+            self._entries[key] = past
+            self._stats["misses"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+            return past
+
+    def _compute(self, prefix_ids: List[int]) -> PastKeyValues:
+        device = next(self.model.parameters()).device
+        input_ids = torch.tensor([prefix_ids], dtype=torch.long, device=device)
+        with torch.no_grad():
+            outputs = self.model(input_ids=input_ids, use_cache=True)
+        past = outputs.past_key_values
+        if hasattr(past, "to_legacy_cache"):
+            past = past.to_legacy_cache()
+        return tuple((k.detach(), v.detach()) for k, v in past)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """命中率等统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
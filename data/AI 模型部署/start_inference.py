@@ -2,18 +2,25 @@
 # 使用方法：python start_inference.py 或 python start_inference.py --port 6008 --model_path ./models/dental_qwen_merged
 
 import argparse
+import json
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import uvicorn
-from typing import Optional, List
+from typing import Optional, List, AsyncIterator, Tuple
+from batching import BatchScheduler
+from prefix_cache import PrefixCache
 
 # ========== 命令行参数 ==========
 parser = argparse.ArgumentParser(description='牙科修复 AI 推理服务')
 parser.add_argument('--port', type=int, default=8080, help='服务端口 (默认：8080)')
 parser.add_argument('--model_path', type=str, default='./models/dental_qwen_merged', help='模型路径')
 parser.add_argument('--host', type=str, default='0.0.0.0', help='监听地址 (默认：0.0.0.0)')
+parser.add_argument('--max_batch_size', type=int, default=8, help='连续批处理最大并发序列数 (默认：8)')
+parser.add_argument('--max_wait_ms', type=float, default=10.0, help='空闲时等待并发请求一起开始的时间，毫秒 (默认：10)')
+parser.add_argument('--prefix_cache_size', type=int, default=8, help='系统提示词前缀 KV 缓存条数，0 表示关闭 (默认：8)')
 args = parser.parse_args()
 
 # ========== 配置 ==========
@@ -63,16 +70,27 @@ print(f"   模型类型：{model.config.model_type}")
 print(f"   词表大小：{len(tokenizer)}")
 print("=" * 60)
 
+# ========== 前缀 KV 缓存 ==========
+prefix_cache = PrefixCache(model, max_entries=args.prefix_cache_size) if args.prefix_cache_size > 0 else None
+
+# ========== 连续批处理 ==========
+# 后台线程逐 token 解码，新请求在解码步之间加入批次，生成结束的序列立即返回
+scheduler = BatchScheduler(
+    model,
+    pad_token_id=tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id,
+    eos_token_id=tokenizer.eos_token_id,
+    max_batch_size=args.max_batch_size,
+    max_wait_ms=args.max_wait_ms,
+    generate_kwargs=dict(top_p=0.9, repetition_penalty=1.1),
+    prefix_cache=prefix_cache
+)
+scheduler.start()
+
 
 # ========== 推理函数 ==========
-def generate_response(
-    prompt: str,
-    system_prompt: Optional[str] = None,
-    max_tokens: int = MAX_TOKENS,
-    temperature: float = TEMPERATURE
-) -> str:
+def build_chat_text(prompt: str, system_prompt: Optional[str] = None) -> str:
     """
-    生成 AI 回复
+    构建对话格式并应用 chat template
     """
     # 构建对话格式
     if system_prompt:
@@ -84,33 +102,89 @@ def generate_response(
         messages = [{"role": "user", "content": prompt}]
     
     # 应用 chat template
-    text = tokenizer.apply_chat_template(
+    return tokenizer.apply_chat_template(
         messages,
         tokenize=False,
         add_generation_prompt=True
     )
-    
-    inputs = tokenizer([text], return_tensors="pt").to(model.device)
-    
-    # 生成
-    outputs = model.generate(
-        **inputs,
+
+
+def encode_prompt(
+    prompt: str,
+    system_prompt: Optional[str] = None,
+    system_prefix_chars: Optional[int] = None
+) -> Tuple[List[int], List[int]]:
+    """
+    编码对话，拆分出可缓存的前缀
+
+    system_prefix_chars 指明 system_prompt 开头固定不变的字符数（人设部分），
+    chat template 渲染结果中截至该部分末尾的文本作为前缀单独编码
+
+    Returns:
+        (前缀 token, 后缀 token)；不可拆分时前缀为空
+    """
+    text = build_chat_text(prompt, system_prompt)
+    if prefix_cache is not None and system_prompt and system_prefix_chars:
+        static = system_prompt[:system_prefix_chars]
+        position = text.find(static)
+        if static and position >= 0:
+            end = position + len(static)
+            prefix_ids = tokenizer(text[:end], add_special_tokens=False)["input_ids"]
+            suffix_ids = tokenizer(text[end:], add_special_tokens=False)["input_ids"]
+            if suffix_ids:
+                return prefix_ids, suffix_ids
+    return [], tokenizer(text)["input_ids"]
+
+
+async def generate_batched(
+    prompt: str,
+    system_prompt: Optional[str] = None,
+    max_tokens: int = MAX_TOKENS,
+    temperature: float = TEMPERATURE,
+    system_prefix_chars: Optional[int] = None
+) -> str:
+    """
+    通过连续批处理调度器生成 AI 回复（不阻塞事件循环）
+    """
+    prefix_ids, input_ids = encode_prompt(prompt, system_prompt, system_prefix_chars)
+    tokens = await scheduler.submit(
+        input_ids,
         max_new_tokens=max_tokens,
         temperature=temperature,
-        do_sample=True,
-        top_p=0.9,
-        repetition_penalty=1.1,
-        pad_token_id=tokenizer.eos_token_id
+        prefix_ids=prefix_ids or None
     )
-    
-    # 解码回复
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    
-    # 提取 assistant 回复部分
-    if "assistant" in response:
-        response = response.split("assistant")[-1].strip()
-    
-    return response
+    return tokenizer.decode(tokens, skip_special_tokens=True).strip()
+
+
+async def stream_batched(
+    prompt: str,
+    system_prompt: Optional[str] = None,
+    max_tokens: int = MAX_TOKENS,
+    temperature: float = TEMPERATURE,
+    system_prefix_chars: Optional[int] = None
+) -> AsyncIterator[str]:
+    """
+    流式生成 AI 回复
+
+    请求加入连续批处理调度器，每解码出一段完整文本就产出一次
+    （多字节字符未解码完整时先不输出）
+    """
+    prefix_ids, input_ids = encode_prompt(prompt, system_prompt, system_prefix_chars)
+    tokens: List[int] = []
+    sent = 0
+    async for token in scheduler.stream(
+        input_ids,
+        max_new_tokens=max_tokens,
+        temperature=temperature,
+        prefix_ids=prefix_ids or None
+    ):
+        tokens.append(token)
+        text = tokenizer.decode(tokens, skip_special_tokens=True)
+        if text.endswith("\ufffd"):
+            continue
+        if len(text) > sent:
+            yield text[sent:]
+            sent = len(text)
 
 
 # ========== FastAPI 服务 ==========
@@ -127,6 +201,7 @@ class GenerateRequest(BaseModel):
     system_prompt: Optional[str] = None
     max_tokens: Optional[int] = MAX_TOKENS
     temperature: Optional[float] = TEMPERATURE
+    system_prefix_chars: Optional[int] = None  # system_prompt 开头固定部分的字符数，用于前缀 KV 缓存
 
 
 class GenerateResponse(BaseModel):
@@ -170,7 +245,9 @@ async def health_check():
     return {
         "status": "ok",
         "gpu": torch.cuda.get_device_name(0) if torch.cuda.is_available() else "cpu",
-        "memory_used": f"{torch.cuda.memory_allocated(0) / 1024**3:.2f} GB" if torch.cuda.is_available() else "N/A"
+        "memory_used": f"{torch.cuda.memory_allocated(0) / 1024**3:.2f} GB" if torch.cuda.is_available() else "N/A",
+        "batching": scheduler.stats(),
+        "prefix_cache": prefix_cache.stats() if prefix_cache is not None else None
     }
 
 
@@ -185,17 +262,46 @@ async def generate(request: GenerateRequest):
     - **temperature**: 温度参数
     """
     try:
-        text = generate_response(
+        text = await generate_batched(
             prompt=request.prompt,
             system_prompt=request.system_prompt,
             max_tokens=request.max_tokens or MAX_TOKENS,
-            temperature=request.temperature or TEMPERATURE
+            temperature=request.temperature or TEMPERATURE,
+            system_prefix_chars=request.system_prefix_chars
         )
         return GenerateResponse(text=text)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/generate/stream")
+async def generate_stream(request: GenerateRequest):
+    """
+    流式生成接口（Server-Sent Events）
+
+    每个事件为 `data: {"text": "..."}`，结束时发送 `data: [DONE]`
+    """
+    async def event_stream():
+        try:
+            async for text in stream_batched(
+                prompt=request.prompt,
+                system_prompt=request.system_prompt,
+                max_tokens=request.max_tokens or MAX_TOKENS,
+                temperature=request.temperature or TEMPERATURE,
+                system_prefix_chars=request.system_prefix_chars
+            ):
+                yield f"data: {json.dumps({'text': text}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/v1/chat/completions", response_model=ChatResponse)
 async def chat_completions(request: ChatRequest):
     """
@@ -219,7 +325,7 @@ async def chat_completions(request: ChatRequest):
         if not user_message:
             raise HTTPException(status_code=400, detail="缺少用户消息")
         
-        text = generate_response(
+        text = await generate_batched(
             prompt=user_message,
             system_prompt=system_prompt,
             max_tokens=request.max_tokens or MAX_TOKENS,
@@ -252,7 +358,7 @@ async def test_inference():
     results = []
     for q in test_questions:
         try:
-            answer = generate_response(q)
+            answer = await generate_batched(q)
             results.append({
                 "question": q,
                 "answer": answer[:100] + "..." if len(answer) > 100 else answer
@@ -272,6 +378,7 @@ if __name__ == "__main__":
     print(f"   API 文档：http://localhost:{PORT}/docs")
     print(f"   健康检查：http://localhost:{PORT}/health")
     print(f"   测试接口：http://localhost:{PORT}/test")
+    print(f"   流式接口：http://localhost:{PORT}/generate/stream")
     print("\n按 Ctrl+C 停止服务\n")
     
     uvicorn.run(
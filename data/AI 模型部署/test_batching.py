@@ -0,0 +1,120 @@
+"""
+连续批处理调度器与前缀 KV 缓存测试（CPU，随机初始化的小模型）
+
+运行：cd "data/AI 模型部署" && python -m pytest -q test_batching.py
+"""
+import asyncio
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from batching import BatchScheduler
+from prefix_cache import PrefixCache
+
+EOS = 0
+REPETITION_PENALTY = 1.1
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    config = transformers.Qwen2Config(
+        vocab_size=96,
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=256,
+        eos_token_id=EOS,
+        pad_token_id=EOS
+    )
+    return transformers.Qwen2ForCausalLM(config).eval()
+
+
+def _greedy(model, prompt, max_new_tokens):
+    """HF generate 贪心解码的结果（不含提示词与结束符）"""
+    with torch.no_grad():
+        output = model.generate(
+            torch.tensor([prompt]),
+            attention_mask=torch.ones((1, len(prompt)), dtype=torch.long),
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            repetition_penalty=REPETITION_PENALTY,
+            eos_token_id=EOS,
+            pad_token_id=EOS
+        )
+    tokens = output[0, len(prompt):].tolist()
+    return tokens[:tokens.index(EOS)] if EOS in tokens else tokens
+
+
+def _scheduler(model, prefix_cache=None):
+    scheduler = BatchScheduler(
+        model,
+        pad_token_id=EOS,
+        max_batch_size=4,
+        max_wait_ms=5,
+        generate_kwargs=dict(repetition_penalty=REPETITION_PENALTY),
+        prefix_cache=prefix_cache
+    )
+    scheduler.start()
+    return scheduler
+
+
+PROMPTS = [
+    [5, 17, 33, 8, 61],
+    [12, 40],
+    [7, 7, 90, 23, 45, 3, 19, 66],
+    [88, 2, 51],
+    [30, 31, 32, 33],
+]
+
+
+def test_batched_greedy_matches_generate(model):
+    """测试批处理贪心解码与逐条 generate 一致，包括解码中途加入批次的请求"""
+    scheduler = _scheduler(model)
+
+    async def run():
+        # 第一个请求开始解码后，其余请求在解码步之间陆续加入
+        first = scheduler.stream(PROMPTS[0], max_new_tokens=24, temperature=0)
+        tokens = [await first.__anext__()]
+        others = [
+            asyncio.ensure_future(scheduler.submit(prompt, max_new_tokens=n, temperature=0))
+            for prompt, n in zip(PROMPTS[1:], (6, 16, 10, 20))
+        ]
+        tokens += [token async for token in first]
+        return [tokens] + list(await asyncio.gather(*others))
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        scheduler.stop()
+
+    expected = [_greedy(model, prompt, n) for prompt, n in zip(PROMPTS, (24, 6, 16, 10, 20))]
+    assert results == expected
+    stats = scheduler.stats()
+    assert stats["completed"] == len(PROMPTS) and stats["max_active"] > 1
+
+
+def test_prefix_cache_matches_full_prompt(model):
+    """测试从前缀 KV 缓存开始预填充后缀，结果与完整提示词的 generate 一致"""
+    prefix_cache = PrefixCache(model, max_entries=2)
+    scheduler = _scheduler(model, prefix_cache=prefix_cache)
+    prefix = [9, 14, 27, 71, 4, 38]
+    suffixes = [[5, 17], [52, 11, 80], [63]]
+
+    async def run():
+        return await asyncio.gather(*[
+            scheduler.submit(suffix, max_new_tokens=12, temperature=0, prefix_ids=prefix)
+            for suffix in suffixes
+        ])
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        scheduler.stop()
+
+    assert results == [_greedy(model, prefix + suffix, 12) for suffix in suffixes]
+    stats = prefix_cache.stats()
+    assert stats["misses"] == 1 and stats["hits"] == len(suffixes) - 1
@@ -3,6 +3,10 @@
 -- 描述：基于 AI 智能客服的牙科修复复诊提醒与管理系统
 -- 创建日期：2026-02-22
 -- 版本：v1.3
+--
+-- 注意：本脚本会删除并重建整个数据库，只用于全新安装。
+-- 已有数据的库请执行 upgrade_existing_database.sql 补齐新增的表和索引，
+-- 再在 backend 目录执行 python -m app.services.stats_service rebuild 重建每日统计汇总
 -- ============================================
 
 -- ============================================
@@ -51,7 +55,8 @@ CREATE TABLE `patients` (
     `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
     PRIMARY KEY (`id`),
     UNIQUE KEY `uk_openid` (`openid`),
-    KEY `idx_phone` (`phone`)
+    KEY `idx_phone` (`phone`),
+    KEY `idx_created_at` (`created_at`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='患者表';
 
 -- ============================================
@@ -73,6 +78,7 @@ CREATE TABLE `appointments` (
     KEY `idx_patient_id` (`patient_id`),
     KEY `idx_appointment_date` (`appointment_date`),
     KEY `idx_status` (`status`),
+    KEY `idx_reminder_due` (`reminder_sent`, `appointment_date`),
     CONSTRAINT `fk_app_patient` FOREIGN KEY (`patient_id`) REFERENCES `patients` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='复诊计划表';
 
@@ -114,3 +120,33 @@ CREATE TABLE `knowledge_base` (
     KEY `idx_category` (`category`),
     KEY `idx_keywords` (`keywords`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='知识库表';
+
+-- ============================================
+-- 表 7：ID 序列表（id_sequences）
+-- 开启对话写后持久化（DIALOGUE_WRITE_BEHIND）时从此表预留对话 ID
+-- （写入器按段预留，同步写入每次预留一个）；未开启时对话表使用自增 ID
+-- ============================================
+DROP TABLE IF EXISTS `id_sequences`;
+CREATE TABLE `id_sequences` (
+    `name` VARCHAR(50) NOT NULL COMMENT '序列名称（表名）',
+    `next_id` BIGINT NOT NULL DEFAULT 1 COMMENT '下一个可分配的 ID',
+    PRIMARY KEY (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='ID 序列表';
+
+-- ============================================
+-- 表 8：每日统计汇总表（daily_stats）
+-- 由后端在患者、复诊、对话增删改时增量维护（缺少此表时这些写操作会失败）；
+-- 已有数据时在 backend 目录执行 python -m app.services.stats_service rebuild 全量重建
+-- ============================================
+DROP TABLE IF EXISTS `daily_stats`;
+CREATE TABLE `daily_stats` (
+    `stat_date` DATE NOT NULL COMMENT '统计日期',
+    `new_patients` INT NOT NULL DEFAULT 0 COMMENT '当日新增患者数',
+    `appointments` INT NOT NULL DEFAULT 0 COMMENT '复诊日期在当日的复诊数',
+    `appointments_pending` INT NOT NULL DEFAULT 0 COMMENT '其中待复诊数',
+    `appointments_completed` INT NOT NULL DEFAULT 0 COMMENT '其中已完成数',
+    `dialogues` INT NOT NULL DEFAULT 0 COMMENT '当日对话数',
+    `dialogues_handover` INT NOT NULL DEFAULT 0 COMMENT '其中人工接管数',
+    `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    PRIMARY KEY (`stat_date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='每日统计汇总表';
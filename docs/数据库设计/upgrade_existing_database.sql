@@ -0,0 +1,64 @@
+-- ============================================
+-- 已有数据库升级脚本（不删除任何表和数据，可重复执行）
+-- 用途：用旧版 create_tables.sql 建的库补齐新增的表和索引
+-- 执行日期：2026-10-18
+--
+-- 执行后在 backend 目录全量重建每日统计汇总（已有业务数据时必须执行）：
+--     python -m app.services.stats_service rebuild
+-- ============================================
+
+USE dental_clinic;
+
+-- ============================================
+-- 1. 每日统计汇总表（daily_stats）
+-- 后端在患者、复诊、对话增删时增量维护，缺少此表时这些写操作会失败
+-- ============================================
+CREATE TABLE IF NOT EXISTS `daily_stats` (
+    `stat_date` DATE NOT NULL COMMENT '统计日期',
+    `new_patients` INT NOT NULL DEFAULT 0 COMMENT '当日新增患者数',
+    `appointments` INT NOT NULL DEFAULT 0 COMMENT '复诊日期在当日的复诊数',
+    `appointments_pending` INT NOT NULL DEFAULT 0 COMMENT '其中待复诊数',
+    `appointments_completed` INT NOT NULL DEFAULT 0 COMMENT '其中已完成数',
+    `dialogues` INT NOT NULL DEFAULT 0 COMMENT '当日对话数',
+    `dialogues_handover` INT NOT NULL DEFAULT 0 COMMENT '其中人工接管数',
+    `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    PRIMARY KEY (`stat_date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='每日统计汇总表';
+
+-- ============================================
+-- 2. ID 序列表（id_sequences）
+-- 开启对话写后持久化（DIALOGUE_WRITE_BEHIND）时从此表预留对话 ID；
+-- 首次预留时序列自动推进到 MAX(dialogues.id) + 1，无需手动初始化
+-- ============================================
+CREATE TABLE IF NOT EXISTS `id_sequences` (
+    `name` VARCHAR(50) NOT NULL COMMENT '序列名称（表名）',
+    `next_id` BIGINT NOT NULL DEFAULT 1 COMMENT '下一个可分配的 ID',
+    PRIMARY KEY (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='ID 序列表';
+
+-- ============================================
+-- 3. 新增索引（MySQL 不支持 CREATE INDEX IF NOT EXISTS，先查 information_schema）
+-- ============================================
+
+-- 患者表按注册时间分页、统计
+SET @ddl = (
+    SELECT IF(COUNT(*) = 0, 'ALTER TABLE `patients` ADD KEY `idx_created_at` (`created_at`)', 'DO 0')
+    FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'patients' AND INDEX_NAME = 'idx_created_at'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- 复诊表提醒轮询
+SET @ddl = (
+    SELECT IF(COUNT(*) = 0, 'ALTER TABLE `appointments` ADD KEY `idx_reminder_due` (`reminder_sent`, `appointment_date`)', 'DO 0')
+    FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'appointments' AND INDEX_NAME = 'idx_reminder_due'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- 验证
+SHOW TABLES;
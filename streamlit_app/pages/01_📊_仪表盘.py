@@ -7,7 +7,8 @@ from utils.auth import get_token, is_logged_in
 from utils.api_client import APIClient
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import time
+from datetime import datetime
+import pandas as pd
 
 # 页面配置
 st.set_page_config(
@@ -41,19 +42,26 @@ with col_title:
 with col_refresh:
     if st.button("🔄 刷新", use_container_width=True, help="获取最新统计数据"):
         # 清除缓存数据
-        for key in ["stats_cache", "trend_cache", "dialogues_cache", "gender_cache", "status_cache"]:
-            if key in st.session_state:
-                del st.session_state[key]
+        if "dashboard_cache" in st.session_state:
+            del st.session_state.dashboard_cache
         st.rerun()
 
 st.divider()
 with st.spinner("加载数据中..."):
     try:
-        stats = client.get_stats_overview()
-        appointments_trend = client.get_appointments_trend(days=7)
-        dialogues_daily = client.get_dialogues_daily(days=7)
-        patients_gender = client.get_patients_gender()
-        appointments_status = client.get_appointments_status()
+        # 一次请求获取全部面板；数据未变化时服务端返回 304，直接使用上次的数据
+        cached = st.session_state.get("dashboard_cache")
+        result = client.get_dashboard(etag=cached["etag"] if cached else None)
+        if result["not_modified"] and cached:
+            dashboard = cached["data"]
+        else:
+            dashboard = result["data"]
+            st.session_state.dashboard_cache = {"etag": result["etag"], "data": dashboard}
+        stats = dashboard["overview"]
+        appointments_trend = dashboard["appointments_trend"]
+        dialogues_daily = dashboard["dialogues_daily"]
+        patients_gender = dashboard["patients_gender"]
+        appointments_status = dashboard["appointments_status"]
     except Exception as e:
         st.error(f"加载数据失败：{str(e)}")
         st.info("提示：后端服务需要正常运行才能显示数据")
@@ -104,178 +112,62 @@ st.divider()
 # 图表区域
 col1, col2 = st.columns(2)
 
+def _trend_frame(series, value_label):
+    """后端返回按日期升序、缺失补 0 的 7 天序列，直接转为 DataFrame"""
+    if not isinstance(series, list):
+        series = []
+    return pd.DataFrame({
+        "日期": [item.get("date", "")[:10] for item in series],
+        value_label: [item.get("count", 0) for item in series]
+    })
+
+
+def _trend_layout(fig, df, value_label):
+    fig.update_layout(
+        height=300,
+        xaxis_title="日期",
+        yaxis_title=value_label,
+        showlegend=False,
+        xaxis=dict(
+            tickangle=0,  # 日期水平显示
+            tickformat="%m/%d",  # 显示月/日
+            tickmode="array",
+            tickvals=df["日期"],
+            ticktext=[datetime.strptime(d, "%Y-%m-%d").strftime("%m/%d") for d in df["日期"]]
+        ),
+        yaxis=dict(
+            rangemode="tozero",  # y 轴从 0 开始
+            range=[0, max(1, max(df[value_label], default=0) + 1)]  # 强制 y 轴范围从 0 开始
+        ),
+        hovermode="x unified",  # 鼠标悬停显示数据
+        dragmode=False  # 禁用拖拽
+    )
+    st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False, "scrollZoom": False})
+
+
 with col1:
     st.subheader("📈 近 7 日复诊趋势")
-    if isinstance(appointments_trend, list) and len(appointments_trend) > 0:
-        # 构建 7 天数据，缺失的日期补 0
-        from datetime import datetime, timedelta
-        import pandas as pd
-        today = datetime.now().date()
-        seven_days = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(6, -1, -1)]
-        
-        # 创建数据字典
-        trend_dict = {day: 0 for day in seven_days}
-        for item in appointments_trend:
-            date = item.get("date", "")[:10]  # 只取日期部分
-            if date in trend_dict:
-                trend_dict[date] = item.get("count", 0)
-        
-        # 使用 DataFrame 显示图表
-        df = pd.DataFrame({
-            "日期": list(trend_dict.keys()),
-            "复诊数": list(trend_dict.values())
-        })
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(
-            x=df["日期"],
-            y=df["复诊数"],
-            mode="lines+markers",
-            name="复诊数",
-            line=dict(color="#1890FF", width=3)
-        ))
-        fig.update_layout(
-            height=300,
-            xaxis_title="日期",
-            yaxis_title="复诊数",
-            showlegend=False,
-            xaxis=dict(
-                tickangle=0,  # 日期水平显示
-                tickformat="%m/%d",  # 显示月/日
-                tickmode="array",
-                tickvals=df["日期"],
-                ticktext=[datetime.strptime(d, "%Y-%m-%d").strftime("%m/%d") for d in df["日期"]]
-            ),
-            yaxis=dict(
-                rangemode="tozero",  # y 轴从 0 开始
-                range=[0, max(1, max(df["复诊数"]) + 1)]  # 强制 y 轴范围从 0 开始
-            ),
-            hovermode="x unified",  # 鼠标悬停显示数据
-            dragmode=False  # 禁用拖拽
-        )
-        st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False, "scrollZoom": False})
-    else:
-        # 没有数据时显示空白的 7 天图表
-        from datetime import datetime, timedelta
-        import pandas as pd
-        today = datetime.now().date()
-        seven_days = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(6, -1, -1)]
-        empty_dict = {day: 0 for day in seven_days}
-        df = pd.DataFrame({
-            "日期": list(empty_dict.keys()),
-            "复诊数": list(empty_dict.values())
-        })
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(
-            x=df["日期"],
-            y=df["复诊数"],
-            mode="lines+markers",
-            line=dict(color="#1890FF", width=3)
-        ))
-        fig.update_layout(
-            height=300,
-            xaxis_title="日期",
-            yaxis_title="复诊数",
-            showlegend=False,
-            xaxis=dict(
-                tickangle=0,
-                tickformat="%m/%d",
-                tickmode="array",
-                tickvals=df["日期"],
-                ticktext=[datetime.strptime(d, "%Y-%m-%d").strftime("%m/%d") for d in df["日期"]]
-            ),
-            yaxis=dict(
-                rangemode="tozero",
-                range=[0, 1]
-            ),
-            hovermode="x unified",
-            dragmode=False
-        )
-        st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False, "scrollZoom": False})
+    df = _trend_frame(appointments_trend, "复诊数")
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=df["日期"],
+        y=df["复诊数"],
+        mode="lines+markers",
+        name="复诊数",
+        line=dict(color="#1890FF", width=3)
+    ))
+    _trend_layout(fig, df, "复诊数")
 
 with col2:
     st.subheader("💬 近 7 日对话量")
-    if isinstance(dialogues_daily, list) and len(dialogues_daily) > 0:
-        # 构建 7 天数据，缺失的日期补 0
-        from datetime import datetime, timedelta
-        import pandas as pd
-        today = datetime.now().date()
-        seven_days = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(6, -1, -1)]
-        
-        # 创建数据字典
-        dialogue_dict = {day: 0 for day in seven_days}
-        for item in dialogues_daily:
-            date = item.get("date", "")[:10]  # 只取日期部分
-            if date in dialogue_dict:
-                dialogue_dict[date] = item.get("count", 0)
-        
-        # 使用 DataFrame 显示图表
-        df = pd.DataFrame({
-            "日期": list(dialogue_dict.keys()),
-            "对话数": list(dialogue_dict.values())
-        })
-        fig = go.Figure()
-        fig.add_trace(go.Bar(
-            x=df["日期"],
-            y=df["对话数"],
-            marker_color="#722ED1"
-        ))
-        fig.update_layout(
-            height=300,
-            xaxis_title="日期",
-            yaxis_title="对话数",
-            showlegend=False,
-            xaxis=dict(
-                tickangle=0,  # 日期水平显示
-                tickformat="%m/%d",  # 显示月/日
-                tickmode="array",
-                tickvals=df["日期"],
-                ticktext=[datetime.strptime(d, "%Y-%m-%d").strftime("%m/%d") for d in df["日期"]]
-            ),
-            yaxis=dict(
-                rangemode="tozero",  # y 轴从 0 开始
-                range=[0, max(1, max(df["对话数"]) + 1)]  # 强制 y 轴范围从 0 开始
-            ),
-            hovermode="x unified",  # 鼠标悬停显示数据
-            dragmode=False  # 禁用拖拽
-        )
-        st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False, "scrollZoom": False})
-    else:
-        # 没有数据时显示空白的 7 天图表
-        from datetime import datetime, timedelta
-        import pandas as pd
-        today = datetime.now().date()
-        seven_days = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(6, -1, -1)]
-        empty_dict = {day: 0 for day in seven_days}
-        df = pd.DataFrame({
-            "日期": list(empty_dict.keys()),
-            "对话数": list(empty_dict.values())
-        })
-        fig = go.Figure()
-        fig.add_trace(go.Bar(
-            x=df["日期"],
-            y=df["对话数"],
-            marker_color="#722ED1"
-        ))
-        fig.update_layout(
-            height=300,
-            xaxis_title="日期",
-            yaxis_title="对话数",
-            showlegend=False,
-            xaxis=dict(
-                tickangle=0,
-                tickformat="%m/%d",
-                tickmode="array",
-                tickvals=df["日期"],
-                ticktext=[datetime.strptime(d, "%Y-%m-%d").strftime("%m/%d") for d in df["日期"]]
-            ),
-            yaxis=dict(
-                rangemode="tozero",
-                range=[0, 1]
-            ),
-            hovermode="x unified",
-            dragmode=False
-        )
-        st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False, "scrollZoom": False})
+    df = _trend_frame(dialogues_daily, "对话数")
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=df["日期"],
+        y=df["对话数"],
+        marker_color="#722ED1"
+    ))
+    _trend_layout(fig, df, "对话数")
 
 # 第二行图表
 col1, col2 = st.columns(2)
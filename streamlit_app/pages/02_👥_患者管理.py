@@ -5,6 +5,7 @@
 import streamlit as st
 from utils.auth import get_token, is_logged_in
 from utils.api_client import APIClient
+from utils.paging import fetch_page, clear_page_cache, current_cursor, render_pager
 import pandas as pd
 
 # 页面配置
@@ -39,8 +40,7 @@ with col_title:
 with col_refresh:
     if st.button("🔄 刷新", use_container_width=True, help="获取最新患者数据"):
         # 清除缓存数据
-        if "patients_cache" in st.session_state:
-            del st.session_state.patients_cache
+        clear_page_cache()
         if "search_name" in st.session_state:
             st.session_state.search_name = ""
         if "search_phone" in st.session_state:
@@ -84,32 +84,24 @@ with st.sidebar:
             st.session_state.search_phone = ""
             st.rerun()
 
-# 获取患者列表
+# 获取患者列表（筛选、排序、分页均在服务端完成，每次只请求一页）
+filters = (
+    ("name", st.session_state.search_name or None),
+    ("phone", st.session_state.search_phone or None),
+)
+cursor = current_cursor("patients", filters)
 with st.spinner("加载患者列表..."):
     try:
-        # 直接获取所有患者，不分页
-        result = client.get_patients(page=1, page_size=1000)
-        # 后端返回的是列表
-        if isinstance(result, list):
-            all_patients = result
-        else:
-            all_patients = result.get("items", []) if isinstance(result, dict) else []
-        
-        # 保存到 session_state 用于刷新
-        st.session_state.patients_cache = all_patients
+        page = fetch_page(token, "patients", filters, cursor)
     except Exception as e:
         st.error(f"加载失败：{str(e)}")
-        all_patients = st.session_state.get("patients_cache", [])
+        page = {"items": [], "next_cursor": None, "total": None}
+patients = page["items"]
 
-# 应用筛选条件
-patients = all_patients
 if st.session_state.search_name:
-    patients = [p for p in patients if st.session_state.search_name.lower() in (p.get("name") or "").lower()]
-    st.info(f"🔍 按姓名筛选：'{st.session_state.search_name}'，找到 {len(patients)} 个患者")
-
+    st.info(f"🔍 按姓名筛选：'{st.session_state.search_name}'")
 if st.session_state.search_phone:
-    patients = [p for p in patients if st.session_state.search_phone in (p.get("phone") or "")]
-    st.info(f"🔍 按手机号筛选：'{st.session_state.search_phone}'，找到 {len(patients)} 个患者")
+    st.info(f"🔍 按手机号前缀筛选：'{st.session_state.search_phone}'")
 
 # 操作按钮
 col1, col2 = st.columns([1, 4])
@@ -150,6 +142,7 @@ if st.session_state.get("show_add_form"):
                     "allergy_history": allergy_history if allergy_history else "无"
                 }
                 client.create_patient(data)
+                clear_page_cache()
                 st.success("添加成功！")
                 st.session_state.show_add_form = False
                 st.rerun()
@@ -178,6 +171,7 @@ if patients:
         },
         hide_index=True
     )
+    render_pager("patients", page)
     
     # 操作区域
     st.subheader("🔧 操作")
@@ -245,6 +239,7 @@ if patients:
                         if st.button("✅ 确认删除", key=f"confirm_{selected_id}", type="primary", use_container_width=True):
                             try:
                                 client.delete_patient(selected_id)
+                                clear_page_cache()
                                 st.success("删除成功！")
                                 st.session_state.deleting_patient_id = None
                                 st.rerun()
@@ -303,12 +298,15 @@ if patients:
                         "allergy_history": allergy_history if allergy_history else "无"
                     }
                     client.update_patient(patient_id, data)
+                    clear_page_cache()
                     st.success("更新成功！")
                     st.session_state.edit_patient_id = None
                     st.rerun()
                 except Exception as e:
                     st.error(f"更新失败：{str(e)}")
 
+elif st.session_state.search_name or st.session_state.search_phone:
+    st.info("📭 没有符合条件的患者")
 else:
     # 患者列表为空时显示提示
     st.info("📭 暂无患者数据，点击上方'新增患者'按钮添加")
@@ -5,6 +5,7 @@
 import streamlit as st
 from utils.auth import get_token, is_logged_in
 from utils.api_client import APIClient
+from utils.paging import fetch_page, clear_page_cache, current_cursor, render_pager
 import pandas as pd
 from datetime import datetime
 
@@ -40,39 +41,58 @@ with col_title:
 with col_refresh:
     if st.button("🔄 刷新", use_container_width=True, help="获取最新复诊数据"):
         # 清除缓存数据
-        if "appointments_cache" in st.session_state:
-            del st.session_state.appointments_cache
+        clear_page_cache()
         st.rerun()
 
 st.divider()
 
-# 获取患者列表（用于选择）
-with st.spinner("加载患者列表..."):
-    try:
-        patients_result = client.get_patients(page=1, page_size=100)
-        if isinstance(patients_result, list):
-            patients = patients_result
-        else:
-            patients = patients_result.get("items", []) if isinstance(patients_result, dict) else []
-        patient_options = {f"{p['name']} (ID: {p['id']})": p["id"] for p in patients}
-    except Exception as e:
-        st.error(f"加载患者失败：{str(e)}")
-        patient_options = {}
+# 状态翻译
+status_map = {
+    "pending": "📅 待复诊",
+    "completed": "✅ 已完成",
+    "cancelled": "❌ 已取消",
+    "no_show": "⚠️ 未到场"
+}
+
+# 侧边栏筛选（在服务端筛选）
+with st.sidebar:
+    st.subheader("🔍 筛选条件")
+    status_filter = st.selectbox(
+        "复诊状态",
+        options=[None, "pending", "completed", "cancelled", "no_show"],
+        format_func=lambda x: "全部" if x is None else status_map.get(x, x)
+    )
+    upcoming_only = st.checkbox("只看今天及以后", value=False)
+    sort_order = st.radio(
+        "按复诊日期排序", options=["desc", "asc"],
+        format_func=lambda x: "由近到远（倒序）" if x == "desc" else "由远到近（正序）",
+        horizontal=True
+    )
 
-# 获取复诊列表
+# 获取复诊列表（每次只请求一页）
+filters = (
+    ("status", status_filter),
+    ("start_date", datetime.combine(datetime.today(), datetime.min.time()).isoformat() if upcoming_only else None),
+    ("order", sort_order),
+)
+cursor = current_cursor("appointments", filters)
 with st.spinner("加载复诊计划..."):
     try:
-        appointments_result = client.get_appointments(page=1, page_size=1000)
-        if isinstance(appointments_result, list):
-            appointments = appointments_result
-        else:
-            appointments = appointments_result.get("items", []) if isinstance(appointments_result, dict) else []
-        
-        # 保存到 session_state 用于刷新
-        st.session_state.appointments_cache = appointments
+        page = fetch_page(token, "appointments", filters, cursor)
     except Exception as e:
         st.error(f"加载复诊失败：{str(e)}")
-        appointments = st.session_state.get("appointments_cache", [])
+        page = {"items": [], "next_cursor": None, "total": None}
+appointments = page["items"]
+
+# 只获取本页涉及的患者姓名
+patient_id_to_name = {}
+page_patient_ids = tuple(sorted({a["patient_id"] for a in appointments}))
+if page_patient_ids:
+    try:
+        patients_page = fetch_page(token, "patients", (("ids", page_patient_ids),), None, len(page_patient_ids))
+        patient_id_to_name = {p["id"]: p["name"] for p in patients_page["items"]}
+    except Exception as e:
+        st.error(f"加载患者失败：{str(e)}")
 
 # 操作按钮
 col1, col2 = st.columns([1, 4])
@@ -82,6 +102,14 @@ with col1:
 
 # 创建复诊表单
 if st.session_state.get("show_add_appointment"):
+    patient_keyword = st.text_input("搜索患者（姓名或手机号前缀）", key="appointment_patient_keyword")
+    try:
+        matched = fetch_page(token, "patients", (("q", patient_keyword or None),), None)["items"]
+    except Exception as e:
+        st.error(f"加载患者失败：{str(e)}")
+        matched = []
+    patient_options = {f"{p['name']} (ID: {p['id']})": p["id"] for p in matched}
+
     with st.form("add_appointment_form"):
         st.subheader("➕ 创建复诊计划")
         
@@ -102,7 +130,9 @@ if st.session_state.get("show_add_appointment"):
                 st.session_state.show_add_appointment = False
                 st.rerun()
         
-        if submit:
+        if submit and not selected_patient:
+            st.error("请先搜索并选择患者")
+        elif submit:
             try:
                 # 合并日期和时间
                 appointment_datetime = datetime.combine(appointment_date, appointment_time)
@@ -114,6 +144,7 @@ if st.session_state.get("show_add_appointment"):
                     "notes": notes
                 }
                 client.create_appointment(data)
+                clear_page_cache()
                 st.success("创建成功！")
                 st.session_state.show_add_appointment = False
                 st.rerun()
@@ -124,9 +155,6 @@ if st.session_state.get("show_add_appointment"):
 if appointments:
     st.subheader("📋 复诊计划列表")
 
-    # 创建患者 ID 到姓名的映射
-    patient_id_to_name = {p["id"]: p["name"] for p in patients}
-
     # 转换为 DataFrame
     df = pd.DataFrame(appointments)
 
@@ -149,6 +177,7 @@ if appointments:
         },
         hide_index=True
     )
+    render_pager("appointments", page)
 
     # 操作区域
     st.subheader("🔧 操作")
@@ -192,14 +221,6 @@ if appointments:
                     "updated_at": "最后更新时间"
                 }
                 
-                # 状态翻译
-                status_map = {
-                    "pending": "📅 待复诊",
-                    "completed": "✅ 已完成",
-                    "cancelled": "❌ 已取消",
-                    "no_show": "⚠️ 未到场"
-                }
-                
                 for key, value in appointment.items():
                     cn_name = field_names.get(key, key)
                     # 特殊处理状态字段
@@ -223,6 +244,7 @@ if appointments:
                 if st.button("📅 待复诊", use_container_width=True, help="设置为待复诊状态"):
                     try:
                         client.update_appointment_status(selected_id, "pending")
+                        clear_page_cache()
                         st.success("更新成功！")
                         st.rerun()
                     except Exception as e:
@@ -232,6 +254,7 @@ if appointments:
                 if st.button("✅ 已完成", use_container_width=True, help="设置为已完成状态"):
                     try:
                         client.update_appointment_status(selected_id, "completed")
+                        clear_page_cache()
                         st.success("更新成功！")
                         st.rerun()
                     except Exception as e:
@@ -241,6 +264,7 @@ if appointments:
                 if st.button("❌ 已取消", use_container_width=True, help="设置为已取消状态"):
                     try:
                         client.update_appointment_status(selected_id, "cancelled")
+                        clear_page_cache()
                         st.success("更新成功！")
                         st.rerun()
                     except Exception as e:
@@ -255,6 +279,7 @@ if appointments:
                     if st.button("✅ 确认删除", key=f"confirm_{selected_id}", type="primary", use_container_width=True):
                         try:
                             client.delete_appointment(selected_id)
+                            clear_page_cache()
                             st.success("删除成功！")
                             st.session_state.deleting_appointment_id = None
                             st.rerun()
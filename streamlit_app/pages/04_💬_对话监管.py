@@ -5,6 +5,7 @@
 import streamlit as st
 from utils.auth import require_login, get_token
 from utils.api_client import APIClient
+from utils.paging import fetch_page, clear_page_cache, current_cursor, render_pager
 from datetime import datetime
 
 # 页面配置
@@ -34,79 +35,77 @@ with col_title:
 
 with col_refresh:
     if st.button("🔄 刷新", use_container_width=True, help="获取最新对话数据"):
+        clear_page_cache()
         st.rerun()
 
 st.divider()
 
-# 侧边栏筛选
+# 侧边栏筛选（在服务端筛选）
 with st.sidebar:
     st.subheader("🔍 筛选条件")
 
-    # 获取患者列表
+    # 按关键字搜索患者，只加载匹配的一页
+    patient_keyword = st.text_input("搜索患者（姓名或手机号前缀）")
+    patient_options = {"全部": None}
     try:
-        patients_result = client.get_patients(page=1, page_size=1000)
-        if isinstance(patients_result, list):
-            patients = patients_result
-        else:
-            patients = patients_result.get("items", []) if isinstance(patients_result, dict) else []
-        patient_options = {"全部": None}
-        patient_options.update({f"{p['name']} (ID: {p['id']})": p["id"] for p in patients})
+        matched = fetch_page(token, "patients", (("q", patient_keyword or None),), None)["items"]
+        patient_options.update({f"{p['name']} (ID: {p['id']})": p["id"] for p in matched})
     except Exception:
-        patient_options = {"全部": None}
+        pass
 
     selected_patient = st.selectbox("选择患者", options=list(patient_options.keys()))
+    handover_only = st.checkbox("只看已人工接管", value=False)
+    message_keyword = st.text_input("消息关键字")
 
-    if st.button("应用筛选", use_container_width=True):
-        st.rerun()
-
-# 获取对话列表 - 加载所有数据（按时间正序排列）
+# 获取对话列表（按时间倒序，每次只请求一页）
 patient_id = patient_options.get(selected_patient)
+filters = (
+    ("patient_id", patient_id),
+    ("is_handover", True if handover_only else None),
+    ("q", message_keyword or None),
+)
+cursor = current_cursor("dialogues", filters)
 
 with st.spinner("加载对话记录..."):
     try:
-        # 获取所有对话（page_size=1000）
-        result = client.get_dialogues(page=1, page_size=1000, patient_id=patient_id)
-        # 后端返回的是列表
-        if isinstance(result, list):
-            dialogues = result
-        else:
-            dialogues = result.get("items", []) if isinstance(result, dict) else []
-        
-        # 按时间正序排列（从旧到新）
-        dialogues.sort(key=lambda x: x.get("created_at", ""))
-        
+        page = fetch_page(token, "dialogues", filters, cursor)
+        # 待人工干预数只需要总数
+        handover_total = fetch_page(
+            token, "dialogues", (("patient_id", patient_id), ("is_handover", True)), None, 1
+        )["total"]
     except Exception as e:
         st.error(f"加载失败：{str(e)}")
         st.info("提示：如果这是第一次使用，可能还没有对话记录")
-        dialogues = []
+        page = {"items": [], "next_cursor": None, "total": None}
+        handover_total = 0
+
+dialogues = page["items"]
+total_dialogues = st.session_state["dialogues_paging"]["total"] if page["total"] is None else page["total"]
 
 # 统计信息
 col1, col2, col3 = st.columns(3)
 
 with col1:
-    st.metric("总对话数", len(dialogues))
+    st.metric("总对话数", total_dialogues or 0)
 
 with col2:
     # 统计待人工干预（已标记但没有处理）
-    pending_count = sum(1 for d in dialogues if d.get("is_handover"))
-    st.metric("待人工干预", pending_count)
+    st.metric("待人工干预", handover_total or 0)
 
 with col3:
-    if dialogues:
-        unique_sessions = len(set(d.get("session_id") for d in dialogues))
-        st.metric("会话数", unique_sessions)
-    else:
-        st.metric("会话数", 0)
+    # 本页涉及的会话数
+    st.metric("本页会话数", len(set(d.get("session_id") for d in dialogues)))
 
 st.divider()
 
 # 对话列表 - 按会话分组显示
 if dialogues:
-    st.subheader(f"📋 对话记录 ({len(dialogues)} 条)")
+    st.subheader(f"📋 对话记录 (本页 {len(dialogues)} 条)")
+    render_pager("dialogues", page)
 
-    # 按会话分组
+    # 按会话分组（本页按时间倒序，组内改为从旧到新显示）
     sessions = {}
-    for dialogue in dialogues:
+    for dialogue in reversed(dialogues):
         session_id = dialogue.get("session_id", "unknown")
         if session_id not in sessions:
             sessions[session_id] = []
@@ -151,56 +150,44 @@ if dialogues:
                 if has_handover:
                     # 已接管，显示取消按钮
                     if st.button("✅ 取消接管", key=f"cancel_session_{session_id}", type="primary", use_container_width=True):
-                        # 取消该会话所有对话的接管状态
-                        for d in session_dialogues:
+                        # 取消该会话所有对话的接管状态（包括不在本页的记录）
+                        for d in client.get_dialogue_session(session_id):
                             try:
                                 client.handover_dialogue(d['id'], "取消人工接管")
                             except Exception:
                                 pass
+                        clear_page_cache()
                         st.success("已取消接管")
                         st.rerun()
                 else:
                     # 未接管，显示接管按钮
                     if st.button("👤 接管此会话", key=f"handover_session_{session_id}", use_container_width=True):
                         st.session_state.handover_session_id = session_id
-                        st.session_state.handover_session_dialogues = session_dialogues
                         st.rerun()
             
             with col2:
                 # 删除按钮 - 设置 session_state 并刷新
                 if st.button("🗑️ 删除此会话", key=f"delete_btn_{session_id}", type="secondary", use_container_width=True):
                     st.session_state.delete_session_id = session_id
-                    st.session_state.delete_session_dialogues = session_dialogues
                     st.rerun()
             
             # 如果正在删除，显示确认表单（在操作按钮下方）
             if is_deleting:
                 st.divider()
-                st.warning(f"⚠️ 确定要删除会话 **{session_id[:8]}...** 共 **{len(session_dialogues)}** 条对话吗？此操作不可恢复！")
+                st.warning(f"⚠️ 确定要删除会话 **{session_id[:8]}...** 的全部对话吗？此操作不可恢复！")
                 
                 col_del1, col_del2 = st.columns(2)
                 with col_del1:
                     if st.button("✅ 确认删除", key=f"confirm_delete_{session_id}", type="primary", use_container_width=True):
-                        success_count = 0
-                        error_count = 0
-                        
-                        # 删除该会话所有对话
-                        for d in session_dialogues:
-                            dialogue_id = d.get('id')
-                            try:
-                                result = client._request("DELETE", f"{client.BASE_URL}/dialogues/{dialogue_id}")
-                                success_count += 1
-                            except Exception as e:
-                                error_count += 1
-                                # 忽略 204 响应的解析错误
-                                if "Expecting value" not in str(e):
-                                    st.error(f"删除对话 {dialogue_id} 失败：{str(e)}")
-                        
-                        if success_count > 0:
-                            st.success(f"✅ 成功删除 {success_count} 条对话")
+                        # 一次请求删除整个会话（包括不在本页的记录）
+                        try:
+                            client.delete_dialogue_session(session_id)
+                            clear_page_cache()
+                            st.success("✅ 会话已删除")
+                        except Exception as e:
+                            st.error(f"删除会话失败：{str(e)}")
                         
                         st.session_state.delete_session_id = None
-                        st.session_state.delete_session_dialogues = None
                         st.rerun()
                 
                 with col_del2:
@@ -214,7 +201,7 @@ if dialogues:
 
         with st.form(f"handover_form_session_{session_id}"):
             st.subheader("👤 接管会话")
-            st.info(f"将接管会话 {session_id[:8]}... 共 {len(st.session_state.handover_session_dialogues)} 条对话")
+            st.info(f"将接管会话 {session_id[:8]}... 的全部对话")
             reason = st.text_area("接管原因", placeholder="说明为什么需要人工接管")
 
             col1, col2 = st.columns(2)
@@ -223,20 +210,19 @@ if dialogues:
             with col2:
                 if st.form_submit_button("取消", use_container_width=True):
                     st.session_state.handover_session_id = None
-                    st.session_state.handover_session_dialogues = None
                     st.rerun()
 
             if submit:
                 try:
-                    # 标记该会话所有对话为接管状态
-                    for d in st.session_state.handover_session_dialogues:
+                    # 标记该会话所有对话为接管状态（包括不在本页的记录）
+                    for d in client.get_dialogue_session(session_id):
                         try:
                             client.handover_dialogue(d['id'], reason)
                         except Exception:
                             pass
+                    clear_page_cache()
                     st.success("接管成功！")
                     st.session_state.handover_session_id = None
-                    st.session_state.handover_session_dialogues = None
                     st.rerun()
                 except Exception as e:
                     st.error(f"接管失败：{str(e)}")
@@ -2,12 +2,44 @@
 API 客户端模块
 封装与 FastAPI 后端的通信
 """
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Optional, Dict, Any, List
 
 # 后端 API 地址
 BASE_URL = "http://localhost:8000/api"
 
+# 列表接口在响应头中返回下一页游标和筛选后的总数
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+# 连接池大小
+POOL_MAXSIZE = 16
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    进程内共享的 HTTP 会话
+
+    Streamlit 每次交互都会重新运行页面并创建新的 APIClient，共享会话让 TCP 连接在多次运行之间保持复用；
+    认证头随每个请求单独传递，不保存在会话上，不同用户之间互不影响
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+                _session = session
+    return _session
+
 
 class APIClient:
     """FastAPI 后端 API 客户端"""
@@ -16,17 +48,42 @@ class APIClient:
     
     def __init__(self, token: Optional[str] = None):
         self.token = token
+        self.session = get_http_session()
         self.headers = {}
         if token:
             self.headers["Authorization"] = f"Bearer {self.token}"
 
     def _request(self, method: str, url: str, **kwargs) -> Any:
         """通用请求方法"""
+        response = self._send(method, url, **kwargs)
+        # 204 No Content 没有返回值
+        if response.status_code == 204:
+            return None
+        return response.json()
+
+    def _request_page(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        请求列表接口的一页
+
+        Returns:
+            {"items": 本页记录, "next_cursor": 下一页游标（没有则为 None）, "total": 总数（未请求则为 None）}
+        """
+        params = {key: value for key, value in params.items() if value is not None and value != ""}
+        response = self._send("GET", url, params=params)
+        total = response.headers.get(TOTAL_COUNT_HEADER)
+        return {
+            "items": response.json(),
+            "next_cursor": response.headers.get(NEXT_CURSOR_HEADER),
+            "total": int(total) if total is not None else None
+        }
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        """发送请求并把错误状态码转换为异常"""
         kwargs["headers"] = kwargs.get("headers", {})
         kwargs["headers"].update(self.headers)
 
         try:
-            response = requests.request(method, url, **kwargs)
+            response = self.session.request(method, url, **kwargs)
             
             # 处理常见错误状态码
             if response.status_code == 401:
@@ -47,11 +104,7 @@ class APIClient:
                 except:
                     error_msg = f"请求失败 ({response.status_code})"
                 raise Exception(error_msg)
-            
-            # 204 No Content 没有返回值
-            if response.status_code == 204:
-                return None
-            return response.json()
+            return response
         except requests.exceptions.RequestException as e:
             raise Exception(f"网络请求失败：{str(e)}")
 
@@ -79,6 +132,17 @@ class APIClient:
         params = {"skip": skip, "limit": page_size}
         return self._request("GET", f"{BASE_URL}/patients/", params=params)
 
+    def list_patients(self, cursor: Optional[str] = None, page_size: int = 20, q: Optional[str] = None,
+                      name: Optional[str] = None, phone: Optional[str] = None,
+                      ids: Optional[List[int]] = None, order: str = "desc",
+                      include_total: bool = False) -> Dict[str, Any]:
+        """按筛选条件获取一页患者（服务端筛选、排序）"""
+        params = {
+            "limit": page_size, "cursor": cursor, "q": q, "name": name, "phone": phone,
+            "id": ids, "order": order, "include_total": include_total or None
+        }
+        return self._request_page(f"{BASE_URL}/patients/", params)
+
     def get_patient(self, patient_id: int) -> Dict[str, Any]:
         """获取患者详情"""
         return self._request("GET", f"{BASE_URL}/patients/{patient_id}")
@@ -100,13 +164,23 @@ class APIClient:
     def get_appointments(self, page: int = 1, page_size: int = 20,
                          status: Optional[str] = None) -> Dict[str, Any]:
         """获取复诊计划列表"""
-        # 后端使用 skip/limit 参数
-        skip = (page - 1) * page_size
-        params = {"skip": skip, "limit": page_size}
+        params = {"page": page, "page_size": page_size}
         if status:
             params["status"] = status
         return self._request("GET", f"{BASE_URL}/appointments/", params=params)
 
+    def list_appointments(self, cursor: Optional[str] = None, page_size: int = 20,
+                          status: Optional[str] = None, patient_id: Optional[int] = None,
+                          start_date: Optional[str] = None, end_date: Optional[str] = None,
+                          order: str = "desc", include_total: bool = False) -> Dict[str, Any]:
+        """按筛选条件获取一页复诊计划（服务端筛选、排序）"""
+        params = {
+            "page_size": page_size, "cursor": cursor, "status": status, "patient_id": patient_id,
+            "start_date": start_date, "end_date": end_date, "order": order,
+            "include_total": include_total or None
+        }
+        return self._request_page(f"{BASE_URL}/appointments/", params)
+
     def get_appointment(self, appointment_id: int) -> Dict[str, Any]:
         """获取复诊详情"""
         return self._request("GET", f"{BASE_URL}/appointments/{appointment_id}")
@@ -115,6 +189,15 @@ class APIClient:
         """创建复诊计划"""
         return self._request("POST", f"{BASE_URL}/appointments/", json=data)
 
+    def create_followup_plans(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        按治疗类型批量生成复诊计划
+
+        Args:
+            items: [{"patient_id", "treatment_type", "treatment_date", "notes"}]
+        """
+        return self._request("POST", f"{BASE_URL}/appointments/bulk-followup", json={"items": items})
+
     def update_appointment(self, appointment_id: int, data: Dict[str, Any]) -> Dict[str, Any]:
         """更新复诊计划"""
         return self._request("PUT", f"{BASE_URL}/appointments/{appointment_id}", json=data)
@@ -140,10 +223,25 @@ class APIClient:
             params["patient_id"] = patient_id
         return self._request("GET", f"{BASE_URL}/dialogues/", params=params)
 
+    def list_dialogues(self, cursor: Optional[str] = None, page_size: int = 20,
+                       patient_id: Optional[int] = None, session_id: Optional[str] = None,
+                       is_handover: Optional[bool] = None, q: Optional[str] = None,
+                       order: str = "desc", include_total: bool = False) -> Dict[str, Any]:
+        """按筛选条件获取一页对话记录（服务端筛选、排序）"""
+        params = {
+            "limit": page_size, "cursor": cursor, "patient_id": patient_id, "session_id": session_id,
+            "is_handover": is_handover, "q": q, "order": order, "include_total": include_total or None
+        }
+        return self._request_page(f"{BASE_URL}/dialogues/", params)
+
     def get_dialogue_session(self, session_id: str) -> Dict[str, Any]:
         """获取会话历史"""
         return self._request("GET", f"{BASE_URL}/dialogues/session/{session_id}")
 
+    def delete_dialogue_session(self, session_id: str) -> None:
+        """删除会话的所有对话记录"""
+        return self._request("DELETE", f"{BASE_URL}/dialogues/session/{session_id}")
+
     def handover_dialogue(self, dialogue_id: int, reason: str) -> Dict[str, Any]:
         """标记人工接管"""
         data = {"reason": reason}
@@ -178,7 +276,7 @@ class APIClient:
     def delete_knowledge(self, knowledge_id: int) -> Optional[Dict[str, Any]]:
         """删除知识条目"""
         try:
-            response = requests.request(
+            response = self.session.request(
                 "DELETE",
                 f"{BASE_URL}/knowledge/{knowledge_id}",
                 headers=self.headers
@@ -199,14 +297,30 @@ class APIClient:
         """获取概览统计"""
         return self._request("GET", f"{BASE_URL}/stats/overview")
 
-    def get_appointments_trend(self, days: int = 7) -> Dict[str, Any]:
-        """获取复诊趋势"""
-        params = {"days": days}
+    def get_dashboard(self, etag: Optional[str] = None) -> Dict[str, Any]:
+        """
+        获取仪表盘全部数据（条件请求）
+
+        Args:
+            etag: 上次响应的 ETag；数据未变化时服务端返回 304
+
+        Returns:
+            {"data": 仪表盘数据（304 时为 None）, "etag": ETag, "not_modified": 是否未变化}
+        """
+        headers = {"If-None-Match": etag} if etag else {}
+        response = self._send("GET", f"{BASE_URL}/stats/dashboard", headers=headers)
+        if response.status_code == 304:
+            return {"data": None, "etag": response.headers.get("ETag", etag), "not_modified": True}
+        return {"data": response.json(), "etag": response.headers.get("ETag"), "not_modified": False}
+
+    def get_appointments_trend(self, days: int = 7, granularity: str = "day") -> List[Dict[str, Any]]:
+        """获取复诊趋势（按时间升序、缺失补 0）"""
+        params = {"days": days, "granularity": granularity}
         return self._request("GET", f"{BASE_URL}/stats/appointments/trend", params=params)
 
-    def get_dialogues_daily(self, days: int = 7) -> Dict[str, Any]:
-        """获取对话统计"""
-        params = {"days": days}
+    def get_dialogues_daily(self, days: int = 7, granularity: str = "day") -> List[Dict[str, Any]]:
+        """获取对话统计（按时间升序、缺失补 0）"""
+        params = {"days": days, "granularity": granularity}
         return self._request("GET", f"{BASE_URL}/stats/dialogues/daily", params=params)
 
     def get_patients_gender(self) -> List[Dict[str, Any]]:
@@ -0,0 +1,74 @@
+"""
+分页工具模块
+列表页按筛选条件和游标缓存每一页，每次交互只请求一页数据
+"""
+import streamlit as st
+from typing import Optional, Dict, Any, Tuple
+from utils.api_client import APIClient
+
+# 列表页缓存时间（秒）；新增、修改、删除后调用 clear_page_cache() 立即失效
+PAGE_CACHE_TTL = 30
+
+
+@st.cache_data(ttl=PAGE_CACHE_TTL, show_spinner=False)
+def fetch_page(token: str, resource: str, filters: Tuple[Tuple[str, Any], ...],
+               cursor: Optional[str], page_size: int = 20) -> Dict[str, Any]:
+    """
+    获取一页列表数据（按 token、资源、筛选条件、游标缓存）
+
+    Args:
+        resource: patients / appointments / dialogues
+        filters: 筛选条件，(参数名, 值) 元组，保证可哈希
+
+    Returns:
+        {"items", "next_cursor", "total"}，total 只在第一页返回
+    """
+    client = APIClient(token=token)
+    list_methods = {
+        "patients": client.list_patients,
+        "appointments": client.list_appointments,
+        "dialogues": client.list_dialogues,
+    }
+    return list_methods[resource](
+        cursor=cursor, page_size=page_size, include_total=cursor is None, **dict(filters)
+    )
+
+
+def clear_page_cache():
+    """数据变更后清除列表缓存"""
+    fetch_page.clear()
+
+
+def current_cursor(key: str, filters: Tuple[Tuple[str, Any], ...]) -> Optional[str]:
+    """
+    当前页的游标
+
+    session_state 中保存已经翻过的页的游标栈，筛选条件变化时回到第一页
+    """
+    state = st.session_state.get(f"{key}_paging")
+    if state is None or state["filters"] != filters:
+        state = {"filters": filters, "cursors": [None], "total": None}
+        st.session_state[f"{key}_paging"] = state
+    return state["cursors"][-1]
+
+
+def render_pager(key: str, page: Dict[str, Any]):
+    """显示页码与“上一页 / 下一页”按钮"""
+    state = st.session_state[f"{key}_paging"]
+    if page.get("total") is not None:
+        state["total"] = page["total"]
+
+    col_prev, col_info, col_next = st.columns([1, 3, 1])
+    with col_prev:
+        if st.button("⬅️ 上一页", key=f"{key}_prev", disabled=len(state["cursors"]) <= 1,
+                     use_container_width=True):
+            state["cursors"].pop()
+            st.rerun()
+    with col_info:
+        total = f"，共 {state['total']} 条" if state["total"] is not None else ""
+        st.caption(f"第 {len(state['cursors'])} 页{total}")
+    with col_next:
+        if st.button("下一页 ➡️", key=f"{key}_next", disabled=not page.get("next_cursor"),
+                     use_container_width=True):
+            state["cursors"].append(page["next_cursor"])
+            st.rerun()